@@ -1,48 +1,95 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from datetime import datetime
+from time import perf_counter
 
 from pydantic_ai import Agent
-from pydantic_ai.messages import ModelMessage
-import tiktoken
 
 from config import load_config
 from utils.template_loader import render_template
+from services.context_packer import pack_contexts
+from services.openai_client import chat_model
+from services.usage import record_agent_usage
+from utils.metrics import counter, histogram
 from agents.models.chat import EmailAnswer, IntentRoute
+from agents.history import HistoryTrimmer, history_to_messages
 
 
 config = load_config()
 
+ANSWER_CASCADE = counter("answer_cascade_total", "Cascade answers by outcome (accepted or escalated)", ["outcome"])
+ANSWER_ESCALATIONS = counter("answer_cascade_escalations_total", "Small-model answers escalated, by reason", ["reason"])
+ANSWER_TIER_SECONDS = histogram("answer_tier_seconds", "Answer generation latency per cascade tier", ["tier"])
 
-def trim_conversation_history(messages: List[ModelMessage]) -> List[ModelMessage]:
+CONFIDENCE_LEVELS = {"low": 0, "medium": 1, "high": 2}
+CITED_ID_RE = re.compile(r"\[message_id=([^\s|\]]+)")
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9'@.\-]*[a-z0-9]")
+# Words any answer uses regardless of the emails; they say nothing about grounding
+ANSWER_STOPWORDS = frozenset(
+    "about also been email emails from have into mentioned mentions message messages regarding "
+    "said says sent that their there they this were what when which will with would wrote your".split()
+)
+
+
+# Shared by every answer run: token counts and summaries are memoized across turns
+trim_conversation_history = HistoryTrimmer(
+    max_tokens=config.history_token_budget,
+    summarize=config.history_summarize,
+    summary_model=config.intent_router_model,
+)
+
+
+def _stream_stats(start_time: float, arrivals: List[float]) -> Dict[str, Any]:
+    """Time-to-first-token and inter-token latency for one streamed generation"""
+    if not arrivals:
+        return {"generation_ttft_ms": None, "generation_itl_ms_avg": None, "generation_itl_ms_p95": None, "generation_stream_chunks": 0}
+
+    gaps = sorted((b - a) * 1000 for a, b in zip(arrivals, arrivals[1:]))
+    return {
+        "generation_ttft_ms": round((arrivals[0] - start_time) * 1000),
+        "generation_itl_ms_avg": round(sum(gaps) / len(gaps), 2) if gaps else None,
+        "generation_itl_ms_p95": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))], 2) if gaps else None,
+        "generation_stream_chunks": len(arrivals),
+    }
+
+
+def answer_support(answer: str, source_text: str) -> float:
     """
-    Trim messages based on token count to prevent exceeding context limits.
-    Keeps the most recent messages within a 2000 token budget.
+    Share of the answer's content words (4+ characters) that also occur in the
+    prompt contexts or question: a cheap lexical groundedness signal, low when
+    the answer talks about things the emails never mention.
     """
-    if not messages:
-        return messages
+    words = [w for w in _content_words(answer) if w not in ANSWER_STOPWORDS]
+    if not words:
+        return 1.0
+    vocabulary = set(_content_words(source_text))
+    return sum(1 for w in words if w in vocabulary) / len(words)
 
-    try:
-        encoding = tiktoken.encoding_for_model("gpt-4")
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
 
-    max_tokens = 2000
-    total_tokens = 0
-    trimmed_messages = []
+def _content_words(text: str) -> List[str]:
+    return [w for w in WORD_RE.findall(text.lower()) if len(w) >= 4]
 
-    for message in reversed(messages):
-        message_str = str(message)
-        message_tokens = len(encoding.encode(message_str))
 
-        if total_tokens + message_tokens > max_tokens:
-            break
+def escalation_reason(answer: EmailAnswer, context_text: str, question: str) -> Optional[str]:
+    """Why a small-model answer should go to the large model, or None to accept it"""
+    level = CONFIDENCE_LEVELS.get((answer.confidence or "").strip().lower(), 0)
+    if level < CONFIDENCE_LEVELS.get(config.cascade_accept_confidence, 2):
+        return "low_confidence"
+    known_ids = set(CITED_ID_RE.findall(context_text))
+    if not any(mid in known_ids for mid in answer.cited_message_ids):
+        return "no_citations"
+    if answer_support(answer.answer, f"{context_text}\n{question}") < config.cascade_min_support:
+        return "ungrounded"
+    return None
 
-        total_tokens += message_tokens
-        trimmed_messages.insert(0, message)
 
-    return trimmed_messages if trimmed_messages else messages[-1:]
+def escalation_rate() -> Optional[float]:
+    """Share of cascade answers escalated to the large model since startup"""
+    escalated = ANSWER_CASCADE.value(outcome="escalated")
+    total = escalated + ANSWER_CASCADE.value(outcome="accepted")
+    return round(escalated / total, 4) if total else None
 
 
 class ChatAgent:
@@ -58,14 +105,21 @@ class ChatAgent:
 
         system_prompt = render_template("chat/email_assistant_system.j2")
         self.answer_agent = Agent(
-            model=f"openai:{config.answer_model}",
+            model=chat_model(config.answer_model),
             system_prompt=system_prompt,
             output_type=EmailAnswer,
             history_processors=[trim_conversation_history],
         )
+        # First tier of the answer cascade; escalates to answer_agent when unsure
+        self.small_answer_agent = Agent(
+            model=chat_model(config.cascade_small_model),
+            system_prompt=system_prompt,
+            output_type=EmailAnswer,
+            history_processors=[trim_conversation_history],
+        ) if config.cascade_enabled else None
 
         self.intent_router_agent = Agent(
-            model=f"openai:{config.intent_router_model}",
+            model=chat_model(config.intent_router_model),
             output_type=IntentRoute,
         )
 
@@ -76,33 +130,43 @@ class ChatAgent:
         conversation_history: Optional[List[Dict[str, str]]] = None,
         temperature: float = 0.0,
         max_tokens: int = 500,
+        on_token: Optional[Callable[[str], None]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+        token_budget: Optional[int] = None,
     ) -> str:
         """
         Generate an answer using the LLM based on retrieved contexts.
 
+        The answer is always streamed from the model; each newly generated slice
+        of `EmailAnswer.answer` is passed to `on_token` as soon as it arrives.
+
+        With `cascade_enabled`, the small model answers first. Its output is
+        buffered and only released if it reports enough confidence, cites a
+        message from the contexts and passes a lexical groundedness check;
+        otherwise the answer model streams a fresh answer.
+
         Args:
             question: User's question
             contexts: List of retrieved email contexts with 'text' and 'metadata'
             conversation_history: Optional conversation history for multi-turn chat
             temperature: LLM temperature (0.0 = deterministic, 1.0 = creative)
             max_tokens: Maximum tokens in response
+            on_token: Optional callback receiving answer text deltas
+            metadata: Optional dict that receives streaming latency, packing and cascade stats
+            query_embedding: Question embedding, reused to score context sentences
+            token_budget: Prompt token budget for contexts (defaults to config)
 
         Returns:
             Generated answer as string
         """
-        context_parts = []
-        for ctx in contexts:
-            meta = ctx.get("metadata", {})
-            text = ctx.get("text", "")
-            message_id = meta.get("message_id", "unknown")
-            subject = meta.get("subject", "")
-            from_addr = meta.get("from_addr", "")
-
-            context_parts.append(
-                f"[message_id={message_id} | from={from_addr} | subject={subject}]\n{text}"
-            )
-
-        context_text = "\n\n".join(context_parts)
+        packed = await pack_contexts(
+            contexts,
+            question,
+            token_budget or self.config.context_token_budget,
+            query_embedding,
+        )
+        context_text = packed.text
 
         today = datetime.now().strftime("%B %d, %Y")
         user_prompt = render_template(
@@ -112,18 +176,115 @@ class ChatAgent:
             today=today
         )
 
-        result = await self.answer_agent.run(
-            user_prompt,
-            message_history=conversation_history or [],
-            model_settings={
-                "temperature": temperature,
-                "max_tokens": max_tokens,
+        message_history = history_to_messages(conversation_history or [])
+        model_settings = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+        # TTFT counts from here, so a buffered or escalated small tier shows up in it
+        start_time = perf_counter()
+        cascade = None
+        email_answer = None
+        if self.small_answer_agent is not None:
+            candidate, error = None, None
+            try:
+                candidate, _ = await self._stream_answer(
+                    self.small_answer_agent, self.config.cascade_small_model,
+                    user_prompt, message_history, model_settings, None,
+                )
+                reason = escalation_reason(candidate, context_text, question)
+            except Exception as e:
+                # A failing small tier must not fail the turn; the answer model still runs
+                reason, error = "error", str(e)
+            tier_ms = (perf_counter() - start_time) * 1000
+            ANSWER_TIER_SECONDS.observe(tier_ms / 1000, tier="small")
+            ANSWER_CASCADE.inc(outcome="escalated" if reason else "accepted")
+            if reason:
+                ANSWER_ESCALATIONS.inc(reason=reason)
+
+            tier: Dict[str, Any] = {
+                "model": self.config.cascade_small_model,
+                "latency_ms": round(tier_ms),
+                "accepted": reason is None,
             }
-        )
+            if candidate is not None:
+                tier["confidence"] = candidate.confidence
+                tier["cited"] = len(candidate.cited_message_ids)
+                tier["support"] = round(answer_support(candidate.answer, f"{context_text}\n{question}"), 3)
+            if error:
+                tier["error"] = error
+            cascade = {"escalated": reason is not None, "reason": reason, "tiers": [tier]}
+            if reason is None:
+                email_answer = candidate
+
+        if email_answer is not None:
+            # Accepted small-tier answer: release the buffered text in one go
+            arrivals = [perf_counter()]
+            if on_token and email_answer.answer:
+                on_token(email_answer.answer)
+        else:
+            tier_start = perf_counter()
+            email_answer, arrivals = await self._stream_answer(
+                self.answer_agent, self.config.answer_model,
+                user_prompt, message_history, model_settings, on_token,
+            )
+            if cascade is not None:
+                large_ms = (perf_counter() - tier_start) * 1000
+                ANSWER_TIER_SECONDS.observe(large_ms / 1000, tier="large")
+                cascade["tiers"].append({
+                    "model": self.config.answer_model,
+                    "latency_ms": round(large_ms),
+                    "accepted": True,
+                    "confidence": email_answer.confidence,
+                    "cited": len(email_answer.cited_message_ids),
+                })
 
-        email_answer: EmailAnswer = result.output
+        if metadata is not None:
+            metadata.update(_stream_stats(start_time, arrivals))
+            metadata["context_packing"] = packed.stats()
+            if cascade is not None:
+                cascade["escalation_rate"] = escalation_rate()
+                metadata["cascade"] = cascade
         return email_answer.answer
 
+    async def _stream_answer(
+        self,
+        agent: Agent,
+        model_name: str,
+        user_prompt: str,
+        message_history: List[Any],
+        model_settings: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]],
+    ) -> Tuple[EmailAnswer, List[float]]:
+        """Run `agent` streaming, passing answer deltas to `on_token`; returns the output and delta arrival times"""
+        arrivals: List[float] = []
+        streamed = ""
+
+        async with agent.run_stream(
+            user_prompt,
+            message_history=message_history,
+            model_settings=model_settings,
+        ) as result:
+            async for partial in result.stream_output(debounce_by=None):
+                text = partial.answer or ""
+                if len(text) <= len(streamed) or not text.startswith(streamed):
+                    continue
+                delta, streamed = text[len(streamed):], text
+                arrivals.append(perf_counter())
+                if on_token:
+                    on_token(delta)
+
+            email_answer: EmailAnswer = await result.get_output()
+            record_agent_usage(model_name, result.usage())
+
+        # Partial validation can lag the final output by a trailing fragment
+        if email_answer.answer.startswith(streamed) and len(email_answer.answer) > len(streamed):
+            arrivals.append(perf_counter())
+            if on_token:
+                on_token(email_answer.answer[len(streamed):])
+        return email_answer, arrivals
+
     async def clarify_and_route(
         self,
         question: str,
@@ -153,4 +314,5 @@ class ChatAgent:
                 "max_tokens": max_tokens
             }
         )
+        record_agent_usage(self.config.intent_router_model, result.usage())
         return result.output
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    UserPromptPart,
+)
+
+from services.openai_client import chat_model
+from services.usage import record_agent_usage
+from utils.tokens import get_encoding
+
+
+SUMMARY_PROMPT = (
+    "Summarize the earlier part of a conversation between a user and an email assistant. "
+    "Keep names, dates, subjects, message IDs and open questions. At most 120 words."
+)
+
+
+def history_to_messages(history: List[Dict[str, str]]) -> List[ModelMessage]:
+    """
+    Convert stored {"role", "content", "ts"} turns into pydantic-ai messages.
+
+    Turns carry their original timestamp so a rebuilt message renders to the
+    same text every time and hits the trimmer's token-count memo.
+    """
+    messages: List[ModelMessage] = []
+    for turn in history:
+        content = turn.get("content") or ""
+        ts = datetime.fromisoformat(turn["ts"]) if turn.get("ts") else None
+        if turn.get("role") == "assistant":
+            messages.append(ModelResponse(parts=[TextPart(content=content)], **({"timestamp": ts} if ts else {})))
+        else:
+            messages.append(ModelRequest(parts=[UserPromptPart(content=content, **({"timestamp": ts} if ts else {}))]))
+    return messages
+
+
+def _prefix_keys(messages: List[ModelMessage]) -> List[str]:
+    """
+    A digest of every prefix of `messages`, from their rendered text. Stored
+    turns keep their timestamps, so a prefix rebuilt on a later turn gets the
+    same key.
+    """
+    digest, keys = hashlib.sha1(), []
+    for message in messages:
+        digest.update(str(message).encode())
+        digest.update(b"\0")
+        keys.append(digest.hexdigest())
+    return keys
+
+
+@lru_cache(maxsize=4096)
+def _count_text(text: str) -> int:
+    return len(get_encoding("gpt-4").encode_ordinary(text))
+
+
+def _message_text(message: ModelMessage, limit: int = 1000) -> str:
+    """Readable text of a message for summarization: prompts, answers and tool call arguments"""
+    role = "User" if isinstance(message, ModelRequest) else "Assistant"
+    texts = []
+    for part in message.parts:
+        if isinstance(part, SystemPromptPart):
+            continue
+        content = getattr(part, "content", None)
+        if content is None and hasattr(part, "args"):
+            content = part.args
+        if content:
+            texts.append(str(content)[:limit])
+    return f"{role}: {' '.join(texts)}" if texts else ""
+
+
+class HistoryTrimmer:
+    """
+    pydantic-ai history processor keeping the newest messages within a token budget.
+
+    Token counts are memoized per message object (and per message text, for
+    history rebuilt from storage), so each message is encoded once rather than
+    on every turn, and the
+    kept window is built in a single reverse pass. System prompt parts of
+    evicted messages are carried over. With `summarize` on, evicted turns are
+    replaced by a short summary, extended incrementally as more turns age out;
+    summaries are memoized by the content of the prefix they cover, so history
+    rebuilt from storage on the next turn reuses them.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        summarize: bool = False,
+        summary_model: Optional[str] = None,
+        memo_size: int = 4096,
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.summarize = summarize and bool(summary_model)
+        self.summary_model = summary_model
+        self.memo_size = memo_size
+        # id(message) -> (message, value); holding the message keeps its id from being reused
+        self._token_counts: "OrderedDict[int, Tuple[ModelMessage, int]]" = OrderedDict()
+        # digest of the summarized prefix (see _prefix_keys) -> summary
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._summary_agent = (
+            Agent(model=chat_model(summary_model), system_prompt=SUMMARY_PROMPT, output_type=str)
+            if self.summarize else None
+        )
+
+    def token_count(self, message: ModelMessage) -> int:
+        key = id(message)
+        cached = self._token_counts.get(key)
+        if cached is not None and cached[0] is message:
+            self._token_counts.move_to_end(key)
+            return cached[1]
+
+        # Messages rebuilt from stored history are new objects with identical text
+        count = _count_text(str(message))
+        self._remember(self._token_counts, key, (message, count))
+        return count
+
+    def split(self, messages: List[ModelMessage]) -> Tuple[List[ModelMessage], List[ModelMessage]]:
+        """Return (evicted, kept) where kept is the newest suffix within the budget"""
+        total = 0
+        cut = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            total += self.token_count(messages[i])
+            if total > self.max_tokens:
+                break
+            cut = i
+
+        if cut == len(messages):
+            # Even the newest message alone is over budget; never send an empty history
+            cut = len(messages) - 1
+        return messages[:cut], messages[cut:]
+
+    async def __call__(self, messages: List[ModelMessage]) -> List[ModelMessage]:
+        if not messages:
+            return messages
+
+        evicted, kept = self.split(messages)
+        if not evicted:
+            return kept
+
+        parts = [
+            part
+            for message in evicted if isinstance(message, ModelRequest)
+            for part in message.parts if isinstance(part, SystemPromptPart)
+        ]
+        if self._summary_agent is not None:
+            summary = await self._summarize(evicted)
+            if summary:
+                parts.append(SystemPromptPart(content=f"Summary of the earlier conversation:\n{summary}"))
+
+        if not parts:
+            return kept
+        return [ModelRequest(parts=parts)] + kept
+
+    async def _summarize(self, evicted: List[ModelMessage]) -> str:
+        """Summary of `evicted`, reusing the summary of its longest already-summarized prefix"""
+        keys = _prefix_keys(evicted)
+        previous, start = "", 0
+        for i in range(len(evicted) - 1, -1, -1):
+            cached = self._summaries.get(keys[i])
+            if cached is not None:
+                self._summaries.move_to_end(keys[i])
+                previous, start = cached, i + 1
+                break
+
+        if start == len(evicted):
+            return previous
+
+        transcript = "\n".join(filter(None, (_message_text(m) for m in evicted[start:])))
+        prompt = f"Summary so far:\n{previous}\n\nNew turns:\n{transcript}" if previous else transcript
+        try:
+            result = await self._summary_agent.run(prompt, model_settings={"temperature": 0.0, "max_tokens": 300})
+        except Exception:
+            return previous
+
+        record_agent_usage(self.summary_model, result.usage(), stage="history_summary")
+        summary = result.output.strip()
+        self._remember(self._summaries, keys[-1], summary)
+        return summary
+
+    def _remember(self, memo: "OrderedDict[Hashable, object]", key: Hashable, value: object) -> None:
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > self.memo_size:
+            memo.popitem(last=False)
@@ -0,0 +1,364 @@
+"""
+Local intent classifier used as a fast path in front of the LLM intent router.
+
+A hashing vectorizer plus logistic regression is trained on the router's own
+logged decisions (and a small seed set). Questions it is confident about are
+routed in microseconds; everything else still goes to `intent_router_agent`.
+
+Train or refresh the model from the backend directory:
+
+    python -m agents.intent_classifier train
+    python -m agents.intent_classifier report
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.utils import murmurhash3_32
+
+from config import load_config
+
+
+config = load_config()
+
+LABELS = ("output", "retrieve")
+
+# Bootstraps the model before enough router decisions have been logged
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("hi", "output"),
+    ("hello", "output"),
+    ("hey", "output"),
+    ("hey there", "output"),
+    ("good morning", "output"),
+    ("thanks", "output"),
+    ("thank you!", "output"),
+    ("help", "output"),
+    ("what can you do", "output"),
+    ("what can you do?", "output"),
+    ("how do you work", "output"),
+    ("who are you", "output"),
+    ("what are you able to help with", "output"),
+    ("how can you help me", "output"),
+    ("ok cool", "output"),
+    ("bye", "output"),
+    ("what updates do I have today?", "retrieve"),
+    ("anything new from HR?", "retrieve"),
+    ("updates from HR?", "retrieve"),
+    ("did Bob email me about the contract", "retrieve"),
+    ("when did Alice send the invoice", "retrieve"),
+    ("show me emails from John about the project", "retrieve"),
+    ("what are my unread emails from yesterday?", "retrieve"),
+    ("when is my next meeting?", "retrieve"),
+    ("what did Sarah say about the budget?", "retrieve"),
+    ("any emails from stripe this week", "retrieve"),
+    ("summarize the thread about the launch", "retrieve"),
+    ("do we have any updates from the recruiter?", "retrieve"),
+    ("what did the landlord send about?", "retrieve"),
+    ("find the flight confirmation", "retrieve"),
+    ("is there an attachment from accounting", "retrieve"),
+    ("who emailed me about the offsite", "retrieve"),
+]
+
+
+# Replies for the questions the local path routes to "output" (the LLM router
+# writes its own); a question matching none of them still goes to the router
+SIMPLE_REPLIES: List[Tuple[re.Pattern, str]] = [
+    (
+        re.compile(r"\b(help|what can you do|what are you able|how (do|can) you (work|help)|who are you)\b"),
+        "I'm your email assistant. Ask me about your inbox, for example \"what updates do I have today?\", "
+        "\"did Bob email me about the contract?\" or \"how many emails from stripe.com this week?\", "
+        "and I'll answer with citations to the emails I used.",
+    ),
+    (re.compile(r"\b(thanks|thank you|thx|cheers)\b"), "You're welcome! Anything else you'd like to know about your emails?"),
+    (re.compile(r"\b(bye|goodbye|see you)\b"), "Goodbye! Come back any time you need something from your inbox."),
+    (
+        re.compile(r"^\W*(hi|hello|hey|good (morning|afternoon|evening)|ok|okay|cool|great)\b"),
+        "Hi! Ask me anything about your emails, like \"what's new today?\" or \"what did Alice say about the budget?\"",
+    ),
+]
+
+
+def simple_reply(question: str) -> Optional[str]:
+    """Short reply to a greeting, thanks, goodbye or help question, or None"""
+    text = question.strip().lower()
+    for pattern, reply in SIMPLE_REPLIES:
+        if pattern.search(text):
+            return reply
+    return None
+
+
+def log_router_decision(question: str, route: str, path: Optional[str] = None) -> None:
+    """
+    Append one LLM routing decision to the training log (JSON lines); blocking,
+    so call it from a thread. Once the log reaches `intent_log_max_bytes` it is
+    rotated to `<path>.1`, replacing the previous rotation.
+    """
+    path = path or config.intent_log_path
+    if not path or route not in LABELS:
+        return
+    record = {"question": question, "route": route, "ts": datetime.utcnow().isoformat()}
+    with _log_lock:
+        log = Path(path)
+        log.parent.mkdir(parents=True, exist_ok=True)
+        if config.intent_log_max_bytes > 0 and log.exists() and log.stat().st_size >= config.intent_log_max_bytes:
+            os.replace(log, f"{path}.1")
+        with open(log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def load_router_log(path: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Read logged router decisions, rotated ones first; the latest label wins for repeated questions"""
+    path = path or config.intent_log_path
+    latest: Dict[str, Tuple[str, str]] = {}
+    if not path:
+        return []
+    for name in (f"{path}.1", path):
+        if not Path(name).exists():
+            continue
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                question, route = record.get("question"), record.get("route")
+                if question and route in LABELS:
+                    latest[question.strip().lower()] = (question, route)
+    return list(latest.values())
+
+
+N_FEATURES = 2 ** 18
+
+
+def _make_vectorizer() -> HashingVectorizer:
+    # Char n-grams hold up on very short inputs ("hi", "thx") and typos
+    return HashingVectorizer(
+        analyzer="char_wb",
+        ngram_range=(2, 4),
+        n_features=N_FEATURES,
+        alternate_sign=False,
+        norm="l2",
+        lowercase=True,
+    )
+
+
+class IntentClassifier:
+    """Hashing vectorizer + logistic regression over `IntentRoute.route_to` labels"""
+
+    def __init__(self, threshold: float = 0.9) -> None:
+        self.threshold = threshold
+        self.vectorizer = _make_vectorizer()
+        self._analyzer = self.vectorizer.build_analyzer()
+        self.model: Optional[LogisticRegression] = None
+        self.classes: List[str] = []
+        self._coef: Optional[np.ndarray] = None
+        self._intercept: Optional[np.ndarray] = None
+
+    def fit(self, questions: List[str], labels: List[str]) -> "IntentClassifier":
+        if len(set(labels)) < 2:
+            raise ValueError("Need examples of at least two routes to train")
+        X = self.vectorizer.transform(questions)
+        self.model = LogisticRegression(C=4.0, class_weight="balanced", max_iter=1000)
+        self.model.fit(X, labels)
+        self._prepare()
+        return self
+
+    def _prepare(self) -> None:
+        self.classes = [str(c) for c in self.model.classes_]
+        self._coef = self.model.coef_.T.astype(np.float64)
+        self._intercept = self.model.intercept_.astype(np.float64)
+
+    def _hashed_counts(self, question: str) -> Dict[int, int]:
+        """Same feature indices as `HashingVectorizer.transform`, without the sparse-matrix overhead"""
+        counts: Dict[int, int] = {}
+        for gram in self._analyzer(question):
+            h = murmurhash3_32(gram, seed=0)
+            idx = (2147483647 - (N_FEATURES - 1)) % N_FEATURES if h == -2147483648 else abs(h) % N_FEATURES
+            counts[idx] = counts.get(idx, 0) + 1
+        return counts
+
+    def predict_proba(self, question: str) -> Dict[str, float]:
+        """Class probabilities, computed directly from the coefficients to skip sklearn's input checks"""
+        counts = self._hashed_counts(question)
+        scores = self._intercept.copy()
+        if counts:
+            idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            scores += (values @ self._coef[idx]) / np.sqrt(values @ values)
+        if len(self.classes) == 2:
+            p1 = float(1.0 / (1.0 + np.exp(-scores[0])))
+            return {self.classes[0]: 1.0 - p1, self.classes[1]: p1}
+        exp = np.exp(scores - scores.max())
+        probs = exp / exp.sum()
+        return dict(zip(self.classes, probs.tolist()))
+
+    def predict(self, question: str) -> Optional[Tuple[str, float]]:
+        """Return (route, confidence) when confident enough, otherwise None"""
+        if self._coef is None:
+            return None
+        probs = self.predict_proba(question)
+        route = max(probs, key=probs.get)
+        confidence = float(probs[route])
+        if confidence < self.threshold:
+            return None
+        return route, confidence
+
+    def save(self, path: str, report: Optional[Dict[str, Any]] = None) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(
+            {
+                "model": self.model,
+                "threshold": self.threshold,
+                "trained_at": datetime.utcnow().isoformat(),
+                "report": report or {},
+            },
+            path,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["IntentClassifier", Dict[str, Any]]:
+        payload = joblib.load(path)
+        clf = cls(threshold=payload.get("threshold", config.intent_classifier_threshold))
+        clf.model = payload["model"]
+        clf._prepare()
+        return clf, payload
+
+
+_cached: Dict[str, Any] = {"mtime": None, "classifier": None}
+_load_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """
+    Get the trained classifier, reloading it when the model file changes.
+    Returns None when the fast path is disabled or no model has been trained.
+    """
+    path = config.intent_classifier_path
+    if not config.intent_classifier_enabled or not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if mtime != _cached["mtime"]:
+        with _load_lock:
+            if mtime != _cached["mtime"]:
+                try:
+                    clf, _ = IntentClassifier.load(path)
+                    clf.threshold = config.intent_classifier_threshold
+                except Exception:
+                    clf = None
+                _cached.update(mtime=mtime, classifier=clf)
+    return _cached["classifier"]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def evaluate(clf: IntentClassifier, questions: List[str], labels: List[str]) -> Dict[str, Any]:
+    """Accuracy overall and on the confident subset, coverage, and per-question latency"""
+    latencies_us: List[float] = []
+    correct = confident = confident_correct = 0
+    for question, label in zip(questions, labels):
+        t0 = perf_counter()
+        probs = clf.predict_proba(question)
+        latencies_us.append((perf_counter() - t0) * 1e6)
+        route = max(probs, key=probs.get)
+        correct += route == label
+        if probs[route] >= clf.threshold:
+            confident += 1
+            confident_correct += route == label
+
+    total = len(questions) or 1
+    return {
+        "samples": len(questions),
+        "threshold": clf.threshold,
+        "accuracy": round(correct / total, 4),
+        "coverage": round(confident / total, 4),
+        "confident_accuracy": round(confident_correct / confident, 4) if confident else None,
+        "latency_us_p50": round(_percentile(latencies_us, 50), 1),
+        "latency_us_p95": round(_percentile(latencies_us, 95), 1),
+    }
+
+
+def train(
+    log_path: Optional[str] = None,
+    model_path: Optional[str] = None,
+    threshold: Optional[float] = None,
+    test_size: float = 0.2,
+) -> Dict[str, Any]:
+    """
+    Train on seed examples plus logged router decisions, report held-out
+    accuracy/latency, then refit on everything and save the model.
+    """
+    threshold = config.intent_classifier_threshold if threshold is None else threshold
+    model_path = model_path or config.intent_classifier_path
+
+    logged = load_router_log(log_path)
+    examples = {q.strip().lower(): (q, r) for q, r in SEED_EXAMPLES}
+    examples.update({q.strip().lower(): (q, r) for q, r in logged})
+    questions = [q for q, _ in examples.values()]
+    labels = [r for _, r in examples.values()]
+
+    report: Dict[str, Any] = {"logged_decisions": len(logged), "examples": len(questions)}
+    try:
+        q_train, q_test, y_train, y_test = train_test_split(
+            questions, labels, test_size=test_size, stratify=labels, random_state=13
+        )
+        holdout = IntentClassifier(threshold).fit(q_train, y_train)
+        report["holdout"] = evaluate(holdout, q_test, y_test)
+    except ValueError:
+        report["holdout"] = None  # Too few examples per route for a split
+
+    clf = IntentClassifier(threshold).fit(questions, labels)
+    report["train"] = evaluate(clf, questions, labels)
+    clf.save(model_path, report)
+    report["model_path"] = model_path
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local intent classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = sub.add_parser("train", help="Train/refresh from logged router decisions")
+    train_cmd.add_argument("--log", default=None, help="Router decision log (JSON lines)")
+    train_cmd.add_argument("--model", default=None, help="Where to write the model")
+    train_cmd.add_argument("--threshold", type=float, default=None)
+
+    report_cmd = sub.add_parser("report", help="Evaluate the saved model on the router log")
+    report_cmd.add_argument("--log", default=None)
+    report_cmd.add_argument("--model", default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "train":
+        report = train(args.log, args.model, args.threshold)
+    else:
+        clf, payload = IntentClassifier.load(args.model or config.intent_classifier_path)
+        logged = load_router_log(args.log) or SEED_EXAMPLES
+        report = {
+            "trained_at": payload.get("trained_at"),
+            "trained_report": payload.get("report"),
+            "current_log": evaluate(clf, [q for q, _ in logged], [r for _, r in logged]),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,15 @@ class ChatRequest(BaseModel):
     top_k: int = Field(6, description="Number of documents to retrieve", ge=1, le=20)
     temperature: float = Field(0.0, description="LLM temperature", ge=0.0, le=2.0)
     max_tokens: int = Field(500, description="Maximum tokens in response", ge=50, le=2000)
+    conversation_id: Optional[str] = Field(
+        None,
+        description="Continue an existing conversation; a new one is started when omitted",
+        max_length=128,
+    )
+    account_id: Optional[int] = Field(
+        None,
+        description="Account to ask about; the first connected account when omitted",
+    )
 
     model_config = {
         "json_schema_extra": {
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Account
+
+
+async def resolve_account(db: AsyncSession, account_id: Optional[int] = None) -> Account:
+    """
+    The account a request is about: `account_id` when given (404 if unknown),
+    else the first connected account, as in a single-user setup (400 if none).
+    """
+    if account_id is not None:
+        acct = await db.get(Account, account_id)
+        if not acct:
+            raise HTTPException(status_code=404, detail=f"Unknown account {account_id}")
+        return acct
+    acct = await db.scalar(select(Account).limit(1))
+    if not acct:
+        raise HTTPException(status_code=400, detail="No connected account")
+    return acct
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
@@ -7,16 +8,25 @@ os.environ["CHROMA_TELEMETRY"] = "False"
 os.environ["CHROMA_TELEMETRY_IMPL"] = "None"
 os.environ["POSTHOG_DISABLED"] = "1"
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from config import load_config
-from database import Base, engine
-from api.routers import auth, sync, chat, eval_deepeval, eval_llm_judge
+from database import async_engine, engine, upgrade_schema
+from api.routers import auth, sync, chat, eval_deepeval, eval_llm_judge, eval_runs, retention, usage
+from api.middleware import MetricsMiddleware
+from orchestrator import get_coalescer
+from services.admission import AdmissionRejected, get_admission_controller
+from services.nylas_client import NylasClient
+from services.retention import reconcile_deduplicated, retention_loop
+from services.sync import get_sync_scheduler
+from utils.metrics import CONTENT_TYPE, render_metrics
 
 
 config = load_config()
-Base.metadata.create_all(bind=engine)
+# Duplicate rows removed while adding unique indexes, whose chunks and digests need rebuilding
+_deduplicated = upgrade_schema(engine, grant_provider=NylasClient().get_grant_provider)
 
 app = FastAPI(title="Email Assistant RAG")
 
@@ -29,11 +39,53 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Shed load with 429 and a Retry-After hint instead of queueing without bound"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "work_class": exc.work_class, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+_background: list = []
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if _deduplicated:
+        _background.append(asyncio.create_task(reconcile_deduplicated(_deduplicated)))
+    if config.retention_enabled and config.retention_interval_hours > 0:
+        _background.append(asyncio.create_task(retention_loop()))
+    if config.sync_scheduler_enabled:
+        _background.append(asyncio.create_task(get_sync_scheduler().run()))
+
+
+@app.on_event("shutdown")
+async def close_database():
+    for task in _background:
+        task.cancel()
+    await async_engine.dispose()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "coalescing": get_coalescer().stats(),
+        "admission": get_admission_controller().stats(),
+        "sync": {k: v for k, v in get_sync_scheduler().stats().items() if k in ("running", "accounts", "in_flight", "due")},
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of latency histograms, counters and gauges"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
 
 
 # Routers
@@ -42,3 +94,6 @@ app.include_router(sync.router, tags=["sync"])
 app.include_router(chat.router, tags=["chat"])
 app.include_router(eval_deepeval.router, tags=["eval"])
 app.include_router(eval_llm_judge.router, tags=["eval"])
+app.include_router(eval_runs.router, tags=["eval"])
+app.include_router(retention.router, tags=["retention"])
+app.include_router(usage.router, tags=["usage"])
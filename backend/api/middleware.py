@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from time import perf_counter
+
+from utils.metrics import counter, gauge, histogram
+
+
+HTTP_SECONDS = histogram(
+    "http_request_seconds",
+    "HTTP request latency, until the last body chunk is sent",
+    ["method", "route", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+HTTP_ERRORS = counter("http_request_errors_total", "HTTP requests answered with a 5xx or raising", ["method", "route"])
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency, errors and in-flight
+    requests. Routes are labelled by their path template, so IDs in URLs don't
+    create new series; unmatched paths share one label.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            if status["code"] >= 500:
+                HTTP_ERRORS.inc(method=method, route=route)
+            HTTP_SECONDS.observe(perf_counter() - start, method=method, route=route, status=str(status["code"]))
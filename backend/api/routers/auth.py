@@ -4,10 +4,11 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import load_config
-from database import SessionLocal, Account
+from database import Account, get_async_db
 from services import NylasClient, new_state
 
 
@@ -16,14 +17,6 @@ config = load_config()
 nylas = NylasClient()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/auth/nylas/url")
 async def get_auth_url():
     state = new_state()
@@ -32,7 +25,7 @@ async def get_auth_url():
 
 @router.get("/nylas/callback")
 async def nylas_callback(
-    code: str, state: Optional[str] = None, db: Session = Depends(get_db)
+    code: str, state: Optional[str] = None, db: AsyncSession = Depends(get_async_db)
 ):
     try:
         token_data = nylas.exchange_code(code)
@@ -41,35 +34,40 @@ async def nylas_callback(
 
     grant_id = token_data.get("grant_id")
     email = token_data.get("email")
+    provider = token_data.get("provider")
 
     if not grant_id:
         raise HTTPException(
             status_code=400, detail="Missing grant_id from Nylas response"
         )
 
-    # Fetch user email from Nylas if not in token response
-    if not email:
+    # Fetch user email and provider from Nylas if not in token response
+    if not email or not provider:
         try:
-            email = nylas.get_grant_email(grant_id)
+            grant = nylas.get_grant(grant_id)
+            email = email or grant.get("email")
+            provider = provider or grant.get("provider")
         except Exception:
-            email = None
+            pass
 
     # Check if account already exists
-    acct = db.query(Account).filter(Account.nylas_grant_id == grant_id).first()
+    acct = await db.scalar(select(Account).where(Account.nylas_grant_id == grant_id))
     if not acct:
         acct = Account(
             email=email,
             nylas_grant_id=grant_id,
             access_token=grant_id,  # In v3, grant_id is used for API calls
-            provider="nylas",
+            # The grant's mail provider ("google", "microsoft", ...), which sync limits apply to
+            provider=provider,
         )
         db.add(acct)
     else:
         acct.email = email  # Update email in case it changed
         acct.access_token = grant_id
+        acct.provider = provider or acct.provider
 
-    db.commit()
-    db.refresh(acct)
+    await db.commit()
+    await db.refresh(acct)
 
     # Redirect with account_id so frontend can track the user
     redirect_url = f"{config.frontend_base_url}/connect?success=1&account_id={acct.id}"
@@ -77,7 +75,7 @@ async def nylas_callback(
 
 
 @router.get("/auth/me")
-async def auth_me(account_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def auth_me(account_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
     """
     Get current account information.
 
@@ -86,9 +84,9 @@ async def auth_me(account_id: Optional[int] = None, db: Session = Depends(get_db
     For multi-user apps, you should implement proper session management.
     """
     if account_id:
-        acct = db.query(Account).filter(Account.id == account_id).first()
+        acct = await db.get(Account, account_id)
     else:
-        acct = db.query(Account).first()
+        acct = await db.scalar(select(Account).limit(1))
 
     if not acct:
         return {"account": None}
@@ -105,9 +103,9 @@ async def auth_me(account_id: Optional[int] = None, db: Session = Depends(get_db
 
 
 @router.get("/auth/accounts")
-async def list_accounts(db: Session = Depends(get_db)):
+async def list_accounts(db: AsyncSession = Depends(get_async_db)):
     """List all connected accounts"""
-    accounts = db.query(Account).all()
+    accounts = (await db.scalars(select(Account))).all()
     return {
         "accounts": [
             {
@@ -1,99 +1,253 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+from time import perf_counter
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
 
+from api.accounts import resolve_account
 from config import load_config
-from database import SessionLocal, Account
-from orchestrator import build_chat_workflow, ChatState
+from database import get_async_db
+from orchestrator import (
+    build_chat_workflow,
+    ChatState,
+    Flight,
+    get_coalescer,
+    set_token_sink,
+    contexts_to_sources,
+)
 from agents.models.chat import ChatRequest
+from services.usage import USAGE_SAVE_ERRORS, start_usage_tracking, save_usage
+from services.admission import Ticket, get_admission_controller
 
 
 router = APIRouter()
 config = load_config()
+logger = logging.getLogger(__name__)
 _workflow = build_chat_workflow()
+_coalescer = get_coalescer()
+_admission = get_admission_controller()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _thread_config(account_id: int, conversation_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": f"chat_{account_id}_{conversation_id}"}}
 
 
-@router.post("/chat")
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    """Chat endpoint using workflow"""
-    acct = db.query(Account).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No connected account")
+async def _start_turn(request: ChatRequest, account_id: int) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """
+    Build the workflow input for one turn of a conversation.
+
+    Each conversation gets its own checkpoint thread. When continuing one, its
+    recorded turns are loaded from the checkpointer as conversation history.
+    The input is a dict with every field of a fresh `ChatState`: langgraph
+    skips None fields of a model input, so the previous turn's answer and
+    error would otherwise carry over into this one.
+    """
+    conversation_id = request.conversation_id or uuid4().hex
+    thread_config = _thread_config(account_id, conversation_id)
+
+    history = []
+    if request.conversation_id:
+        snapshot = await _workflow.aget_state(thread_config)
+        history = (snapshot.values or {}).get("conversation_history") or []
 
     state = ChatState(
-        account_id=acct.id,
+        account_id=account_id,
         question=request.question,
         top_k=request.top_k,
         temperature=request.temperature,
         max_tokens=request.max_tokens,
-        conversation_history=[]
+        conversation_history=history
     )
+    return state.model_dump(), thread_config, conversation_id
+
+
+async def _run_turn(flight: Flight, request: ChatRequest, account_id: int, kind: str) -> Dict[str, Any]:
+    """
+    Run one workflow turn, publishing answer tokens and node updates to
+    `flight`; its usage is recorded under request kind `kind` ("chat" or "stream")
+    """
+    state, thread_config, conversation_id = await _start_turn(request, account_id)
+    flight.info["conversation_id"] = conversation_id
 
-    result = await _workflow.ainvoke(
-        state,
-        config={"configurable": {"thread_id": f"chat_{acct.id}"}}
+    set_token_sink(flight.push_token)
+    tracker = start_usage_tracking()
+    result: Dict[str, Any] = {}
+    try:
+        async for chunk in _workflow.astream(state, config=thread_config):
+            for node_name, node_output in chunk.items():
+                result.update(node_output)
+                flight.push_event("update", node_output)
+    finally:
+        # Coalesced requests share this run, so its usage is recorded once
+        try:
+            await asyncio.to_thread(save_usage, tracker, account_id, kind, conversation_id)
+        except Exception:
+            # The answer is still served; the missing usage is counted and logged, not hidden
+            USAGE_SAVE_ERRORS.inc(request_kind=kind)
+            logger.exception("Failed to record usage of a %s turn (account %s, conversation %s)", kind, account_id, conversation_id)
+    return result
+
+
+def _turn_key(request: ChatRequest, account_id: int) -> Tuple:
+    return _coalescer.key(
+        account_id,
+        request.question,
+        request.top_k,
+        request.temperature,
+        request.max_tokens,
+        request.conversation_id,
     )
 
+
+async def _join_turn(
+    key: Tuple, request: ChatRequest, account_id: int, kind: str
+) -> Tuple[Flight, bool, Optional[Ticket]]:
+    """
+    Attach to an identical turn already running, or admit and start this one.
+    Returns (flight, started, ticket). Joining a running turn adds no work, so
+    it takes no admission slot; every run that is started holds one.
+    """
+    flight = _coalescer.join_running(key)
+    if flight is not None:
+        return flight, False, None
+    ticket = await _admission.acquire("chat")
+    flight, started = _coalescer.join(key, lambda flight: _run_turn(flight, request, account_id, kind))
+    if not started:
+        # An identical turn started while this one waited for admission
+        ticket.release()
+        ticket = None
+    return flight, started, ticket
+
+
+async def _turn_metadata(flight: Flight, started: bool, request: ChatRequest, account_id: int) -> Dict[str, Any]:
+    """
+    Conversation of a finished turn. Coalesced requests that continue a
+    conversation already share it; one that started a new conversation gets
+    its own, seeded with the shared turn, so separate clients never continue
+    the same thread.
+    """
+    conversation_id = flight.info.get("conversation_id")
+    if not started and not request.conversation_id:
+        conversation_id = uuid4().hex
+        history = flight.result.get("conversation_history")
+        if history:
+            # As if written by the last node, so the next turn starts from the entry point
+            await _workflow.aupdate_state(
+                _thread_config(account_id, conversation_id), {"conversation_history": history}, as_node="output"
+            )
+    return {"conversation_id": conversation_id, "coalesced": not started}
+
+
+@router.post("/chat")
+async def chat(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """Chat endpoint using workflow"""
+    acct = await resolve_account(db, request.account_id)
+
+    flight, started, ticket = await _join_turn(_turn_key(request, acct.id), request, acct.id, "chat")
+    try:
+        result = await flight.wait()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{e}")
+    finally:
+        _coalescer.leave(flight)
+        if ticket:
+            ticket.release()
+
     if result.get("error"):
         raise HTTPException(status_code=500, detail=result["error"])
 
     return {
         "answer": result.get("answer"),
         "sources": result.get("sources", []),
-        "metadata": result.get("metadata", {})
+        "metadata": {**result.get("metadata", {}), **(await _turn_metadata(flight, started, request, acct.id))}
     }
 
 
 @router.post("/chat/stream")
-async def chat_stream(request: ChatRequest, db: Session = Depends(get_db)):
-    """Streaming chat with SSE using workflow"""
-    acct = db.query(Account).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No connected account")
-
-    state = ChatState(
-        account_id=acct.id,
-        question=request.question,
-        top_k=request.top_k,
-        temperature=request.temperature,
-        max_tokens=request.max_tokens,
-        conversation_history=[]
-    )
+async def chat_stream(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """Streaming chat with SSE: answer tokens are forwarded as the model generates them"""
+    acct = await resolve_account(db, request.account_id)
+
+    # Join (and admit) before responding so an overloaded worker can still answer 429
+    start_time = perf_counter()
+    flight, started, ticket = await _join_turn(_turn_key(request, acct.id), request, acct.id, "stream")
+    left = False
+
+    def leave() -> None:
+        # Stops the run only if no other request is following it
+        nonlocal left
+        if not left:
+            left = True
+            _coalescer.leave(flight)
+            if ticket:
+                ticket.release()
 
     async def event_publisher():
+        stream = flight.subscribe(config.stream_frame_ms, config.stream_frame_chars)
+
         final_answer = None
         final_sources = None
-
-        async for chunk in _workflow.astream(
-            state,
-            config={"configurable": {"thread_id": f"chat_stream_{acct.id}"}}
-        ):
-            for node_name, node_output in chunk.items():
-                if "sources" in node_output and node_output.get("sources"):
-                    final_sources = node_output["sources"]
+        metadata = {}
+        first_frame_ms = None
+        frames = 0
+
+        try:
+            async for kind, payload in stream.frames():
+                if kind == "token":
+                    if first_frame_ms is None:
+                        first_frame_ms = round((perf_counter() - start_time) * 1000)
+                    frames += 1
+                    yield {"event": "token", "data": json.dumps({"token": payload})}
+                    continue
+
+                if kind == "error":
+                    yield {"event": "error", "data": json.dumps({"error": payload})}
+                    continue
+
+                node_output = payload
+                # Send citations as soon as retrieval finishes, ahead of the answer tokens
+                sources = node_output.get("sources") or (
+                    contexts_to_sources(node_output["raw_contexts"])
+                    if node_output.get("raw_contexts") else None
+                )
+                if sources and final_sources is None:
+                    final_sources = sources
                     yield {
                         "event": "sources",
                         "data": json.dumps({"sources": final_sources}),
                     }
 
-                if "answer" in node_output and node_output.get("answer"):
+                if node_output.get("answer"):
                     final_answer = node_output["answer"]
-
-        if final_answer:
-            for char in final_answer:
-                yield {"event": "token", "data": json.dumps({"token": char})}
-
-        yield {"event": "done", "data": json.dumps({"sources": final_sources or []})}
-
-    return EventSourceResponse(event_publisher())
+                if node_output.get("metadata"):
+                    metadata = node_output["metadata"]
+
+            # Cached and direct answers never went through the model stream
+            if final_answer and frames == 0:
+                first_frame_ms = round((perf_counter() - start_time) * 1000)
+                frames = 1
+                yield {"event": "token", "data": json.dumps({"token": final_answer})}
+        finally:
+            leave()
+
+        metadata = {
+            **metadata,
+            **(await _turn_metadata(flight, started, request, acct.id)),
+            "stream_ttft_ms": first_frame_ms,
+            "stream_frames": frames,
+        }
+        yield {
+            "event": "done",
+            "data": json.dumps({"sources": final_sources or [], "metadata": metadata}),
+        }
+
+    # Also run after the response, in case the client left before streaming began
+    return EventSourceResponse(event_publisher(), background=BackgroundTask(leave))
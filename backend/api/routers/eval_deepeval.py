@@ -1,19 +1,31 @@
 """DeepEval comprehensive RAG evaluation endpoint."""
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+from typing import Optional
 
-from database import get_db, Account, EmailMessage
-from orchestrator import build_chat_workflow, ChatState
-from services.eval import run_deepeval, calculate_aggregate_metrics
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.accounts import resolve_account
+from database import get_async_db, EmailMessage
+from orchestrator import get_eval_workflow, ChatState
+from services.eval import start_progress, run_deepeval, calculate_aggregate_metrics, record_run
+from services.admission import get_admission_controller
 from config import load_config
 
 router = APIRouter()
 config = load_config()
+_admission = get_admission_controller()
 
 
 @router.post("/eval/deepeval")
-async def eval_deepeval_run(db: Session = Depends(get_db)):
+async def eval_deepeval_run(
+    messages: int = Query(1, ge=1, le=500, description="Recent messages to build questions from (two per message)"),
+    label: Optional[str] = Query(None, max_length=128, description="Name stored with the run, e.g. the change being tested"),
+    account_id: Optional[int] = Query(None, description="Account to evaluate on; defaults to the first connected account"),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Run comprehensive DeepEval evaluation with 5 metrics:
     - Answer Relevancy
@@ -22,19 +34,17 @@ async def eval_deepeval_run(db: Session = Depends(get_db)):
     - Contextual Recall
     - Hallucination (lower is better)
     """
-    # Get first connected account
-    acct = db.query(Account).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No connected account")
+    acct = await resolve_account(db, account_id)
 
     # Build evaluation dataset from existing messages
     msgs = (
-        db.query(EmailMessage)
-        .filter(EmailMessage.account_id == acct.id)
-        .order_by(EmailMessage.date.desc())
-        .limit(1)
-        .all()
-    )
+        await db.scalars(
+            select(EmailMessage)
+            .where(EmailMessage.account_id == acct.id)
+            .order_by(EmailMessage.date.desc())
+            .limit(messages)
+        )
+    ).all()
 
     if not msgs:
         raise HTTPException(status_code=400, detail="No messages to evaluate")
@@ -55,26 +65,39 @@ async def eval_deepeval_run(db: Session = Depends(get_db)):
         ref2 = m.subject or "No subject"
         samples.append({"question": q2, "expected_output": ref2})
 
+    workflow = get_eval_workflow()
+
     async def ask_fn(question: str):
-        """Execute workflow for each question"""
-        workflow = build_chat_workflow()
+        """Execute the shared workflow; each question is a fresh, independent run"""
         state = ChatState(
             account_id=acct.id,
             question=question,
             top_k=config.top_k
         )
-        workflow_config = {"configurable": {"thread_id": f"eval-{acct.id}"}}
-        result = await workflow.ainvoke(state, config=workflow_config)
+        result = await workflow.ainvoke(state)
         return result.get("answer") or "", result.get("sources") or []
 
     # Run DeepEval evaluation
-    results = await run_deepeval(samples, ask_fn, verbose=False)
+    progress = start_progress("deepeval", len(samples))
+    try:
+        async with _admission.admit("eval"):
+            results = await run_deepeval(samples, ask_fn, verbose=False, progress=progress)
+    except BaseException as e:
+        progress.finish(e)
+        raise
+    progress.finish()
     payload = [r.to_dict() for r in results]
     aggregate = calculate_aggregate_metrics(results)
-    
+    baseline = await asyncio.to_thread(
+        record_run, progress.run_id, "deepeval", acct.id, aggregate, payload, label
+    )
+
     return {
         "evaluation_type": "deepeval",
+        "run_id": progress.run_id,
+        "progress": progress.to_dict(),
         "items": payload,
         "total": len(payload),
-        "aggregate": aggregate
+        "aggregate": aggregate,
+        "baseline": baseline
     }
@@ -1,37 +1,48 @@
 """LLM-as-a-Judge evaluation endpoint."""
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+from typing import Optional
 
-from database import get_db, Account, EmailMessage
-from orchestrator import build_chat_workflow, ChatState
-from services.eval import run_eval
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.accounts import resolve_account
+from database import get_async_db, EmailMessage
+from orchestrator import get_eval_workflow, ChatState
+from services.eval import start_progress, run_eval, calculate_judge_aggregate, record_run
+from services.usage import start_usage_tracking, save_usage
+from services.admission import get_admission_controller
 from config import load_config
 
 router = APIRouter()
 config = load_config()
+_admission = get_admission_controller()
 
 
 @router.post("/eval/llm-judge")
-async def eval_llm_judge_run(db: Session = Depends(get_db)):
+async def eval_llm_judge_run(
+    messages: int = Query(1, ge=1, le=500, description="Recent messages to build questions from (two per message)"),
+    label: Optional[str] = Query(None, max_length=128, description="Name stored with the run, e.g. the change being tested"),
+    account_id: Optional[int] = Query(None, description="Account to evaluate on; defaults to the first connected account"),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Run LLM-as-a-Judge evaluation with binary metrics:
     - Faithfulness (0 or 1)
     - Relevance (0 or 1)
     """
-    # Get first connected account
-    acct = db.query(Account).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No connected account")
+    acct = await resolve_account(db, account_id)
 
     # Build evaluation dataset from existing messages
     msgs = (
-        db.query(EmailMessage)
-        .filter(EmailMessage.account_id == acct.id)
-        .order_by(EmailMessage.date.desc())
-        .limit(1)
-        .all()
-    )
+        await db.scalars(
+            select(EmailMessage)
+            .where(EmailMessage.account_id == acct.id)
+            .order_by(EmailMessage.date.desc())
+            .limit(messages)
+        )
+    ).all()
 
     if not msgs:
         raise HTTPException(status_code=400, detail="No messages to evaluate")
@@ -52,24 +63,42 @@ async def eval_llm_judge_run(db: Session = Depends(get_db)):
         ref2 = m.subject or "No subject"
         samples.append({"question": q2, "reference": ref2})
 
+    workflow = get_eval_workflow()
+
     async def ask_fn(question: str):
-        """Execute workflow for each question"""
-        workflow = build_chat_workflow()
+        """Execute the shared workflow; each question is a fresh, independent run"""
         state = ChatState(
             account_id=acct.id,
             question=question,
             top_k=config.top_k
         )
-        workflow_config = {"configurable": {"thread_id": f"eval-{acct.id}"}}
-        result = await workflow.ainvoke(state, config=workflow_config)
+        result = await workflow.ainvoke(state)
         return result.get("answer") or "", result.get("sources") or []
 
-    # Run LLM Judge evaluation
-    results = await run_eval(samples, ask_fn)
+    # Run LLM Judge evaluation; usage covers both the answers and the judges
+    tracker = start_usage_tracking()
+    progress = start_progress("llm_judge", len(samples))
+    try:
+        async with _admission.admit("eval"):
+            results = await run_eval(samples, ask_fn, progress=progress)
+    except BaseException as e:
+        progress.finish(e)
+        raise
+    progress.finish()
     payload = [r.__dict__ if hasattr(r, '__dict__') else r for r in results]
-    
+    aggregate = calculate_judge_aggregate(results)
+    save_usage(tracker, acct.id, "eval_llm_judge")
+    baseline = await asyncio.to_thread(
+        record_run, progress.run_id, "llm_judge", acct.id, aggregate, payload, label
+    )
+
     return {
         "evaluation_type": "llm_judge",
+        "run_id": progress.run_id,
+        "progress": progress.to_dict(),
         "items": payload,
-        "total": len(payload)
+        "total": len(payload),
+        "aggregate": aggregate,
+        "baseline": baseline,
+        "usage": tracker.summary()
     }
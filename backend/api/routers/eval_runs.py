@@ -0,0 +1,75 @@
+"""Progress, history and comparison of evaluation runs."""
+
+import asyncio
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from services.eval import (
+    baseline_for,
+    compare_runs,
+    get_progress,
+    get_run,
+    list_progress,
+    list_runs,
+    set_baseline,
+)
+
+router = APIRouter()
+
+
+@router.get("/eval/progress")
+async def eval_progress_list():
+    """Recent evaluation runs, newest first, including ones still running"""
+    return {"runs": list_progress()}
+
+
+@router.get("/eval/progress/{run_id}")
+async def eval_progress(run_id: str):
+    """Samples answered, judged and failed so far for one run, with an ETA"""
+    progress = get_progress(run_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown evaluation run")
+    return progress.to_dict()
+
+
+@router.get("/eval/runs")
+async def eval_runs(
+    kind: Optional[Literal["llm_judge", "deepeval"]] = None,
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Stored runs, newest first, with git revision and aggregate scores"""
+    return {"runs": await asyncio.to_thread(list_runs, kind, limit)}
+
+
+@router.get("/eval/runs/{run_id}")
+async def eval_run(run_id: str):
+    """One stored run with its settings snapshot and per-sample results"""
+    run = await asyncio.to_thread(get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Unknown evaluation run")
+    return run
+
+
+@router.post("/eval/runs/{run_id}/baseline")
+async def eval_run_baseline(run_id: str):
+    """Make a run the default baseline for later runs of the same evaluator"""
+    if not await asyncio.to_thread(set_baseline, run_id):
+        raise HTTPException(status_code=404, detail="Unknown evaluation run")
+    return {"run_id": run_id, "baseline": True}
+
+
+@router.get("/eval/compare")
+async def eval_compare(new: str, base: Optional[str] = None):
+    """
+    Per-metric deltas of run `new` against `base` (default: the evaluator's
+    marked baseline, else the previous run), with regressions, changed
+    settings and samples whose scores changed.
+    """
+    new_run = await asyncio.to_thread(get_run, new)
+    if new_run is None:
+        raise HTTPException(status_code=404, detail="Unknown evaluation run")
+    base_run = await asyncio.to_thread(get_run, base) if base else await asyncio.to_thread(baseline_for, new_run)
+    if base_run is None:
+        raise HTTPException(status_code=404, detail="No baseline run to compare against")
+    return compare_runs(base_run, new_run)
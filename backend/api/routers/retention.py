@@ -0,0 +1,71 @@
+"""Per-account retention policies and the compaction job."""
+
+import asyncio
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.accounts import resolve_account
+from database import get_async_db
+from services.admission import get_admission_controller
+from services.retention import RetentionPolicy, compact, get_policy, last_report, set_policy
+
+router = APIRouter()
+_admission = get_admission_controller()
+
+
+class RetentionPolicyIn(BaseModel):
+    max_age_days: int = Field(0, ge=0, description="Delete any message older than this; 0 keeps mail forever")
+    folder_days: Dict[str, int] = Field(default_factory=dict, description='e.g. {"trash": 30, "category_promotions": 90}')
+    sender_days: Dict[str, int] = Field(default_factory=dict, description='"automated" and/or "person" to days')
+    html_days: int = Field(0, ge=0, description="Drop stored HTML bodies older than this; 0 keeps them")
+
+
+@router.get("/retention/policy")
+async def retention_policy(account_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Effective retention policy of an account (the first connected one without `account_id`)"""
+    account_id = (await resolve_account(db, account_id)).id
+    policy = await asyncio.to_thread(get_policy, account_id)
+    return {"account_id": account_id, "policy": policy.to_dict()}
+
+
+@router.put("/retention/policy")
+async def update_retention_policy(
+    body: RetentionPolicyIn,
+    account_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    account_id = (await resolve_account(db, account_id)).id
+    try:
+        policy = RetentionPolicy.from_dict(body.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await asyncio.to_thread(set_policy, account_id, policy)
+    return {"account_id": account_id, "policy": policy.to_dict()}
+
+
+@router.delete("/retention/policy")
+async def reset_retention_policy(account_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Return the account to the configured defaults"""
+    account_id = (await resolve_account(db, account_id)).id
+    await asyncio.to_thread(set_policy, account_id, None)
+    return {"account_id": account_id, "policy": (await asyncio.to_thread(get_policy, account_id)).to_dict()}
+
+
+@router.post("/retention/compact")
+async def retention_compact(
+    dry_run: bool = Query(False, description="Only count what would be deleted"),
+    vacuum: bool = Query(True, description="VACUUM afterwards when enough of the file is free"),
+    account_id: Optional[int] = Query(None, description="Defaults to every account"),
+):
+    """Delete expired mail and chunks now and report the space reclaimed"""
+    async with _admission.admit("sync"):
+        return await _admission.run_blocking("sync", compact, account_id, dry_run, vacuum)
+
+
+@router.get("/retention/last")
+async def retention_last():
+    """Report of the last compaction in this process"""
+    return {"report": last_report()}
@@ -1,94 +1,61 @@
 from __future__ import annotations
 
-from datetime import UTC, datetime
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import asyncio
+from typing import Optional
 
-from database import SessionLocal, Account, EmailMessage, EmailThread, SyncState
-from services import NylasClient, normalize_message, index_messages
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
-
-router = APIRouter()
-nylas = NylasClient()
+from api.accounts import resolve_account
+from database import get_async_db
+from services.digest import PERIODS, get_digest
+from services.sync import get_sync_scheduler, sync_account
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter()
 
 
 @router.post("/sync/latest")
-async def sync_latest(db: Session = Depends(get_db)):
-    acct = db.query(Account).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No connected account")
-
-    messages = nylas.fetch_last_messages(acct.nylas_grant_id, limit=200)
-    norm_msgs = [normalize_message(m) for m in messages]
-
-    inserted = 0
-    for m in norm_msgs:
-        existing = (
-            db.query(EmailMessage)
-            .filter(EmailMessage.message_id == m["message_id"])
-            .first()
-        )
-        if existing:
-            continue
-        row = EmailMessage(
-            account_id=acct.id,
-            thread_id=m["thread_id"],
-            message_id=m["message_id"],
-            from_addr=m["from_addr"],
-            to_addrs=m["to_addrs"],
-            cc_addrs=m["cc_addrs"],
-            date=m["date"],
-            subject=m["subject"],
-            body_text=m["body_text"],
-            body_html=m["body_html"],
-            has_attachments=m["has_attachments"],
-        )
-        db.add(row)
-        thr = (
-            db.query(EmailThread)
-            .filter(EmailThread.thread_id == m["thread_id"])
-            .first()
-        )
-        if not thr:
-            thr = EmailThread(
-                account_id=acct.id,
-                thread_id=m["thread_id"],
-                subject=m["subject"],
-                latest_from=m["from_addr"],
-                latest_snippet=m["snippet"],
-                updated_at=m["date"],
-            )
-            db.add(thr)
-        else:
-            thr.subject = thr.subject or m["subject"]
-            thr.latest_from = m["from_addr"]
-            thr.latest_snippet = m["snippet"]
-            thr.updated_at = max(thr.updated_at or m["date"], m["date"])
-        inserted += 1
-
-    db.commit()
-
-    _, chunks = index_messages(acct.id, norm_msgs)
-
-    state = db.query(SyncState).filter(SyncState.account_id == acct.id).first()
-    if not state:
-        state = SyncState(
-            account_id=acct.id,
-            last_synced_at=datetime.now(UTC),
-            total_messages=inserted,
-        )
-        db.add(state)
-    else:
-        state.last_synced_at = datetime.now(UTC)
-        state.total_messages = (state.total_messages or 0) + inserted
-    db.commit()
-
-    return {"synced": len(norm_msgs), "indexed_chunks": chunks}
+async def sync_latest(account_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Sync an account now (the first connected one without `account_id`)"""
+    acct = await resolve_account(db, account_id)
+    result = await sync_account(acct.id, acct.nylas_grant_id, acct.provider)
+    if result.error:
+        raise HTTPException(status_code=500, detail=result.error)
+
+    return {
+        "account_id": acct.id,
+        "synced": result.fetched,
+        "new_messages": result.inserted,
+        "indexed_chunks": result.chunks,
+        "next_sync_at": result.next_sync_at.isoformat() if result.next_sync_at else None,
+    }
+
+
+@router.get("/sync/scheduler")
+async def sync_scheduler(accounts: bool = Query(False, description="Include every account's next sync")):
+    """Fleet sync throughput, lag and in-flight syncs per provider"""
+    return get_sync_scheduler().stats(accounts=accounts)
+
+
+@router.get("/sync/digest")
+async def digest(
+    period: str = Query("today"),
+    account_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Materialized digest of an account for `today` or `this_week`"""
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+    acct = await resolve_account(db, account_id)
+
+    d = await asyncio.to_thread(get_digest, acct.id, period)
+    return {
+        "period": d.period,
+        "period_start": d.period_start.isoformat(),
+        "message_count": d.message_count,
+        "thread_count": d.thread_count,
+        "unread_count": d.unread_count,
+        "text": d.text,
+        "threads": d.items,
+    }
@@ -0,0 +1,69 @@
+"""Token usage and estimated cost rollups."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.accounts import resolve_account
+from database import get_async_db, UsageEvent
+
+router = APIRouter()
+
+
+@router.get("/usage")
+async def usage_rollup(
+    days: int = Query(7, ge=1, le=365),
+    group_by: Literal["stage", "model", "request_kind", "day"] = "stage",
+    account_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Token usage and estimated cost for an account (the first connected one
+    without `account_id`) over the last `days`, grouped by workflow stage,
+    model, request kind or day.
+    """
+    acct = await resolve_account(db, account_id)
+
+    key = func.date(UsageEvent.created_at) if group_by == "day" else getattr(UsageEvent, group_by)
+    rows = (
+        await db.execute(
+            select(
+                key.label("key"),
+                func.sum(UsageEvent.calls),
+                func.sum(UsageEvent.prompt_tokens),
+                func.sum(UsageEvent.completion_tokens),
+                func.sum(UsageEvent.cached_tokens),
+                func.sum(UsageEvent.cost_usd),
+            )
+            .where(
+                UsageEvent.account_id == acct.id,
+                UsageEvent.created_at >= datetime.utcnow() - timedelta(days=days),
+            )
+            .group_by(key)
+            .order_by(func.sum(UsageEvent.cost_usd).desc())
+        )
+    ).all()
+
+    items = [
+        {
+            group_by: row[0],
+            "calls": row[1] or 0,
+            "prompt_tokens": row[2] or 0,
+            "completion_tokens": row[3] or 0,
+            "cached_tokens": row[4] or 0,
+            "cached_ratio": round((row[4] or 0) / row[2], 4) if row[2] else 0.0,
+            "cost_usd": round(row[5] or 0.0, 6),
+        }
+        for row in rows
+    ]
+    return {
+        "days": days,
+        "group_by": group_by,
+        "items": items,
+        "total_cost_usd": round(sum(i["cost_usd"] for i in items), 6),
+    }
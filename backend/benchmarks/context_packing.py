@@ -0,0 +1,143 @@
+"""
+Prompt token reduction vs. answer quality for sentence-level context packing.
+
+Builds the same templated questions the eval endpoints use from the latest
+messages of the first connected account, retrieves contexts once per question,
+then answers each question twice: with the full contexts (no budget) and packed
+to the configured budget. Both answers are graded with the LLM judges.
+
+    python -m benchmarks.context_packing --limit 10 --budget 1500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from statistics import mean
+from typing import Any, Dict, List, Optional
+
+from config import load_config
+from database import SessionLocal, Account, EmailMessage
+from agents.chat_agent import ChatAgent
+from orchestrator.chat_workflow import search_contexts
+from services.context_packer import pack_contexts
+from services.eval.llm_judge import judge_faithfulness, judge_relevance
+from utils.template_loader import render_template
+from utils.tokens import count_tokens
+
+
+config = load_config()
+UNBOUNDED = 10 ** 9
+
+
+def build_samples(limit: int) -> tuple[int, List[Dict[str, str]]]:
+    db = SessionLocal()
+    try:
+        acct = db.query(Account).first()
+        if not acct:
+            raise SystemExit("No connected account")
+        msgs = (
+            db.query(EmailMessage)
+            .filter(EmailMessage.account_id == acct.id)
+            .order_by(EmailMessage.date.desc())
+            .limit(limit)
+            .all()
+        )
+        samples = []
+        for m in msgs:
+            sender_name = m.from_addr.split('@')[0] if m.from_addr and '@' in m.from_addr else (m.from_addr or "unknown")
+            samples.append({
+                "question": f"Do we have any updates from {sender_name}?",
+                "reference": f"Yes, there is an email from {m.from_addr} with subject: {m.subject}",
+            })
+            samples.append({
+                "question": f"What did {sender_name} send about?",
+                "reference": m.subject or "No subject",
+            })
+        return acct.id, samples
+    finally:
+        db.close()
+
+
+def prompt_tokens(question: str, context_text: str) -> int:
+    """Tokens of the rendered user prompt, as sent to the answer model"""
+    prompt = render_template(
+        "chat/email_question_prompt.j2",
+        context_text=context_text,
+        question=question,
+        today=datetime.now().strftime("%B %d, %Y"),
+    )
+    return count_tokens(prompt)
+
+
+async def run(limit: int, budget: int, top_k: int) -> Dict[str, Any]:
+    account_id, samples = build_samples(limit)
+    agent = ChatAgent()
+    rows = []
+
+    for sample in samples:
+        question = sample["question"]
+        contexts, q_emb = await search_contexts(account_id, question, top_k)
+        row: Dict[str, Any] = {"question": question}
+
+        for label, token_budget in (("full", UNBOUNDED), ("packed", budget)):
+            packed = await pack_contexts(contexts, question, token_budget, q_emb)
+            answer = await agent.generate_answer(
+                question, contexts, query_embedding=q_emb, token_budget=token_budget
+            )
+            faithfulness, relevance = await asyncio.gather(
+                judge_faithfulness(question, sample["reference"], answer),
+                judge_relevance(question, answer),
+            )
+            row[label] = {
+                "prompt_tokens": prompt_tokens(question, packed.text),
+                "faithfulness": faithfulness,
+                "relevance": relevance,
+            }
+        rows.append(row)
+
+    def summary(label: str) -> Optional[Dict[str, float]]:
+        if not rows:
+            return None
+        return {
+            "avg_prompt_tokens": round(mean(r[label]["prompt_tokens"] for r in rows), 1),
+            "faithfulness": round(mean(r[label]["faithfulness"] for r in rows), 3),
+            "relevance": round(mean(r[label]["relevance"] for r in rows), 3),
+        }
+
+    full, packed = summary("full"), summary("packed")
+    reduction = None
+    if full and full["avg_prompt_tokens"]:
+        reduction = round(1 - packed["avg_prompt_tokens"] / full["avg_prompt_tokens"], 3)
+
+    return {
+        "budget": budget,
+        "top_k": top_k,
+        "questions": len(rows),
+        "full": full,
+        "packed": packed,
+        "prompt_token_reduction": reduction,
+        "items": rows,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark sentence-level context packing")
+    parser.add_argument("--limit", type=int, default=10, help="Latest messages to build questions from")
+    parser.add_argument("--budget", type=int, default=config.context_token_budget)
+    parser.add_argument("--top-k", type=int, default=config.top_k)
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.limit, args.budget, args.top_k))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Offline load testing: synthetic mailboxes, stub OpenAI/Nylas servers and scripted scenarios"""
+
+from benchmarks.loadtest.mailbox import Mailbox
+
+__all__ = ["Mailbox"]
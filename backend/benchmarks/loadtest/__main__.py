@@ -0,0 +1,4 @@
+from benchmarks.loadtest.runner import main
+
+
+main()
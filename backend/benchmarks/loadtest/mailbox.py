@@ -0,0 +1,152 @@
+"""
+Deterministic synthetic mailbox.
+
+Messages are generated on demand from (seed, index), so a 1M-message mailbox
+costs no memory and every run of a benchmark sees byte-identical data. Bodies
+are realistic HTML: greeting, a few paragraphs, sometimes a list or a quoted
+reply, and a signature, which exercises the same HTML cleanup and quote
+stripping as real mail.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+FIRST_NAMES = [
+    "alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy",
+    "mallory", "nina", "oscar", "peggy", "quinn", "rupert", "sybil", "trent", "uma", "victor",
+]
+SENDER_DOMAINS = ["acme.com", "globex.io", "initech.net", "umbrella.org", "hooli.com", "stark.dev"]
+SERVICE_SENDERS = [
+    ("hr", "acme.com"), ("billing", "stripe.com"), ("noreply", "github.com"),
+    ("recruiting", "globex.io"), ("it-support", "acme.com"), ("travel", "expedia.com"),
+]
+TOPICS = [
+    ("Q3 budget review", "the budget for next quarter", ["spreadsheet", "forecast", "headcount"]),
+    ("Contract renewal", "the vendor contract renewal", ["pricing", "legal review", "signature"]),
+    ("Offsite planning", "the team offsite", ["venue", "agenda", "travel"]),
+    ("Invoice #{n}", "the outstanding invoice", ["payment terms", "due date", "PO number"]),
+    ("Benefits enrollment", "open enrollment for benefits", ["deadline", "dental", "401k"]),
+    ("Launch checklist", "the product launch", ["QA sign-off", "press release", "rollout"]),
+    ("Interview schedule", "the candidate interviews", ["panel", "feedback", "offer"]),
+    ("Flight confirmation", "your upcoming trip", ["itinerary", "seat", "check-in"]),
+    ("Security update", "the password rotation", ["SSO", "laptop", "VPN"]),
+    ("Weekly sync notes", "this week's sync", ["action items", "blockers", "owners"]),
+]
+SENTENCES = [
+    "Following up on {topic}, I wanted to share where things stand.",
+    "Could you take a look at the {detail} before {day}?",
+    "We still need a decision on the {detail}.",
+    "I've attached the latest version of the {detail} for reference.",
+    "Let me know if {day} works for a quick call about {topic}.",
+    "The {detail} changed since last time, so please double-check it.",
+    "Thanks again for the help with {topic}.",
+    "Nothing is blocked right now, but the {detail} is the riskiest part.",
+    "I looped in the rest of the team so everyone has the same context on {topic}.",
+    "Please confirm the {detail} by end of day {day}.",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+
+@dataclass(frozen=True)
+class Mailbox:
+    """`size` messages for `grant_id`, spread over `span_days` ending at `end`"""
+    size: int
+    seed: int = 7
+    grant_id: str = "loadtest-grant"
+    email: str = "me@loadtest.dev"
+    span_days: int = 365
+    end: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages_per_thread: int = 4
+
+    def message(self, index: int) -> Dict[str, Any]:
+        """Message `index` in Nylas v3 format; index 0 is the newest"""
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        rng = random.Random(self.seed * 1_000_003 + index)
+        thread = index // self.messages_per_thread
+        trng = random.Random(self.seed * 7_919 + thread)
+
+        subject_tpl, topic, details = TOPICS[trng.randrange(len(TOPICS))]
+        subject = subject_tpl.format(n=1000 + thread % 9000)
+        if index % self.messages_per_thread:
+            subject = f"Re: {subject}"
+        sender = self.sender(trng.randrange(len(FIRST_NAMES) + len(SERVICE_SENDERS)))
+
+        date = self.end - timedelta(seconds=index * self.span_days * 86400 / max(1, self.size))
+        body = self._body(rng, topic, details, sender[0], quoted=index % self.messages_per_thread > 0)
+        return {
+            "id": f"msg-{self.seed}-{index}",
+            "grant_id": self.grant_id,
+            "thread_id": f"thr-{self.seed}-{thread}",
+            "subject": subject,
+            "from": [{"name": sender[0].title(), "email": sender[1]}],
+            "to": [{"name": "Me", "email": self.email}],
+            "cc": [{"email": self.sender(rng.randrange(len(FIRST_NAMES)))[1]}] if rng.random() < 0.2 else [],
+            "date": int(date.timestamp()),
+            "snippet": f"Following up on {topic}",
+            "body": body,
+            "has_attachments": rng.random() < 0.15,
+            "unread": rng.random() < 0.3,
+            # Every 20th message sits in the trash (no rng draw, so the rest of the mailbox is unchanged)
+            "folders": ["TRASH"] if index % 20 == 19 else ["INBOX"],
+        }
+
+    def sender(self, n: int) -> Tuple[str, str]:
+        """(display name, address) for sender number `n`"""
+        if n < len(FIRST_NAMES):
+            name = FIRST_NAMES[n]
+            return name, f"{name}@{SENDER_DOMAINS[n % len(SENDER_DOMAINS)]}"
+        local, domain = SERVICE_SENDERS[(n - len(FIRST_NAMES)) % len(SERVICE_SENDERS)]
+        return local, f"{local}@{domain}"
+
+    def page(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Messages [offset, offset+limit) and the next offset, if any"""
+        end = min(self.size, offset + limit)
+        messages = [self.message(i) for i in range(offset, end)]
+        return messages, (end if end < self.size else None)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.size):
+            yield self.message(i)
+
+    def questions(self, count: int, seed: Optional[int] = None) -> List[str]:
+        """Questions a user of this mailbox would plausibly ask"""
+        rng = random.Random(self.seed if seed is None else seed)
+        templates = [
+            "Do we have any updates from {name}?",
+            "What did {name} send about?",
+            "Any emails about {topic}?",
+            "When is the deadline for {topic}?",
+            "Summarize the thread about {topic}",
+            "What did {name} say about the {detail}?",
+        ]
+        questions = []
+        for _ in range(count):
+            name = self.sender(rng.randrange(len(FIRST_NAMES) + len(SERVICE_SENDERS)))[0]
+            _, topic, details = TOPICS[rng.randrange(len(TOPICS))]
+            questions.append(rng.choice(templates).format(name=name, topic=topic, detail=rng.choice(details)))
+        return questions
+
+    def _body(self, rng: random.Random, topic: str, details: List[str], sender: str, quoted: bool) -> str:
+        def sentence() -> str:
+            return rng.choice(SENTENCES).format(topic=topic, detail=rng.choice(details), day=rng.choice(DAYS))
+
+        parts = ["<html><body>", "<p>Hi,</p>"]
+        for _ in range(rng.randint(1, 4)):
+            parts.append("<p>" + " ".join(sentence() for _ in range(rng.randint(2, 5))) + "</p>")
+        if rng.random() < 0.3:
+            parts.append("<ul>" + "".join(f"<li>{d.capitalize()}</li>" for d in details) + "</ul>")
+        parts.append(f"<p>Best,<br>{sender.title()}</p>")
+        parts.append("<div class=\"signature\">--<br>Sent from my phone</div>")
+        if quoted:
+            parts.append(
+                "<blockquote>On " + rng.choice(DAYS) + ", someone wrote:<br>"
+                + " ".join(sentence() for _ in range(3)) + "</blockquote>"
+            )
+        parts.append("</body></html>")
+        return "".join(parts)
@@ -0,0 +1,424 @@
+"""
+Scripted load scenarios against a running backend, with JSON reports.
+
+Fully offline, one command (spawns the stub server and a backend on a temp
+storage directory, seeds the account, runs, tears everything down):
+
+    python -m benchmarks.loadtest run --spawn --scenario mixed --concurrency 16 \\
+        --duration 60 --messages 5000 --out reports/mixed.json
+
+Against an already running backend (pointed at the stubs, see stubs.py):
+
+    python -m benchmarks.loadtest seed
+    python -m benchmarks.loadtest run --target http://127.0.0.1:8000 --scenario chat
+
+Compare two reports (p50/p95/p99 and throughput per endpoint):
+
+    python -m benchmarks.loadtest compare reports/before.json reports/after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.loadtest.mailbox import Mailbox
+
+
+REPORT_SCHEMA = "loadtest/v1"
+SCENARIOS = {
+    "chat": {"/chat": 1.0},
+    "chat_stream": {"/chat/stream": 1.0},
+    "sync": {"/sync/latest": 1.0},
+    "mixed": {"/chat": 0.7, "/chat/stream": 0.25, "/sync/latest": 0.05},
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[rank], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(values)
+    return {
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "mean": round(sum(ordered) / len(ordered), 2) if ordered else None,
+        "max": round(ordered[-1], 2) if ordered else None,
+    }
+
+
+@dataclass
+class EndpointStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    ttft_ms: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, status: str, latency_ms: float, ok: bool, ttft_ms: Optional[float] = None) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if ok:
+            self.latencies_ms.append(latency_ms)
+            if ttft_ms is not None:
+                self.ttft_ms.append(ttft_ms)
+        else:
+            self.errors += 1
+
+    def report(self, elapsed_s: float) -> Dict[str, Any]:
+        ok = len(self.latencies_ms)
+        out: Dict[str, Any] = {
+            "requests": ok + self.errors,
+            "ok": ok,
+            "errors": self.errors,
+            "status": dict(sorted(self.statuses.items())),
+            "throughput_rps": round(ok / elapsed_s, 3) if elapsed_s else 0.0,
+            "latency_ms": summarize(self.latencies_ms),
+        }
+        if self.ttft_ms:
+            out["ttft_ms"] = summarize(self.ttft_ms)
+        return out
+
+
+class LoadRun:
+    def __init__(
+        self,
+        target: str,
+        scenario: str,
+        questions: List[str],
+        repeat_ratio: float,
+        seed: int,
+        timeout: float,
+    ) -> None:
+        self.target = target.rstrip("/")
+        self.weights = SCENARIOS[scenario]
+        self.questions = questions
+        self.repeat_ratio = repeat_ratio
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.stats: Dict[str, EndpointStats] = {path: EndpointStats() for path in self.weights}
+        self._recent: List[str] = []
+
+    def _pick_endpoint(self) -> str:
+        return self.rng.choices(list(self.weights), weights=list(self.weights.values()))[0]
+
+    def _pick_question(self) -> str:
+        # Repeats exercise the answer cache and request coalescing
+        if self._recent and self.rng.random() < self.repeat_ratio:
+            return self.rng.choice(self._recent)
+        question = self.rng.choice(self.questions)
+        self._recent = (self._recent + [question])[-20:]
+        return question
+
+    async def _one(self, client: httpx.AsyncClient) -> None:
+        path = self._pick_endpoint()
+        stats = self.stats[path]
+        start = time.perf_counter()
+        ttft = None
+        try:
+            if path == "/sync/latest":
+                resp = await client.post(path)
+                status, ok = str(resp.status_code), resp.status_code == 200
+            elif path == "/chat":
+                resp = await client.post(path, json={"question": self._pick_question()})
+                status, ok = str(resp.status_code), resp.status_code == 200
+            else:
+                ok, status = False, "no_done"
+                async with client.stream("POST", path, json={"question": self._pick_question()}) as resp:
+                    status = str(resp.status_code)
+                    event = None
+                    async for line in resp.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                            if event == "token" and ttft is None:
+                                ttft = (time.perf_counter() - start) * 1000
+                        elif event == "done" and line.startswith("data:"):
+                            ok = resp.status_code == 200
+                        elif event == "error" and line.startswith("data:"):
+                            status = "stream_error"
+                    if resp.status_code == 200 and not ok and status != "stream_error":
+                        status = "no_done"
+        except httpx.TimeoutException:
+            status, ok = "timeout", False
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        stats.record(status, (time.perf_counter() - start) * 1000, ok, ttft)
+
+    async def run(self, concurrency: int, duration: Optional[float], requests: Optional[int], rate: Optional[float]) -> float:
+        """Closed loop with `concurrency` workers, or open loop at `rate` req/s when given"""
+        limits = httpx.Limits(max_connections=max(concurrency, 1) * 2, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.target, timeout=self.timeout, limits=limits) as client:
+            start = time.perf_counter()
+            deadline = start + duration if duration else None
+            remaining = [requests] if requests else None
+
+            def more() -> bool:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return False
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return False
+                    remaining[0] -= 1
+                return True
+
+            if rate:
+                semaphore = asyncio.Semaphore(concurrency)
+                tasks = []
+
+                async def bounded() -> None:
+                    async with semaphore:
+                        await self._one(client)
+
+                next_at = start
+                while more():
+                    tasks.append(asyncio.create_task(bounded()))
+                    next_at += 1.0 / rate
+                    await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                await asyncio.gather(*tasks)
+            else:
+                async def worker() -> None:
+                    while more():
+                        await self._one(client)
+
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return time.perf_counter() - start
+
+
+def _git_sha() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def build_report(run: LoadRun, elapsed: float, label: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    endpoints = {path: s.report(elapsed) for path, s in run.stats.items()}
+    all_latencies = [v for s in run.stats.values() for v in s.latencies_ms]
+    total_ok = sum(e["ok"] for e in endpoints.values())
+    return {
+        "schema": REPORT_SCHEMA,
+        "label": label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_sha": _git_sha(),
+        "python": platform.python_version(),
+        "target": run.target,
+        "settings": settings,
+        "elapsed_s": round(elapsed, 3),
+        "totals": {
+            "requests": sum(e["requests"] for e in endpoints.values()),
+            "ok": total_ok,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": round(total_ok / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": summarize(all_latencies),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-endpoint relative change of throughput and latency percentiles (new vs base)"""
+    def delta(a: Optional[float], b: Optional[float]) -> Optional[float]:
+        return round((b - a) / a, 4) if a and b is not None else None
+
+    out: Dict[str, Any] = {}
+    for path in sorted(set(base["endpoints"]) | set(new["endpoints"])):
+        a, b = base["endpoints"].get(path), new["endpoints"].get(path)
+        if not a or not b:
+            continue
+        row = {"throughput_rps": {"base": a["throughput_rps"], "new": b["throughput_rps"], "change": delta(a["throughput_rps"], b["throughput_rps"])}}
+        for key in ("latency_ms", "ttft_ms"):
+            if key in a and key in b:
+                row[key] = {
+                    p: {"base": a[key][p], "new": b[key][p], "change": delta(a[key][p], b[key][p])}
+                    for p in ("p50", "p95", "p99")
+                }
+        row["error_rate"] = {
+            "base": round(a["errors"] / a["requests"], 4) if a["requests"] else 0.0,
+            "new": round(b["errors"] / b["requests"], 4) if b["requests"] else 0.0,
+        }
+        out[path] = row
+    return {"base": base.get("label"), "new": new.get("label"), "endpoints": out}
+
+
+def seed_account(mailbox: Mailbox) -> None:
+    """Create the connected account the backend endpoints expect, pointing at the stub grant"""
+    from database import engine, upgrade_schema, SessionLocal, Account
+
+    upgrade_schema(engine)
+    db = SessionLocal()
+    try:
+        if not db.query(Account).filter(Account.nylas_grant_id == mailbox.grant_id).first():
+            db.add(Account(email=mailbox.email, nylas_grant_id=mailbox.grant_id, access_token="stub", provider="stub"))
+            db.commit()
+    finally:
+        db.close()
+
+
+async def _wait_healthy(url: str, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+class Spawned:
+    """Stub server + backend subprocesses on a throwaway storage directory"""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.tmp = tempfile.TemporaryDirectory(prefix="loadtest-")
+        self.procs: List[subprocess.Popen] = []
+        stub = f"http://127.0.0.1:{args.stub_port}"
+        self.env = {
+            **os.environ,
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": f"{stub}/v1",
+            "NYLAS_API_URI": stub,
+            "NYLAS_CLIENT_SECRET": "stub",
+            "SQLITE_PATH": str(Path(self.tmp.name) / "app.db"),
+            "CHROMA_DIR": str(Path(self.tmp.name) / "chroma"),
+            "INTENT_LOG_PATH": str(Path(self.tmp.name) / "intent_log.jsonl"),
+            "INTENT_CLASSIFIER_PATH": str(Path(self.tmp.name) / "intent_classifier.joblib"),
+        }
+        self.target = f"http://127.0.0.1:{args.backend_port}"
+
+    async def __aenter__(self) -> "Spawned":
+        a = self.args
+        self.procs.append(subprocess.Popen([
+            sys.executable, "-m", "benchmarks.loadtest.stubs", "--port", str(a.stub_port),
+            "--messages", str(a.messages), "--chat-latency-ms", str(a.chat_latency_ms),
+            "--token-ms", str(a.token_ms), "--embed-latency-ms", str(a.embed_latency_ms),
+            "--nylas-latency-ms", str(a.nylas_latency_ms),
+        ], env=self.env))
+        await _wait_healthy(f"http://127.0.0.1:{a.stub_port}/stats")
+        subprocess.run([sys.executable, "-m", "benchmarks.loadtest", "seed", "--messages", str(a.messages)], env=self.env, check=True)
+        self.procs.append(subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(a.backend_port), "--log-level", "warning",
+        ], env=self.env))
+        await _wait_healthy(f"{self.target}/health")
+        if a.warm_sync:
+            async with httpx.AsyncClient(base_url=self.target, timeout=300) as client:
+                (await client.post("/sync/latest")).raise_for_status()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        for proc in reversed(self.procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.tmp.cleanup()
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    mailbox = Mailbox(size=args.messages, seed=args.seed)
+    questions = mailbox.questions(args.questions)
+    settings = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "requests": args.requests,
+        "rate_rps": args.rate,
+        "repeat_ratio": args.repeat_ratio,
+        "questions": args.questions,
+        "messages": args.messages,
+        "seed": args.seed,
+        "spawned": args.spawn,
+    }
+
+    async def go(target: str) -> Dict[str, Any]:
+        run = LoadRun(target, args.scenario, questions, args.repeat_ratio, args.seed, args.timeout)
+        elapsed = await run.run(args.concurrency, args.duration, args.requests, args.rate)
+        return build_report(run, elapsed, args.label or args.scenario, settings)
+
+    if args.spawn:
+        settings["stub_latency_ms"] = {
+            "chat": args.chat_latency_ms, "token": args.token_ms,
+            "embed": args.embed_latency_ms, "nylas": args.nylas_latency_ms,
+        }
+        async with Spawned(args) as spawned:
+            return await go(spawned.target)
+    return await go(args.target)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline load tests for the chat/sync API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="Run a load scenario and write a JSON report")
+    run_cmd.add_argument("--target", default="http://127.0.0.1:8000")
+    run_cmd.add_argument("--scenario", choices=sorted(SCENARIOS), default="chat")
+    run_cmd.add_argument("--concurrency", type=int, default=8)
+    run_cmd.add_argument("--duration", type=float, default=30.0, help="Seconds (ignored when --requests is set)")
+    run_cmd.add_argument("--requests", type=int, default=None, help="Stop after this many requests")
+    run_cmd.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate (req/s) instead of closed loop")
+    run_cmd.add_argument("--questions", type=int, default=200, help="Distinct questions in the workload")
+    run_cmd.add_argument("--repeat-ratio", type=float, default=0.2, help="Share of requests repeating a recent question")
+    run_cmd.add_argument("--messages", type=int, default=5000, help="Synthetic mailbox size")
+    run_cmd.add_argument("--seed", type=int, default=7)
+    run_cmd.add_argument("--timeout", type=float, default=120.0)
+    run_cmd.add_argument("--label", default=None)
+    run_cmd.add_argument("--out", default=None, help="Write the JSON report here")
+    run_cmd.add_argument("--spawn", action="store_true", help="Start stubs and a backend on a temp directory")
+    run_cmd.add_argument("--warm-sync", action=argparse.BooleanOptionalAction, default=True, help="Sync once before measuring (--spawn)")
+    run_cmd.add_argument("--stub-port", type=int, default=9100)
+    run_cmd.add_argument("--backend-port", type=int, default=8100)
+    run_cmd.add_argument("--chat-latency-ms", type=float, default=400.0)
+    run_cmd.add_argument("--token-ms", type=float, default=15.0)
+    run_cmd.add_argument("--embed-latency-ms", type=float, default=80.0)
+    run_cmd.add_argument("--nylas-latency-ms", type=float, default=150.0)
+
+    seed_cmd = sub.add_parser("seed", help="Create the stub account in the backend database")
+    seed_cmd.add_argument("--messages", type=int, default=5000)
+    seed_cmd.add_argument("--seed", type=int, default=7)
+
+    cmp_cmd = sub.add_parser("compare", help="Compare two JSON reports")
+    cmp_cmd.add_argument("base")
+    cmp_cmd.add_argument("new")
+
+    args = parser.parse_args(argv)
+    if args.command == "seed":
+        seed_account(Mailbox(size=args.messages, seed=args.seed))
+        return
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        print(json.dumps(compare(base, new), indent=2))
+        return
+
+    if args.requests:
+        args.duration = None
+    report = asyncio.run(_run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,300 @@
+"""
+Local stand-ins for the OpenAI and Nylas APIs.
+
+One Starlette app serves both, so the backend can be benchmarked without API
+keys or spend by pointing it at this server:
+
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    NYLAS_API_URI=http://127.0.0.1:9100
+
+    python -m benchmarks.loadtest.stubs --port 9100 --messages 10000 \\
+        --chat-latency-ms 400 --token-ms 15 --embed-latency-ms 80 --nylas-latency-ms 150
+
+OpenAI: `/v1/embeddings` returns deterministic bag-of-words hash vectors (so
+similar texts are near each other and retrieval behaves plausibly), and
+`/v1/chat/completions` answers structured-output tool calls for the intent
+router and answer agents, streamed or not, with plain "1" for judge prompts.
+Nylas: grant lookup, token exchange and cursor-paginated message listing over
+a synthetic mailbox.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from benchmarks.loadtest.mailbox import Mailbox
+
+
+EMBEDDING_DIMS = 256
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MESSAGE_ID_RE = re.compile(r"message_id=([\w.-]+)")
+
+
+@dataclass
+class StubSettings:
+    chat_latency_ms: float = 400.0  # time to first token
+    token_ms: float = 15.0  # per streamed chunk
+    answer_words: int = 60
+    embed_latency_ms: float = 80.0
+    nylas_latency_ms: float = 150.0
+    jitter: float = 0.2  # +/- fraction applied to every latency
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def embed(text: str) -> np.ndarray:
+    """Unit vector from hashed lowercase words"""
+    vec = np.zeros(EMBEDDING_DIMS, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vec[h % EMBEDDING_DIMS] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    if norm == 0:
+        vec[0] = 1.0
+        return vec
+    return vec / norm
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _schema_value(schema: Dict[str, Any]) -> Any:
+    """Minimal value satisfying a JSON schema fragment"""
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "anyOf" in schema:
+        return _schema_value(schema["anyOf"][0])
+    kind = schema.get("type")
+    if kind == "object":
+        props = schema.get("properties", {})
+        return {k: _schema_value(props[k]) for k in schema.get("required", []) if k in props}
+    return {"string": "stub", "integer": 1, "number": 1.0, "boolean": True, "array": [], "null": None}.get(kind, "stub")
+
+
+class StubServer:
+    def __init__(self, mailbox: Mailbox, settings: StubSettings) -> None:
+        self.mailbox = mailbox
+        self.settings = settings
+        self.requests: Dict[str, int] = {}
+        self.app = Starlette(routes=[
+            Route("/v1/embeddings", self.embeddings, methods=["POST"]),
+            Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/v3/connect/token", self.nylas_token, methods=["POST"]),
+            Route("/v3/grants/{grant_id}", self.nylas_grant, methods=["GET"]),
+            Route("/v3/grants/{grant_id}/messages", self.nylas_messages, methods=["GET"]),
+            Route("/stats", self.stats, methods=["GET"]),
+        ])
+
+    async def _delay(self, ms: float) -> None:
+        if ms > 0:
+            await asyncio.sleep(ms / 1000 * random.uniform(1 - self.settings.jitter, 1 + self.settings.jitter))
+
+    def _count(self, name: str) -> Optional[JSONResponse]:
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if self.settings.error_rate and random.random() < self.settings.error_rate:
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+        return None
+
+    # OpenAI
+
+    async def embeddings(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        failure = self._count("openai.embeddings")
+        await self._delay(self.settings.embed_latency_ms)
+        if failure:
+            return failure
+
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            vec = embed(text if isinstance(text, str) else " ".join(map(str, text)))
+            value = base64.b64encode(vec.astype("<f4").tobytes()).decode() if body.get("encoding_format") == "base64" else vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": value})
+        prompt_tokens = sum(_tokens(t) for t in inputs if isinstance(t, str))
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    def _completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Tool name + arguments (structured output) or plain text for this request"""
+        messages = body.get("messages", [])
+        prompt = "\n".join(_message_text(m) for m in messages)
+        last_user = next((_message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        tools = body.get("tools") or []
+        if not tools:
+            return {"text": "1", "prompt": prompt}
+
+        function = tools[0]["function"]
+        props = function.get("parameters", {}).get("properties", {})
+        if "route_to" in props:
+            greeting = bool(re.match(r"\s*(hi|hello|hey|thanks)\b", last_user.lower())) and len(last_user) < 40
+            args = {
+                "intent_type": "simple" if greeting else "email_query",
+                "needs_retrieval": not greeting,
+                "route_to": "output" if greeting else "retrieve",
+                "reason": "stub router",
+            }
+            if greeting:
+                args["simple_response"] = "Hi! Ask me anything about your email."
+        elif "answer" in props:
+            cited = list(dict.fromkeys(_MESSAGE_ID_RE.findall(prompt)))[:3]
+            words = _WORD_RE.findall(last_user.lower()) or ["email"]
+            rng = random.Random(last_user)
+            answer = " ".join(rng.choice(words + ["the", "team", "update", "thread", "reply"]) for _ in range(self.settings.answer_words))
+            args = {"answer": answer.capitalize() + ".", "confidence": "high", "cited_message_ids": cited}
+        else:
+            args = _schema_value(function.get("parameters", {}))
+        return {"tool": function["name"], "arguments": json.dumps(args), "prompt": prompt}
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        failure = self._count("openai.chat")
+        if failure:
+            await self._delay(self.settings.chat_latency_ms)
+            return failure
+
+        result = self._completion(body)
+        content = result.get("arguments") or result.get("text", "")
+        usage = {
+            "prompt_tokens": _tokens(result["prompt"]),
+            "completion_tokens": _tokens(content),
+            "total_tokens": _tokens(result["prompt"]) + _tokens(content),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "gpt-stub")}
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(self._stream(base, result, usage if include_usage else None), media_type="text/event-stream")
+
+        await self._delay(self.settings.chat_latency_ms)
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if "tool" in result:
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": result["tool"], "arguments": result["arguments"]},
+            }]
+            finish = "tool_calls"
+        else:
+            message["content"] = result["text"]
+            finish = "stop"
+        return JSONResponse({
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+            "usage": usage,
+        })
+
+    async def _stream(self, base: Dict[str, Any], result: Dict[str, Any], usage: Optional[Dict[str, Any]]) -> AsyncIterator[bytes]:
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra: Any) -> bytes:
+            payload = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        await self._delay(self.settings.chat_latency_ms)
+        if "tool" in result:
+            yield chunk({"role": "assistant", "tool_calls": [{
+                "index": 0, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": result["tool"], "arguments": ""},
+            }]})
+            args = result["arguments"]
+            for i in range(0, len(args), 16):
+                await self._delay(self.settings.token_ms)
+                yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": args[i:i + 16]}}]})
+            yield chunk({}, "tool_calls")
+        else:
+            yield chunk({"role": "assistant", "content": result["text"]})
+            yield chunk({}, "stop")
+        if usage:
+            yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    # Nylas
+
+    async def nylas_token(self, request: Request) -> JSONResponse:
+        self._count("nylas.token")
+        await self._delay(self.settings.nylas_latency_ms)
+        return JSONResponse({"grant_id": self.mailbox.grant_id, "access_token": "stub-token", "email": self.mailbox.email})
+
+    async def nylas_grant(self, request: Request) -> JSONResponse:
+        failure = self._count("nylas.grant")
+        await self._delay(self.settings.nylas_latency_ms)
+        if failure:
+            return failure
+        return JSONResponse({"data": {"id": request.path_params["grant_id"], "email": self.mailbox.email, "provider": "stub"}})
+
+    async def nylas_messages(self, request: Request) -> JSONResponse:
+        failure = self._count("nylas.messages")
+        await self._delay(self.settings.nylas_latency_ms)
+        if failure:
+            return failure
+        limit = min(200, int(request.query_params.get("limit", 50)))
+        offset = int(request.query_params.get("page_token") or 0)
+        messages, next_offset = self.mailbox.page(offset, limit)
+        payload: Dict[str, Any] = {"request_id": uuid.uuid4().hex, "data": messages}
+        if next_offset is not None:
+            payload["next_cursor"] = str(next_offset)
+        return JSONResponse(payload)
+
+    async def stats(self, request: Request) -> JSONResponse:
+        return JSONResponse({"requests": self.requests, "mailbox_size": self.mailbox.size})
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub OpenAI + Nylas server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--messages", type=int, default=10_000, help="Synthetic mailbox size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chat-latency-ms", type=float, default=StubSettings.chat_latency_ms)
+    parser.add_argument("--token-ms", type=float, default=StubSettings.token_ms)
+    parser.add_argument("--answer-words", type=int, default=StubSettings.answer_words)
+    parser.add_argument("--embed-latency-ms", type=float, default=StubSettings.embed_latency_ms)
+    parser.add_argument("--nylas-latency-ms", type=float, default=StubSettings.nylas_latency_ms)
+    parser.add_argument("--jitter", type=float, default=StubSettings.jitter)
+    parser.add_argument("--error-rate", type=float, default=StubSettings.error_rate)
+    args = parser.parse_args(argv)
+
+    settings = StubSettings(
+        chat_latency_ms=args.chat_latency_ms,
+        token_ms=args.token_ms,
+        answer_words=args.answer_words,
+        embed_latency_ms=args.embed_latency_ms,
+        nylas_latency_ms=args.nylas_latency_ms,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    server = StubServer(Mailbox(size=args.messages, seed=args.seed), settings)
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Microbenchmarks for the per-message text, chunking and normalization hot paths"""
@@ -0,0 +1,4 @@
+from benchmarks.micro.runner import main
+
+
+main()
@@ -0,0 +1,133 @@
+"""
+Fixed corpus of real-shaped email bodies for the microbenchmarks.
+
+The bulk comes from the deterministic load-test mailbox; on top of that are
+hand-written bodies for the shapes that dominate cost in real inboxes: Outlook
+HTML with conditional comments and inline styles, Gmail replies with nested
+quotes, table-heavy newsletters, long plain-text threads with CRLF line
+endings and non-ASCII text. Nothing depends on the clock or the environment,
+so the same `fingerprint()` means the same bytes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from benchmarks.loadtest.mailbox import Mailbox
+
+
+OUTLOOK = """<html xmlns:o="urn:schemas-microsoft-com:office:office"><head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<style>@font-face {{font-family:"Calibri";}} p.MsoNormal {{margin:0cm;font-size:11.0pt;font-family:"Calibri",sans-serif;}}
+div.WordSection1 {{page:WordSection1;}}</style>
+<!--[if gte mso 9]><xml><o:shapedefaults v:ext="edit" spidmax="1026" /></xml><![endif]-->
+</head><body lang="EN-US" link="#0563C1"><div class="WordSection1">
+<p class="MsoNormal">Hi {name},<o:p></o:p></p><p class="MsoNormal"><o:p>&nbsp;</o:p></p>
+{paragraphs}
+<p class="MsoNormal">Thanks,<o:p></o:p></p><p class="MsoNormal">{sender}<o:p></o:p></p>
+<p class="MsoNormal"><span style="font-size:9.0pt;color:#7F7F7F">--<br>{sender} | Finance Operations<br>
+Acme Corp · 1 Market St · San Francisco<o:p></o:p></span></p>
+<div style="border:none;border-top:solid #E1E1E1 1.0pt;padding:3.0pt 0cm 0cm 0cm">
+<p class="MsoNormal"><b>From:</b> {name} &lt;{name}@globex.io&gt;<br><b>Sent:</b> Monday, March 3, 2025 9:14 AM<br>
+<b>Subject:</b> RE: Q3 budget review<o:p></o:p></p></div>
+<blockquote style="margin-left:30pt">{quoted}</blockquote>
+</div></body></html>"""
+
+GMAIL_REPLY = """<div dir="ltr">{paragraphs}<br clear="all"><div><br></div>-- <br>
+<div dir="ltr" class="gmail_signature"><div>{sender}</div><div>Sent from Gmail</div></div></div><br>
+<div class="gmail_quote"><div dir="ltr" class="gmail_attr">On Tue, Feb 4, 2025 at 10:02 AM {name} &lt;{name}@acme.com&gt; wrote:<br></div>
+<blockquote class="gmail_quote" style="margin:0px 0px 0px 0.8ex;border-left:1px solid rgb(204,204,204);padding-left:1ex">
+{quoted}</blockquote></div>"""
+
+NEWSLETTER_ROW = """<tr><td style="padding:16px 24px;font-family:Helvetica,Arial,sans-serif;font-size:14px;line-height:20px;color:#333333">
+<table role="presentation" width="100%" cellpadding="0" cellspacing="0"><tr>
+<td width="120" valign="top"><img src="https://cdn.example.com/img/{i}.png" width="120" alt="Story {i}"></td>
+<td valign="top" style="padding-left:16px"><h3 style="margin:0 0 8px 0">{title}</h3><p style="margin:0">{text}</p>
+<a href="https://news.example.com/r/{i}?utm_source=newsletter&amp;utm_medium=email" style="color:#1a73e8">Read more &rarr;</a></td>
+</tr></table></td></tr>"""
+
+NEWSLETTER = """<!DOCTYPE html><html><head><style>@media only screen and (max-width:600px){{.col{{width:100%!important}}}}</style></head>
+<body style="margin:0;padding:0;background:#f4f4f4"><center><table role="presentation" width="600" cellpadding="0" cellspacing="0" style="background:#ffffff">
+{rows}
+<tr><td style="font-size:11px;color:#999999;padding:24px">You are receiving this because you subscribed. <a href="https://news.example.com/unsubscribe">Unsubscribe</a> ·
+Example Media, 123 Main Street, Springfield</td></tr></table></center></body></html>"""
+
+NON_ASCII = """<p>Bonjour Zoë,</p><p>Merci pour le récapitulatif — on se voit à Zürich jeudi ? Le café près de la gare 🚆 me va très bien.
+Pour le budget : 12 500 € HT, TVA 20 %. Ça reste dans l'enveloppe prévue.</p>
+<p>日本チームからの返信はまだありません。来週もう一度確認します。</p><p>Привет команде! 👋</p><p>— Søren Østergaard</p>"""
+
+
+def _paragraphs(box: Mailbox, index: int, count: int) -> str:
+    """Reuse the mailbox's sentence generator for hand-written templates"""
+    body = box.message(index)["body"]
+    paras = [p for p in body.split("<p>")[2:] if p and not p.startswith("Best,")]
+    return "".join(f"<p class=\"MsoNormal\">{p.split('</p>')[0]}</p>" for p in (paras * count)[:count])
+
+
+def _plain_thread(box: Mailbox, depth: int) -> str:
+    """Plain-text body with CRLF line endings and `depth` levels of quoted replies"""
+    lines = ["Hi all,", "", "See the notes below and let me know what you think.", "", "-- ", "Dave", ""]
+    for level in range(depth):
+        sender = box.sender(level)[0].title()
+        lines.append(f"On Mon, Jan {level + 1}, 2025 at 9:{level:02d} AM {sender} <{sender.lower()}@acme.com> wrote:")
+        text = box.message(level)["snippet"] + ". " + _strip_tags(box.message(level)["body"])[:400]
+        lines.extend("> " * (level + 1) + text[i:i + 76] for i in range(0, len(text), 76))
+        lines.append("")
+    return "\r\n".join(lines)
+
+
+def _strip_tags(html: str) -> str:
+    out, inside = [], False
+    for ch in html:
+        if ch == "<":
+            inside = True
+        elif ch == ">":
+            inside = False
+            out.append(" ")
+        elif not inside:
+            out.append(ch)
+    return " ".join("".join(out).split())
+
+
+def _message(box: Mailbox, index: int, body: str) -> Dict[str, Any]:
+    msg = box.message(index)
+    msg["body"] = body
+    return msg
+
+
+@lru_cache(maxsize=4)
+def build_corpus(size: int = 200, seed: int = 11) -> List[Dict[str, Any]]:
+    """`size` generated messages plus the hand-written shapes, in Nylas v3 format"""
+    box = Mailbox(size=max(size, 64), seed=seed)
+    messages = [box.message(i) for i in range(size)]
+
+    for i in range(8):
+        name, sender = box.sender(i)[0], box.sender(i + 3)[0].title()
+        messages.append(_message(box, i, OUTLOOK.format(
+            name=name, sender=sender, paragraphs=_paragraphs(box, i, 3 + i),
+            quoted=_paragraphs(box, i + 8, 4),
+        )))
+        messages.append(_message(box, i + 8, GMAIL_REPLY.format(
+            name=name, sender=sender, paragraphs=_paragraphs(box, i + 16, 2),
+            quoted=GMAIL_REPLY.format(name=sender, sender=name, paragraphs=_paragraphs(box, i + 24, 3), quoted=""),
+        )))
+    for i in range(4):
+        rows = "".join(
+            NEWSLETTER_ROW.format(i=j, title=box.message(j)["subject"], text=_strip_tags(box.message(j)["body"])[:300])
+            for j in range(i * 10, i * 10 + 25)
+        )
+        messages.append(_message(box, 32 + i, NEWSLETTER.format(rows=rows)))
+    for depth in (2, 6, 12, 24):
+        messages.append(_message(box, 40 + depth, _plain_thread(box, depth)))
+    messages.append(_message(box, 48, NON_ASCII))
+    messages.append(_message(box, 49, ""))
+    return messages
+
+
+def fingerprint(messages: List[Dict[str, Any]]) -> str:
+    """Stable hash of the corpus, so reports from different corpora aren't compared"""
+    blob = json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:12]
@@ -0,0 +1,323 @@
+"""
+Microbenchmarks for the per-message sync hot paths.
+
+Each benchmark runs one function over every input derived from the fixed
+corpus. Loops are calibrated so one sample takes at least `--min-time`, the
+GC is paused while timing (as timeit does), and `--repeats` samples are kept
+so a comparison can test for a real shift instead of trusting one number:
+a change is reported only when it is larger than `--threshold` and a
+Mann-Whitney U test on the two sample sets gives p < `--alpha`. A separate
+pass under tracemalloc records peak and retained memory.
+
+    python -m benchmarks.micro run --out reports/micro.json
+    python -m benchmarks.micro run --baseline reports/micro.json --fail-on-regression
+    python -m benchmarks.micro compare reports/before.json reports/after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import math
+import platform
+import subprocess
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import mean, median, stdev
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.micro.corpus import build_corpus, fingerprint
+from services.ingest import _hash_id, chunk_text, normalize_message
+from utils.text import html_to_text, normalize_text, strip_quotes_and_signature
+
+
+REPORT_SCHEMA = "microbench/v1"
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    fn: Callable[[Any], Any]
+    inputs: Callable[[List[Dict[str, Any]]], List[Any]]
+
+
+def _raw_text(messages: List[Dict[str, Any]]) -> List[str]:
+    # What html_to_text hands to normalize_text: markup gone, whitespace not yet collapsed
+    from bs4 import BeautifulSoup
+    return [BeautifulSoup(m["body"], "lxml").get_text(" ") if m["body"] else "" for m in messages]
+
+
+def _chunk_ids(messages: List[Dict[str, Any]]) -> List[tuple]:
+    # Same id parts as index_messages, one per chunk
+    ids = []
+    for m in messages:
+        chunks = chunk_text(normalize_message(m)["body_text"]) or [m["subject"]]
+        ids.extend(("1", str(m["id"]), str(i)) for i in range(len(chunks)))
+    return ids
+
+
+BENCHMARKS = [
+    Benchmark("html_to_text", html_to_text, lambda ms: [m["body"] for m in ms]),
+    Benchmark("normalize_text", normalize_text, _raw_text),
+    Benchmark("strip_quotes_and_signature", strip_quotes_and_signature, lambda ms: [html_to_text(m["body"]) for m in ms]),
+    Benchmark("chunk_text", chunk_text, lambda ms: [normalize_message(m)["body_text"] for m in ms]),
+    Benchmark("normalize_message", normalize_message, lambda ms: ms),
+    Benchmark("_hash_id", lambda parts: _hash_id(*parts), _chunk_ids),
+]
+
+
+def _run_once(fn: Callable[[Any], Any], inputs: List[Any], loops: int) -> int:
+    start = perf_counter_ns()
+    for _ in range(loops):
+        for item in inputs:
+            fn(item)
+    return perf_counter_ns() - start
+
+
+def _calibrate(fn: Callable[[Any], Any], inputs: List[Any], min_time_ns: int) -> int:
+    loops = 1
+    while True:
+        elapsed = _run_once(fn, inputs, loops)
+        if elapsed >= min_time_ns or loops >= 1 << 20:
+            return loops
+        # Aim a little past the target so the next try usually succeeds
+        loops = max(loops * 2, int(loops * 1.2 * min_time_ns / max(elapsed, 1)))
+
+
+def time_benchmark(bench: Benchmark, inputs: List[Any], repeats: int, min_time: float, warmup: int, keep_gc: bool) -> Dict[str, Any]:
+    loops = _calibrate(bench.fn, inputs, int(min_time * 1e9))
+    for _ in range(warmup):
+        _run_once(bench.fn, inputs, loops)
+
+    gc_was_enabled = gc.isenabled()
+    if not keep_gc:
+        gc.collect()
+        gc.disable()
+    try:
+        samples = [_run_once(bench.fn, inputs, loops) / (loops * len(inputs)) for _ in range(repeats)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    ordered = sorted(samples)
+    q1, q3 = ordered[len(ordered) // 4], ordered[(3 * len(ordered)) // 4]
+    return {
+        "loops": loops,
+        "repeats": repeats,
+        "ns_per_item": {
+            "min": round(ordered[0], 1),
+            "median": round(median(ordered), 1),
+            "mean": round(mean(ordered), 1),
+            "stdev": round(stdev(ordered), 1) if len(ordered) > 1 else 0.0,
+            "iqr": round(q3 - q1, 1),
+        },
+        "samples": [round(s, 1) for s in samples],
+    }
+
+
+def memory_benchmark(bench: Benchmark, inputs: List[Any], top: int) -> Dict[str, Any]:
+    """Peak and retained bytes for one pass over the inputs"""
+    gc.collect()
+    tracemalloc.start(10 if top else 1)
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        results = [bench.fn(item) for item in inputs]
+        peak = tracemalloc.get_traced_memory()[1]
+        # Parse trees are reference cycles; collect them so only real retention counts
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot() if top else None
+    finally:
+        tracemalloc.stop()
+    out: Dict[str, Any] = {
+        "peak_bytes": peak - before,
+        "peak_bytes_per_item": round((peak - before) / len(inputs), 1),
+        # What the outputs themselves hold on to (strings, dicts) after the pass
+        "retained_bytes": current - before,
+    }
+    if snapshot is not None:
+        stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+        out["top_allocations"] = [
+            {"site": str(s.traceback[0]), "bytes": s.size, "count": s.count} for s in stats[:top]
+        ]
+    del results
+    return out
+
+
+def mann_whitney_p(a: List[float], b: List[float]) -> float:
+    """Two-sided Mann-Whitney U p-value (normal approximation with tie correction)"""
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 1.0
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    r1 = sum(r for r, (_, group) in zip(ranks, combined) if group == 0)
+    u = r1 - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    var = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if var <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(var)
+    return max(0.0, min(1.0, math.erfc(z / math.sqrt(2))))
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float, alpha: float) -> Dict[str, Any]:
+    """Per-benchmark median change and verdict (faster / slower / unchanged) of `new` vs `base`"""
+    rows: Dict[str, Any] = {}
+    for name, b in new["benchmarks"].items():
+        a = base["benchmarks"].get(name)
+        if not a:
+            continue
+        old_median, new_median = a["ns_per_item"]["median"], b["ns_per_item"]["median"]
+        change = new_median / old_median - 1 if old_median else 0.0
+        p = mann_whitney_p(a["samples"], b["samples"])
+        verdict = "unchanged"
+        if p < alpha and abs(change) >= threshold:
+            verdict = "slower" if change > 0 else "faster"
+        row = {
+            "median_ns": {"base": old_median, "new": new_median},
+            "change": round(change, 4),
+            "p_value": round(p, 5),
+            "verdict": verdict,
+        }
+        if "memory" in a and "memory" in b:
+            row["peak_bytes"] = {"base": a["memory"]["peak_bytes"], "new": b["memory"]["peak_bytes"]}
+        rows[name] = row
+    return {
+        "base": base.get("label"),
+        "new": new.get("label"),
+        "same_corpus": base.get("corpus", {}).get("fingerprint") == new.get("corpus", {}).get("fingerprint"),
+        "threshold": threshold,
+        "alpha": alpha,
+        "benchmarks": rows,
+    }
+
+
+def _environment() -> Dict[str, Any]:
+    import bs4
+    import lxml.etree
+
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        sha = None
+    return {
+        "git_sha": sha,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "bs4": bs4.__version__,
+        "lxml": ".".join(map(str, lxml.etree.LXML_VERSION)),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = build_corpus(args.corpus_size)
+    selected = [b for b in BENCHMARKS if not args.filter or any(f in b.name for f in args.filter)]
+    results: Dict[str, Any] = {}
+    for bench in selected:
+        inputs = bench.inputs(corpus)
+        result = time_benchmark(bench, inputs, args.repeats, args.min_time, args.warmup, args.keep_gc)
+        result["items"] = len(inputs)
+        result["memory"] = memory_benchmark(bench, inputs, args.top)
+        results[bench.name] = result
+        print(
+            f"{bench.name:<28} {result['ns_per_item']['median'] / 1000:>10.2f} us/item "
+            f"(±{result['ns_per_item']['iqr'] / 1000:.2f} IQR, {len(inputs)} items x {result['loops']} loops) "
+            f"peak {result['memory']['peak_bytes'] / 1024:.0f} KiB",
+            file=sys.stderr,
+        )
+    return {
+        "schema": REPORT_SCHEMA,
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": _environment(),
+        "corpus": {"messages": len(corpus), "fingerprint": fingerprint(corpus)},
+        "settings": {"repeats": args.repeats, "min_time": args.min_time, "warmup": args.warmup, "keep_gc": args.keep_gc},
+        "benchmarks": results,
+    }
+
+
+def _print_comparison(result: Dict[str, Any]) -> None:
+    if not result["same_corpus"]:
+        print("warning: reports were produced from different corpora", file=sys.stderr)
+    for name, row in result["benchmarks"].items():
+        print(
+            f"{name:<28} {row['median_ns']['base'] / 1000:>10.2f} -> {row['median_ns']['new'] / 1000:>10.2f} us/item "
+            f"{row['change']:+8.1%}  p={row['p_value']:.4f}  {row['verdict']}",
+            file=sys.stderr,
+        )
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("schema") != REPORT_SCHEMA:
+        raise SystemExit(f"{path}: not a {REPORT_SCHEMA} report")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for text, chunking and normalization")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="Run the suite and print a JSON report")
+    run_cmd.add_argument("--filter", nargs="*", default=None, help="Only benchmarks whose name contains one of these")
+    run_cmd.add_argument("--corpus-size", type=int, default=200, help="Generated messages on top of the fixed shapes")
+    run_cmd.add_argument("--repeats", type=int, default=15)
+    run_cmd.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per sample")
+    run_cmd.add_argument("--warmup", type=int, default=2)
+    run_cmd.add_argument("--keep-gc", action="store_true", help="Leave the garbage collector on while timing")
+    run_cmd.add_argument("--top", type=int, default=0, help="Record the top N allocation sites per benchmark")
+    run_cmd.add_argument("--label", default=None)
+    run_cmd.add_argument("--out", default=None, help="Write the JSON report here")
+    run_cmd.add_argument("--baseline", default=None, help="Compare against this report")
+    run_cmd.add_argument("--threshold", type=float, default=0.05, help="Smallest relative change worth reporting")
+    run_cmd.add_argument("--alpha", type=float, default=0.01, help="Significance level of the Mann-Whitney U test")
+    run_cmd.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if anything got slower")
+
+    cmp_cmd = sub.add_parser("compare", help="Compare two JSON reports")
+    cmp_cmd.add_argument("base")
+    cmp_cmd.add_argument("new")
+    cmp_cmd.add_argument("--threshold", type=float, default=0.05)
+    cmp_cmd.add_argument("--alpha", type=float, default=0.01)
+    cmp_cmd.add_argument("--fail-on-regression", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        result = compare(_load(args.base), _load(args.new), args.threshold, args.alpha)
+    else:
+        baseline = _load(args.baseline) if args.baseline else None
+        report = run(args)
+        text = json.dumps(report, indent=2)
+        if args.out:
+            Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text)
+        if baseline is None:
+            print(text)
+            return
+        result = compare(baseline, report, args.threshold, args.alpha)
+
+    _print_comparison(result)
+    print(json.dumps(result, indent=2))
+    if args.fail_on_regression and any(r["verdict"] == "slower" for r in result["benchmarks"].values()):
+        sys.exit(1)
@@ -0,0 +1,317 @@
+"""
+EXPLAIN QUERY PLAN for every hot query, on a seeded million-row database.
+
+Seeds a scratch SQLite database (schema from `upgrade_schema`) with
+synthetic mail for a few accounts, runs `ANALYZE` as a mature database would
+have, then drives the real code paths: sync storage, digest refreshes,
+structured queries, the route queries and the judge verdict cache. Every
+statement they issue is captured and explained with its own parameters, so
+the check cannot drift from the code:
+
+    python -m benchmarks.query_plans --rows 1000000
+    python -m benchmarks.query_plans --rows 200000 --json > reports/plans.json
+
+A statement fails the check when it scans one of the large tables instead of
+searching an index, or sorts through a temp b-tree where the index order
+should serve (grouped queries that order by an aggregate are expected to
+sort their groups). Exits with status 1 when any statement fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+ACCOUNTS = 4
+NOW = datetime(2026, 3, 18, 15, 30)
+LARGE_TABLES = ("email_messages", "email_threads", "usage_events", "judge_verdicts")
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+
+STRUCTURED_QUESTIONS = (
+    "how many emails from stripe.com this week",
+    "how many unread emails today",
+    "list unread emails",
+    "show my last 5 emails from user7",
+    "list emails with attachments this month",
+    "list unread threads",
+    "who emailed me most today",
+)
+
+
+@dataclass
+class Check:
+    name: str
+    sql: str
+    plan: List[str]
+    ms: float
+    covering: bool
+    problems: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Capture:
+    label: str
+    allow_sort: bool
+    statements: List[Tuple[str, Any]] = field(default_factory=list)
+
+
+def seed(engine: Any, rows: int, seed_value: int) -> Dict[str, Any]:
+    """Synthetic mail for `ACCOUNTS` accounts: ~4 messages per thread over the past year"""
+    rng = random.Random(seed_value)
+    domains = [f"example{i}.com" for i in range(1500)] + ["stripe.com", "github.com", "gmail.com"]
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.executemany(
+            "INSERT INTO accounts (id, email, nylas_grant_id, access_token, provider, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(a, f"me{a}@example.com", f"grant-{a}", "x", "seed", NOW) for a in range(1, ACCOUNTS + 1)],
+        )
+        batch: List[Tuple[Any, ...]] = []
+        threads: Dict[Tuple[int, str], Tuple[Any, ...]] = {}
+        for i in range(rows):
+            account = i % ACCOUNTS + 1
+            thread = f"t{i // (ACCOUNTS * 4)}"
+            domain = rng.choice(domains)
+            sender = f"user{rng.randrange(5000)}@{domain}"
+            date = NOW - timedelta(seconds=rng.randrange(365 * 86400))
+            subject = f"Subject {i // (ACCOUNTS * 4)}"
+            batch.append((
+                account, thread, f"m{i}", sender, domain, "me@example.com", "", date, subject,
+                f"Body of message {i} " * 8, None, rng.random() < 0.1, rng.random() < 0.15,
+            ))
+            threads[(account, thread)] = (account, thread, subject, sender, "snippet", date)
+            if len(batch) == 20000:
+                cur.executemany(
+                    "INSERT INTO email_messages (account_id, thread_id, message_id, from_addr, from_domain, to_addrs, "
+                    "cc_addrs, date, subject, body_text, body_html, has_attachments, unread) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+                batch = []
+        if batch:
+            cur.executemany(
+                "INSERT INTO email_messages (account_id, thread_id, message_id, from_addr, from_domain, to_addrs, "
+                "cc_addrs, date, subject, body_text, body_html, has_attachments, unread) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+        cur.executemany(
+            "INSERT INTO email_threads (account_id, thread_id, subject, latest_from, latest_snippet, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            list(threads.values()),
+        )
+        cur.executemany(
+            "INSERT INTO usage_events (account_id, request_kind, stage, model, calls, prompt_tokens, completion_tokens, "
+            "cached_tokens, cost_usd, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (i % ACCOUNTS + 1, "chat", rng.choice(["route", "generate", "embed"]), "gpt-4.1", 1,
+                 1000, 100, 0, 0.002, NOW - timedelta(seconds=rng.randrange(90 * 86400)))
+                for i in range(max(1000, rows // 10))
+            ],
+        )
+        cur.executemany(
+            "INSERT INTO judge_verdicts (metric, judge_model, input_hash, score, passed, reason, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [("faithfulness", "gpt-4.1", f"{i:064x}", 1.0, True, None, NOW) for i in range(max(1000, rows // 20))],
+        )
+        cur.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+    return {"accounts": ACCOUNTS, "messages": rows, "threads": len(threads)}
+
+
+def explain(engine: Any, capture: Capture) -> List[Check]:
+    checks: List[Check] = []
+    seen = set()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for sql, params in capture.statements:
+            verb = sql.lstrip().split(None, 1)[0].upper()
+            if verb not in ("SELECT", "UPDATE", "DELETE") or sql in seen:
+                continue
+            seen.add(sql)
+            plan = [row[3] for row in cur.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            t0 = perf_counter()
+            if verb == "SELECT":
+                cur.execute(sql, params).fetchall()
+            ms = (perf_counter() - t0) * 1000
+            problems = []
+            for detail in plan:
+                scan = SCAN_RE.match(detail)
+                if scan and scan.group(1) in LARGE_TABLES:
+                    problems.append(f"full scan: {detail}")
+                if "TEMP B-TREE" in detail and not capture.allow_sort:
+                    problems.append(f"sort: {detail}")
+            checks.append(Check(
+                name=capture.label,
+                sql=" ".join(sql.split()),
+                plan=plan,
+                ms=round(ms, 3),
+                covering=any("COVERING INDEX" in d or "PRIMARY KEY" in d for d in plan),
+                problems=problems,
+            ))
+    finally:
+        raw.close()
+    return checks
+
+
+def run(rows: int, seed_value: int) -> Dict[str, Any]:
+    # Deferred so main() can point SQLITE_PATH at a scratch database first
+    from sqlalchemy import event, select
+
+    from api.routers.auth import auth_me
+    from api.routers.usage import usage_rollup
+    from database import AsyncSessionLocal, EmailMessage, SessionLocal, async_engine, engine, upgrade_schema
+    from services.digest import get_digest
+    from services.eval.verdict_cache import lookup_verdicts
+    from services.structured_query import parse_question, run_structured_query
+    from services.sync import SyncResult, _load_accounts, _record, _store_messages
+
+    upgrade_schema(engine)
+    t0 = perf_counter()
+    corpus = seed(engine, rows, seed_value)
+    seed_s = perf_counter() - t0
+
+    active: List[Capture] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if active:
+            # Batched statements share one plan; explain the first parameter set
+            active[-1].statements.append((statement, parameters[0] if executemany else parameters))
+
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", record)
+
+    captures: List[Capture] = []
+
+    @contextmanager
+    def capturing(label: str, allow_sort: bool = False) -> Iterator[None]:
+        capture = Capture(label, allow_sort)
+        active.append(capture)
+        try:
+            yield
+        finally:
+            active.pop()
+            captures.append(capture)
+
+    account = 1
+    # Half already stored (read-state updates), half new, in existing and new threads
+    batch = []
+    for i in range(100):
+        mid = f"m{i * ACCOUNTS}" if i < 50 else f"new-{i}"
+        batch.append({
+            "message_id": mid, "thread_id": f"t{i // 4}" if i < 75 else f"new-t{i // 4}",
+            "from_addr": "alice@stripe.com", "from_domain": "stripe.com", "to_addrs": "", "cc_addrs": "",
+            "date": NOW - timedelta(minutes=i), "subject": f"Subject {i}", "body_text": "hello", "body_html": None,
+            "has_attachments": False, "unread": True, "folders": "inbox", "snippet": "hello",
+        })
+
+    with capturing("digest rebuild", allow_sort=True):
+        # Runs once per day / week; sorts only the window's rows
+        for period in ("today", "this_week"):
+            get_digest(account, period, NOW)
+    db = SessionLocal()
+    try:
+        with capturing("sync store"):
+            _store_messages(db, account, batch)
+    finally:
+        db.close()
+    with capturing("sync schedule"):
+        _record(account, SyncResult(account_id=account, fetched=len(batch), inserted=50))
+        _load_accounts()
+    with capturing("digest refresh"):
+        for period in ("today", "this_week"):
+            get_digest(account, period, NOW)
+
+    for question in STRUCTURED_QUESTIONS:
+        query = parse_question(question, NOW)
+        if query is None:
+            raise SystemExit(f"Not a structured question: {question!r}")
+        # Grouped answers order by an aggregate, which always sorts the (account-scoped) groups;
+        # a sender name matches two index ranges (address or domain) whose union is sorted
+        grouped = query.kind == "top_senders" or query.target == "threads"
+        by_name = bool(query.sender) and "@" not in query.sender and "." not in query.sender
+        with capturing(f"structured: {question}", allow_sort=grouped or by_name):
+            run_structured_query(account, query)
+
+    async def routes() -> None:
+        async with AsyncSessionLocal() as session:
+            with capturing("route: /auth/me"):
+                await auth_me(account_id=account, db=session)
+            with capturing("route: /usage", allow_sort=True):
+                await usage_rollup(days=7, group_by="stage", db=session)
+            with capturing("route: /eval recent messages"):
+                await session.scalars(
+                    select(EmailMessage)
+                    .where(EmailMessage.account_id == account)
+                    .order_by(EmailMessage.date.desc())
+                    .limit(50)
+                )
+        await async_engine.dispose()
+
+    asyncio.run(routes())
+
+    with capturing("judge verdict cache"):
+        lookup_verdicts([("faithfulness", "gpt-4.1", f"{i:064x}") for i in range(300)])
+
+    checks = [c for capture in captures for c in explain(engine, capture)]
+    failed = [c for c in checks if c.problems]
+    return {
+        "created_at": datetime.now().isoformat(),
+        "sqlite": engine.dialect.dbapi.sqlite_version,
+        "corpus": {**corpus, "seed_s": round(seed_s, 1)},
+        "statements": len(checks),
+        "failed": len(failed),
+        "checks": [asdict(c) for c in checks],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN check of the hot queries on a seeded database")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Messages to seed")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="query-plans-") as tmp:
+        # Never touch the real database or vector store; config is read when database is imported
+        os.environ["SQLITE_PATH"] = os.path.join(tmp, "app.db")
+        os.environ["CHROMA_DIR"] = os.path.join(tmp, "chroma")
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+        report = run(args.rows, args.seed)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        corpus = report["corpus"]
+        print(f"SQLite {report['sqlite']}, {corpus['messages']:,} messages / {corpus['threads']:,} threads "
+              f"seeded in {corpus['seed_s']}s\n")
+        for c in report["checks"]:
+            status = "FAIL" if c["problems"] else "ok  "
+            print(f"{status} {c['ms']:9.3f} ms  {c['name']}{'  (covering)' if c['covering'] else ''}")
+            print(f"       {c['sql'][:160]}")
+            for detail in c["plan"]:
+                print(f"         {detail}")
+            for problem in c["problems"]:
+                print(f"       ! {problem}")
+        print(f"\n{report['statements'] - report['failed']}/{report['statements']} statements use their indexes")
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Offline retrieval quality: recall@k, MRR and latency of the `retrieve` node.
+
+Builds labeled queries from the stored `EmailMessage` corpus of one account,
+each with the set of messages that answer it:
+
+- subject: the message's subject line, without Re:/Fwd: prefixes; relevant
+  are all messages with that subject
+- sender_subject: "What did <sender> say about <subject>?"; relevant are the
+  messages with that subject from that sender
+- phrase: a 12-word span from the middle of the body; relevant are all
+  messages whose body contains the span (quoted replies included)
+
+The corpus is chunked exactly as sync indexes it (`chunk_messages`) into a
+throwaway Chroma directory, embedded with the deterministic hashing embedder
+of the load-test stubs, and every query runs through the workflow's
+`retrieve` node with its embedding precomputed. No OpenAI call is made, so a
+run is free, repeatable and comparable across chunker, index or filter
+changes on the same corpus:
+
+    python -m benchmarks.retrieval --queries 300 --out reports/retrieval.json
+    python -m benchmarks.retrieval --queries 300 --baseline reports/retrieval.json
+
+recall@k is |relevant ∩ top-k messages| / min(|relevant|, k), so perfect
+retrieval scores 1 even when more than k messages are relevant. MRR uses the
+rank of the first relevant message. Retrieved chunks are collapsed to their
+message, keeping the best rank. Chroma's HNSW search is approximate, so the
+last digit of a metric can move between otherwise identical runs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from statistics import mean
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.loadtest.runner import summarize
+from benchmarks.loadtest.stubs import EMBEDDING_DIMS, embed
+
+
+REPORT_SCHEMA = "retrieval/v1"
+KINDS = ("subject", "sender_subject", "phrase")
+PHRASE_WORDS = 12
+SUBJECT_PREFIX_RE = re.compile(r"^(?:(?:re|fwd?|aw|sv)\s*:\s*)+", re.IGNORECASE)
+
+
+@dataclass
+class LabeledQuery:
+    kind: str
+    query: str
+    message_id: str  # message the query was generated from
+    relevant: List[str]  # every message that answers it
+
+
+def _subject(subject: Optional[str]) -> str:
+    return SUBJECT_PREFIX_RE.sub("", subject or "").strip()
+
+
+def _flat(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def build_queries(messages: List[Dict[str, Any]], count: int, seed: int) -> List[LabeledQuery]:
+    """`count` labeled queries from randomly chosen messages, cycling through the query kinds"""
+    by_subject: Dict[str, List[Dict[str, Any]]] = {}
+    for m in messages:
+        subject = _subject(m["subject"]).lower()
+        if subject:
+            by_subject.setdefault(subject, []).append(m)
+    bodies = [(m["message_id"], _flat(m["body_text"])) for m in messages]
+
+    def make(kind: str, m: Dict[str, Any], rng: random.Random) -> Optional[LabeledQuery]:
+        subject = _subject(m["subject"])
+        if kind == "subject" and subject:
+            relevant = [o["message_id"] for o in by_subject[subject.lower()]]
+            return LabeledQuery(kind, subject, m["message_id"], relevant)
+        if kind == "sender_subject" and subject and m["from_addr"]:
+            sender = m["from_addr"].split("@")[0]
+            relevant = [o["message_id"] for o in by_subject[subject.lower()] if o["from_addr"] == m["from_addr"]]
+            return LabeledQuery(kind, f"What did {sender} say about {subject}?", m["message_id"], relevant)
+        if kind == "phrase":
+            words = _flat(m["body_text"]).split(" ")
+            if len(words) < PHRASE_WORDS * 2:
+                return None
+            start = rng.randrange(PHRASE_WORDS // 2, len(words) - PHRASE_WORDS - PHRASE_WORDS // 2 + 1)
+            phrase = " ".join(words[start:start + PHRASE_WORDS])
+            relevant = [mid for mid, body in bodies if phrase in body]
+            return LabeledQuery(kind, phrase, m["message_id"], relevant)
+        return None
+
+    rng = random.Random(seed)
+    order = list(messages)
+    rng.shuffle(order)
+    queries: List[LabeledQuery] = []
+    for i in range(len(order) * len(KINDS)):
+        if len(queries) >= count:
+            break
+        m = order[i % len(order)]
+        # Kind rotates per query, falling back to the next kind the message supports
+        for j in range(len(KINDS)):
+            q = make(KINDS[(len(queries) + j) % len(KINDS)], m, rng)
+            if q is not None:
+                queries.append(q)
+                break
+    return queries
+
+
+def score(relevant: Sequence[str], retrieved: Sequence[str], ks: Sequence[int]) -> Dict[str, float]:
+    """recall@k for each k and reciprocal rank of one query (`retrieved` is ranked message ids)"""
+    wanted = set(relevant)
+    row = {
+        f"recall@{k}": len(wanted.intersection(retrieved[:k])) / min(len(wanted), k) if wanted else 0.0
+        for k in ks
+    }
+    rank = next((i for i, mid in enumerate(retrieved, 1) if mid in wanted), None)
+    row["rr"] = 1.0 / rank if rank else 0.0
+    return row
+
+
+def _aggregate(rows: List[Dict[str, Any]], ks: Sequence[int]) -> Dict[str, Any]:
+    if not rows:
+        return {"queries": 0}
+    out: Dict[str, Any] = {"queries": len(rows)}
+    for k in ks:
+        out[f"recall@{k}"] = round(mean(r[f"recall@{k}"] for r in rows), 4)
+    out["mrr"] = round(mean(r["rr"] for r in rows), 4)
+    out["latency_ms"] = summarize([r["latency_ms"] for r in rows])
+    return out
+
+
+def _fingerprint(items: Any) -> str:
+    blob = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def load_messages(account_id: Optional[int]) -> tuple[int, List[Dict[str, Any]]]:
+    """Normalized-message dicts (the shape `chunk_messages` takes) for one account"""
+    from database import SessionLocal, Account, EmailMessage
+
+    db = SessionLocal()
+    try:
+        acct = db.get(Account, account_id) if account_id else db.query(Account).first()
+        if not acct:
+            raise SystemExit("No connected account")
+        rows = (
+            db.query(EmailMessage)
+            .filter(EmailMessage.account_id == acct.id)
+            .order_by(EmailMessage.id)
+            .all()
+        )
+        messages = [
+            {
+                "message_id": r.message_id,
+                "thread_id": r.thread_id or "",
+                "subject": r.subject or "",
+                "from_addr": r.from_addr or "",
+                "date": r.date or datetime(1970, 1, 1),
+                "body_text": r.body_text or "",
+            }
+            for r in rows
+        ]
+        return acct.id, messages
+    finally:
+        db.close()
+
+
+async def run(account_id: Optional[int], count: int, seed: int, ks: Sequence[int]) -> Dict[str, Any]:
+    # Deferred so main() can point CHROMA_DIR at a scratch directory first
+    from orchestrator.chat_workflow import retrieve
+    from orchestrator.models.chat import ChatState
+    from services.ingest import chunk_messages
+    from services.vectorstore import upsert_chunks
+
+    account_id, messages = load_messages(account_id)
+    if not messages:
+        raise SystemExit("No stored messages; sync first or seed one (python -m benchmarks.loadtest seed)")
+
+    t0 = perf_counter()
+    chunk_ids, texts, metas = chunk_messages(account_id, messages)
+    embeddings = [embed(t).tolist() for t in texts]
+    for i in range(0, len(texts), 1000):
+        await asyncio.to_thread(
+            upsert_chunks, account_id, chunk_ids[i:i + 1000], texts[i:i + 1000],
+            metas[i:i + 1000], embeddings[i:i + 1000],
+        )
+    index_s = perf_counter() - t0
+
+    queries = build_queries(messages, count, seed)
+    depth = max(ks)
+    rows: List[Dict[str, Any]] = []
+    errors = 0
+    for q in queries:
+        state = ChatState(account_id=account_id, question=q.query, top_k=depth, query_embedding=embed(q.query).tolist())
+        t1 = perf_counter()
+        state = await retrieve(state)
+        latency_ms = (perf_counter() - t1) * 1000
+        if state.error:
+            errors += 1
+        retrieved: List[str] = []
+        for ctx in state.raw_contexts:
+            mid = (ctx.get("metadata") or {}).get("message_id")
+            if mid and mid not in retrieved:
+                retrieved.append(mid)
+        rows.append({
+            **asdict(q),
+            "retrieved": retrieved,
+            "latency_ms": round(latency_ms, 3),
+            **score(q.relevant, retrieved, ks),
+        })
+
+    return {
+        "schema": REPORT_SCHEMA,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            "queries": count,
+            "seed": seed,
+            "ks": list(ks),
+            "embedder": f"hashing-{EMBEDDING_DIMS}",
+        },
+        "corpus": {
+            "messages": len(messages),
+            "chunks": len(texts),
+            "fingerprint": _fingerprint([[m["message_id"], m["subject"], m["body_text"]] for m in messages]),
+            "queries_fingerprint": _fingerprint([[q.kind, q.query, q.relevant] for q in queries]),
+            "index_s": round(index_s, 2),
+        },
+        "errors": errors,
+        "overall": _aggregate(rows, ks),
+        "by_kind": {kind: _aggregate([r for r in rows if r["kind"] == kind], ks) for kind in KINDS},
+        "items": rows,
+    }
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Change of every quality metric and of p50/p95 latency, overall and per query kind"""
+    def delta(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for key, value in b.items():
+            if key.startswith("recall@") or key == "mrr":
+                if key in a:
+                    out[key] = {"base": a[key], "new": value, "change": round(value - a[key], 4)}
+        for p in ("p50", "p95"):
+            old, cur = a.get("latency_ms", {}).get(p), b.get("latency_ms", {}).get(p)
+            if old is not None and cur is not None:
+                out[f"latency_{p}_ms"] = {"base": old, "new": cur, "change": round(cur - old, 3)}
+        return out
+
+    return {
+        # Quality deltas are only meaningful over the same corpus and query set
+        "same_corpus": base["corpus"]["fingerprint"] == new["corpus"]["fingerprint"],
+        "same_queries": base["corpus"]["queries_fingerprint"] == new["corpus"]["queries_fingerprint"],
+        "overall": delta(base["overall"], new["overall"]),
+        "by_kind": {k: delta(base["by_kind"].get(k, {}), new["by_kind"][k]) for k in new["by_kind"]},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline recall@k / MRR / latency benchmark of the retrieve node")
+    parser.add_argument("--account-id", type=int, default=None, help="Defaults to the first connected account")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--k", default="1,3,5,10", help="Comma-separated cutoffs; the largest is the retrieval depth")
+    parser.add_argument("--chroma-dir", default=None, help="Index directory (default: a temporary one)")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--items", action="store_true", help="Keep per-query rows in the printed report")
+    args = parser.parse_args(argv)
+    ks = sorted({int(k) for k in args.k.split(",") if k.strip()})
+
+    with tempfile.TemporaryDirectory(prefix="retrieval-") as tmp:
+        # Never index into the real vector store; config is read when services are imported
+        os.environ["CHROMA_DIR"] = args.chroma_dir or tmp
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+        report = asyncio.run(run(args.account_id, args.queries, args.seed, ks))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    printed = report if args.items else {k: v for k, v in report.items() if k != "items"}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            printed = {"report": printed, "compare": compare(json.load(f), report)}
+    print(json.dumps(printed, indent=2))
+
+
+if __name__ == "__main__":
+    main()
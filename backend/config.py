@@ -21,14 +21,123 @@ class AppConfig(BaseSettings):
     # Storage paths
     chroma_dir: str = "./storage/chroma"
     sqlite_path: str = "./storage/app.db"
+    # SQLite tuning (database/session.py): WAL lets readers run alongside a writer
+    sqlite_wal: bool = True
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_mb: int = 64  # page cache per connection
+    sqlite_mmap_size_mb: int = 256
 
     # Models/knobs
     intent_router_model: str = "gpt-4.1-mini-2025-04-14"
     answer_model: str = "gpt-4.1-2025-04-14"
     eval_model: str = "gpt-4.1-2025-04-14"
+    eval_concurrency: int = 8  # Samples answered by the pipeline at once
+    eval_judge_concurrency: int = 8  # Samples (or DeepEval test cases) judged at once
+    deepeval_batch_size: int = 16  # Test cases per DeepEval evaluate() call
+    judge_cache_enabled: bool = True  # Reuse judge verdicts for unchanged question/answer/context
+    eval_score_tolerance: float = 0.02  # Absolute score drop counted as a regression between runs
+    eval_latency_tolerance: float = 0.10  # Relative latency increase counted as a regression
     embedding_model: str = "text-embedding-3-small"
     top_k: int = 6
 
+    # Shared async OpenAI client (services/openai_client.py)
+    openai_base_url: str = ""
+    openai_timeout_seconds: float = 60.0
+    openai_connect_timeout_seconds: float = 5.0
+    openai_max_retries: int = 2
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    embedding_batch_size: int = 256
+
+    # Semantic answer cache
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.92
+    answer_cache_max_entries: int = 256
+    answer_cache_ttl_seconds: float = 3600.0
+
+    # Local intent classifier fast path (agents/intent_classifier.py)
+    intent_classifier_enabled: bool = True
+    intent_classifier_path: str = "./storage/intent_classifier.joblib"
+    intent_classifier_threshold: float = 0.9
+    intent_log_path: str = "./storage/intent_router_log.jsonl"
+    intent_log_max_bytes: int = 5_000_000  # rotated to <path>.1 beyond this; 0 never rotates
+
+    # Workflow checkpoints: "memory" or "sqlite" (persistent, shared across workers)
+    checkpoint_backend: str = "memory"
+    checkpoint_max_threads: int = 1000
+    checkpoint_ttl_seconds: float = 86400.0
+    checkpoint_max_bytes: int = 64 * 1024 * 1024
+    conversation_max_turns: int = 20
+
+    # Conversation history sent to the answer model
+    history_token_budget: int = 2000
+    history_summarize: bool = False
+
+    # Exact answers for count/list/top-sender questions from message metadata
+    structured_query_enabled: bool = True
+    structured_query_list_limit: int = 10
+
+    # Materialized today / this-week digests (services/digest.py)
+    digest_enabled: bool = True
+    digest_max_items: int = 15
+
+    # Retention and compaction (services/retention.py), the defaults for accounts
+    # without their own policy; 0 days keeps mail forever
+    retention_enabled: bool = False
+    retention_interval_hours: float = 24.0
+    retention_max_age_days: int = 0
+    retention_folder_days: str = ""  # folder:days (e.g. trash:30,spam:30), folder ids as the provider reports them
+    retention_sender_days: str = ""  # sender class (automated or person):days
+    retention_html_days: int = 0  # body_html is dropped after this; body_text stays
+    retention_rebuild_ratio: float = 0.2  # rebuild the vector collection once this share of it was deleted
+    retention_vacuum_ratio: float = 0.1  # VACUUM once this share of the database file is free pages
+
+    # Multi-account sync scheduler (services/sync.py); every sync is also admitted
+    # as sync work, so admission_sync_concurrency caps sync_max_concurrency
+    sync_scheduler_enabled: bool = False
+    sync_max_concurrency: int = 2  # accounts syncing at once
+    sync_provider_concurrency: int = 2  # accounts of one provider syncing at once
+    sync_provider_limits: str = ""  # provider:limit overrides, e.g. "google:4,imap:1"
+    sync_min_interval_seconds: int = 300
+    sync_max_interval_seconds: int = 3600
+    sync_target_new_messages: int = 50  # new messages a sync should find; one fetch returns at most 200
+    sync_refresh_seconds: float = 60.0  # reload accounts and stored due times
+
+    # Answer cascade: try the small model first, escalate to answer_model when it
+    # is below cascade_accept_confidence, cites nothing, or fails the support check
+    cascade_enabled: bool = False
+    cascade_small_model: str = "gpt-4.1-mini-2025-04-14"
+    cascade_accept_confidence: str = "high"
+    cascade_min_support: float = 0.6
+
+    # Prompt token budget for retrieved contexts (sentence-level packing)
+    context_token_budget: int = 2500
+
+    # Merge identical concurrent chat requests into one workflow run
+    coalesce_requests: bool = True
+
+    # Admission control per work class (services/admission.py)
+    admission_enabled: bool = True
+    admission_max_total: int = 32
+    admission_reserved_for_chat: int = 8
+    admission_chat_concurrency: int = 24
+    admission_chat_queue: int = 64
+    admission_chat_queue_timeout: float = 10.0
+    admission_sync_concurrency: int = 2
+    admission_sync_queue: int = 4
+    admission_sync_queue_timeout: float = 30.0
+    admission_eval_concurrency: int = 1
+    admission_eval_queue: int = 2
+    admission_eval_queue_timeout: float = 5.0
+
+    # Start retrieval alongside the intent router instead of after it
+    speculative_retrieval: bool = True
+
+    # SSE token framing
+    stream_frame_ms: int = 50
+    stream_frame_chars: int = 64
+
     model_config = SettingsConfigDict(
         env_file=str(Path(__file__).parent / ".env"),
         env_file_encoding="utf-8",
@@ -1,15 +1,26 @@
 from __future__ import annotations
 
-from database.session import Base, engine, SessionLocal, get_db
-from database.models import Account, EmailThread, EmailMessage, SyncState
+from database.session import Base, engine, SessionLocal, get_db, async_engine, AsyncSessionLocal, get_async_db
+from database.models import Account, EmailThread, EmailMessage, SyncState, EmailDigest, AccountRetention, JudgeVerdict, EvalRun, ConversationCheckpoint, UsageEvent
+from database.schema import upgrade_schema
 
 __all__ = [
     "Base",
     "engine",
     "SessionLocal",
     "get_db",
+    "async_engine",
+    "AsyncSessionLocal",
+    "get_async_db",
+    "upgrade_schema",
     "Account",
     "EmailThread",
     "EmailMessage",
     "SyncState",
+    "EmailDigest",
+    "AccountRetention",
+    "JudgeVerdict",
+    "EvalRun",
+    "ConversationCheckpoint",
+    "UsageEvent",
 ]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, LargeBinary, Float, Index, desc, func
 from sqlalchemy.orm import relationship
 
 from database.session import Base
@@ -25,8 +25,8 @@ class EmailThread(Base):
     __tablename__ = "email_threads"
 
     id = Column(Integer, primary_key=True)
-    account_id = Column(Integer, ForeignKey("accounts.id"), index=True)
-    thread_id = Column(String(255), index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"))
+    thread_id = Column(String(255))
     subject = Column(String(400), nullable=True)
     latest_from = Column(String(400), nullable=True)
     latest_snippet = Column(Text, nullable=True)
@@ -34,25 +34,49 @@ class EmailThread(Base):
 
     account = relationship("Account", back_populates="threads")
 
+    # Thread ids are only unique within an account; the key also serves account-only lookups
+    __table_args__ = (
+        Index("uq_email_threads_account_thread", "account_id", "thread_id", unique=True),
+        Index("ix_email_threads_account_updated", "account_id", "updated_at"),
+    )
+
 
 class EmailMessage(Base):
     __tablename__ = "email_messages"
 
     id = Column(Integer, primary_key=True)
-    account_id = Column(Integer, ForeignKey("accounts.id"), index=True)
-    thread_id = Column(String(255), index=True)  # Nylas thread ID
-    message_id = Column(String(255), unique=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"))
+    thread_id = Column(String(255))  # Nylas thread ID
+    message_id = Column(String(255))
     from_addr = Column(String(400))
+    from_domain = Column(String(255))  # lowercased sender domain, for structured queries
     to_addrs = Column(Text)
     cc_addrs = Column(Text)
-    date = Column(DateTime, index=True)
+    date = Column(DateTime)
     subject = Column(String(400))
     body_text = Column(Text)
     body_html = Column(Text)
     has_attachments = Column(Boolean, default=False)
+    unread = Column(Boolean, default=False)
+    folders = Column(Text, nullable=True)  # lowercased provider folder ids, comma-separated
 
     account = relationship("Account", back_populates="messages")
 
+    # Every query is scoped to one account: sync looks messages up by id, recent-first
+    # reads and digests go by date, and structured queries (services/structured_query.py)
+    # filter by sender or read state, then date. `benchmarks.query_plans` checks the plans.
+    __table_args__ = (
+        Index("uq_email_messages_account_message", "account_id", "message_id", unique=True),
+        Index("ix_email_messages_account_date_desc", "account_id", desc("date")),
+        Index("ix_email_messages_account_thread_date", "account_id", "thread_id", "date"),
+        Index("ix_email_messages_account_domain_date", "account_id", "from_domain", "date"),
+        Index("ix_email_messages_account_unread_date", "account_id", "unread", "date"),
+    )
+
+
+# Sender-name questions search address prefixes case-insensitively
+Index("ix_email_messages_account_sender", EmailMessage.account_id, func.lower(EmailMessage.from_addr))
+
 
 class SyncState(Base):
     __tablename__ = "sync_state"
@@ -60,3 +84,105 @@ class SyncState(Base):
     account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
     last_synced_at = Column(DateTime, nullable=True)
     total_messages = Column(Integer, default=0)
+    # Adaptive schedule (services/sync.py): the next sync is due when the
+    # account's mail rate should have produced `sync_target_new_messages`
+    next_sync_at = Column(DateTime, nullable=True)
+    interval_seconds = Column(Integer, nullable=True)
+    messages_per_hour = Column(Float, nullable=True)  # smoothed rate of new mail
+    failures = Column(Integer, default=0)  # consecutive failed syncs, for backoff
+    last_error = Column(Text, nullable=True)
+
+
+class EmailDigest(Base):
+    """Materialized digest of one account's messages in a time window (services/digest.py)"""
+    __tablename__ = "email_digests"
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
+    period = Column(String(16), primary_key=True)  # "today" or "this_week"
+    period_start = Column(DateTime, nullable=True)
+    last_message_id = Column(Integer, default=0)  # highest email_messages.id folded in
+    message_count = Column(Integer, default=0)
+    thread_count = Column(Integer, default=0)
+    unread_count = Column(Integer, default=0)
+    senders = Column(Text, nullable=True)  # JSON {address: count}
+    items = Column(Text, nullable=True)  # JSON per-thread entries, latest first
+    text = Column(Text, nullable=True)  # rendered digest
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AccountRetention(Base):
+    """Retention policy of one account and the state of its compaction (services/retention.py)"""
+    __tablename__ = "account_retention"
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
+    policy = Column(Text, nullable=True)  # JSON; null means the configured defaults
+    last_compacted_at = Column(DateTime, nullable=True)
+    chunks_deleted_since_rebuild = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JudgeVerdict(Base):
+    """Cached score of one evaluation metric for one judged input (services/eval/verdict_cache.py)"""
+    __tablename__ = "judge_verdicts"
+
+    metric = Column(String(64), primary_key=True)
+    judge_model = Column(String(128), primary_key=True)
+    input_hash = Column(String(64), primary_key=True)  # sha256 of question, answer, context, reference
+    score = Column(Float, nullable=False)
+    passed = Column(Boolean, nullable=True)
+    reason = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class EvalRun(Base):
+    """One finished evaluation run with its aggregate scores (services/eval/history.py)"""
+    __tablename__ = "eval_runs"
+
+    run_id = Column(String(32), primary_key=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
+    kind = Column(String(32), nullable=False)  # llm_judge or deepeval
+    created_at = Column(DateTime, default=datetime.utcnow)
+    git_revision = Column(String(64), nullable=True)
+    label = Column(String(128), nullable=True)
+    baseline = Column(Boolean, default=False)  # compared against by default
+    samples = Column(Integer, default=0)
+    config = Column(Text, nullable=True)  # JSON snapshot of non-secret settings
+    aggregate = Column(Text, nullable=True)  # JSON
+    items = Column(Text, nullable=True)  # JSON per-sample results
+
+    __table_args__ = (Index("ix_eval_runs_kind_created", "kind", "created_at"),)
+
+
+class ConversationCheckpoint(Base):
+    """Latest compacted workflow checkpoint per conversation thread"""
+    __tablename__ = "conversation_checkpoints"
+
+    thread_id = Column(String(255), primary_key=True)
+    checkpoint_ns = Column(String(255), primary_key=True, default="")
+    checkpoint_id = Column(String(64), nullable=False)
+    parent_checkpoint_id = Column(String(64), nullable=True)
+    checkpoint_type = Column(String(32), nullable=False)
+    checkpoint = Column(LargeBinary, nullable=False)
+    metadata_type = Column(String(32), nullable=False)
+    metadata_ = Column("metadata", LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class UsageEvent(Base):
+    """Model token usage and estimated cost of one request stage"""
+    __tablename__ = "usage_events"
+
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    request_kind = Column(String(32), nullable=False)  # chat, chat_stream, eval_llm_judge, ...
+    conversation_id = Column(String(128), nullable=True)
+    stage = Column(String(64), nullable=False)  # workflow node or caller
+    model = Column(String(128), nullable=False)
+    calls = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    cost_usd = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_usage_events_account_created", "account_id", "created_at"),)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from database.session import Base
+
+
+# Backfills for columns derived from data that is already stored
+_BACKFILLS = {
+    ("email_messages", "from_domain"): (
+        "UPDATE email_messages SET from_domain = lower(substr(from_addr, instr(from_addr, '@') + 1)) "
+        "WHERE from_domain IS NULL AND instr(from_addr, '@') > 0"
+    ),
+}
+
+# Rows that would violate a new unique index, removed (newest row kept) before it is created:
+# index -> (table, column unique per account)
+_DEDUPES = {
+    "uq_email_threads_account_thread": ("email_threads", "thread_id"),
+    "uq_email_messages_account_message": ("email_messages", "message_id"),
+}
+
+# Single-column indexes superseded by the account-scoped composites
+_RETIRED_INDEXES = (
+    "ix_email_threads_account_id",
+    "ix_email_threads_thread_id",
+    "ix_email_messages_account_id",
+    "ix_email_messages_thread_id",
+    "ix_email_messages_message_id",
+    "ix_email_messages_date",
+    "ix_email_messages_account_date",
+)
+
+
+def _backfill_providers(engine: Engine, grant_provider: Callable[[str], Optional[str]]) -> None:
+    """
+    Replace the placeholder provider ("nylas") older callbacks stored with the
+    grant's real one. Stops at the first failed lookup (Nylas unreachable), so
+    startup pays at most one timeout; the rest are retried on the next start.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT id, nylas_grant_id FROM accounts WHERE provider IS NULL OR provider = 'nylas'"
+        )).all()
+    for account_id, grant_id in rows:
+        try:
+            provider = grant_provider(grant_id)
+        except Exception:
+            return
+        if provider:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("UPDATE accounts SET provider = :provider WHERE id = :id"),
+                    {"provider": provider, "id": account_id},
+                )
+
+
+def upgrade_schema(
+    engine: Engine, grant_provider: Optional[Callable[[str], Optional[str]]] = None
+) -> Dict[int, List[str]]:
+    """
+    Create missing tables, and bring existing SQLite tables up to the models:
+    add new nullable columns, backfill derived ones, create missing indexes
+    (deduplicating first for unique ones) and drop retired ones. Statistics
+    are refreshed whenever the indexes change, so the planner sees them.
+    `create_all` alone never touches tables that already exist. With
+    `grant_provider`, accounts stored without their mail provider get it.
+
+    Returns the accounts that had duplicate rows removed, each with the
+    message ids whose duplicates went: their chunks, digests and cached
+    answers were built from the removed rows too (see
+    `services.retention.reconcile_deduplicated`).
+    """
+    deduplicated: Dict[int, List[str]] = {}
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {ddl_type}'))
+                backfill = _BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    conn.execute(text(backfill))
+        changed = False
+        for table in Base.metadata.sorted_tables:
+            # From sqlite_master: the inspector leaves out expression indexes
+            present = set(conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {"table": table.name},
+            ).scalars())
+            for index in table.indexes:
+                if index.name in present:
+                    continue
+                if index.unique and index.name in _DEDUPES:
+                    name, key = _DEDUPES[index.name]
+                    stale = f"id NOT IN (SELECT max(id) FROM {name} GROUP BY account_id, {key})"
+                    for account_id, value in conn.execute(
+                        text(f"SELECT DISTINCT account_id, {key} FROM {name} WHERE {stale}")
+                    ):
+                        message_ids = deduplicated.setdefault(account_id, [])
+                        if name == "email_messages":
+                            message_ids.append(value)
+                    conn.execute(text(f"DELETE FROM {name} WHERE {stale}"))
+                index.create(bind=conn)
+                changed = True
+            for name in present.intersection(_RETIRED_INDEXES):
+                conn.execute(text(f'DROP INDEX "{name}"'))
+                changed = True
+        if changed:
+            conn.execute(text("ANALYZE"))
+    if grant_provider is not None:
+        _backfill_providers(engine, grant_provider)
+    return deduplicated
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
+from time import perf_counter
+from typing import AsyncIterator
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from pathlib import Path
 
 from config import load_config
+from utils.metrics import histogram
 
 
 config = load_config()
@@ -12,11 +17,80 @@ Path(config.sqlite_path).parent.mkdir(parents=True, exist_ok=True)
 
 engine = create_engine(
     f"sqlite:///{config.sqlite_path}",
-    connect_args={"check_same_thread": False},
+    connect_args={"check_same_thread": False, "timeout": config.sqlite_busy_timeout_ms / 1000},
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Route handlers read through the async engine so a query never blocks the
+# event loop; batch writers (sync, digests, usage) keep the sync engine on
+# their worker threads. Both open the same database file.
+async_engine = create_async_engine(
+    f"sqlite+aiosqlite:///{config.sqlite_path}",
+    connect_args={"timeout": config.sqlite_busy_timeout_ms / 1000},
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+DB_STATEMENT_SECONDS = histogram("db_statement_seconds", "SQLite statement latency", ["operation"])
+DB_TRANSACTION_SECONDS = histogram("db_transaction_seconds", "SQLite session transaction duration")
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    """
+    Per-connection tuning. In WAL mode readers never wait for the writer (and
+    the writer never waits for readers); synchronous=NORMAL only syncs at
+    checkpoints, which WAL keeps crash-safe. The busy timeout makes a second
+    writer wait for the lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        if config.sqlite_wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size={-int(config.sqlite_cache_size_mb) * 1024}")  # negative = KiB
+        cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size_mb) * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _statement_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_start", []).append(perf_counter())
+
+
+def _statement_end(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["statement_start"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    DB_STATEMENT_SECONDS.observe(perf_counter() - start, operation=operation)
+
+
+def _statement_error(context):
+    conn = context.connection
+    if conn is not None and conn.info.get("statement_start"):
+        conn.info["statement_start"].pop()
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "connect", _apply_pragmas)
+    event.listen(_engine, "before_cursor_execute", _statement_start)
+    event.listen(_engine, "after_cursor_execute", _statement_end)
+    event.listen(_engine, "handle_error", _statement_error)
+
+
+# On Session itself, so AsyncSession transactions (which run a Session underneath) are timed too
+@event.listens_for(Session, "after_transaction_create")
+def _transaction_start(session, transaction):
+    if transaction.parent is None:
+        session.info["transaction_start"] = perf_counter()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _transaction_end(session, transaction):
+    start = session.info.pop("transaction_start", None) if transaction.parent is None else None
+    if start is not None:
+        DB_TRANSACTION_SECONDS.observe(perf_counter() - start)
+
 
 def get_db() -> Session:
     """Database dependency for FastAPI"""
@@ -25,3 +99,9 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Async database dependency for FastAPI"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
-from orchestrator.chat_workflow import build_chat_workflow, get_checkpointer
+from orchestrator.chat_workflow import build_chat_workflow, get_checkpointer, get_eval_workflow, contexts_to_sources
 from orchestrator.models.chat import ChatState
+from orchestrator.streaming import TokenStream, get_token_sink, set_token_sink
+from orchestrator.coalescing import Flight, RequestCoalescer, get_coalescer
 
 __all__ = [
     "build_chat_workflow",
     "get_checkpointer",
+    "get_eval_workflow",
+    "contexts_to_sources",
     "ChatState",
+    "TokenStream",
+    "get_token_sink",
+    "set_token_sink",
+    "Flight",
+    "RequestCoalescer",
+    "get_coalescer",
 ]
 
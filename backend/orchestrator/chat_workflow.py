@@ -1,86 +1,328 @@
 from __future__ import annotations
 
-from typing import Literal
+import asyncio
+from datetime import UTC, datetime
+from typing import Literal, List, Dict, Any, Optional, Tuple
 from time import perf_counter
 
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
 
 from config import load_config
 from services.ingest import embed_texts
 from services.vectorstore import query_chunks
+from services.answer_cache import get_answer_cache
+from services.structured_query import parse_question, run_structured_query
+from services.digest import get_digest, match_digest_question
+from services.usage import get_usage_tracker, usage_stage
+from utils.metrics import counter, gauge, histogram, timed
 from orchestrator.models.chat import ChatState
+from orchestrator.streaming import get_token_sink
+from orchestrator.checkpointer import create_checkpointer
 from agents.chat_agent import ChatAgent
+from agents.intent_classifier import get_intent_classifier, log_router_decision, simple_reply
 
 
 config = load_config()
 _chat_agent = ChatAgent()
-_checkpointer = MemorySaver()  # In-memory checkpointing
+_checkpointer = create_checkpointer()  # Bounded; optionally persisted to SQLite
+_answer_cache = get_answer_cache()
+
+NODE_SECONDS = histogram("workflow_node_seconds", "Chat workflow node latency", ["node"])
+NODE_ERRORS = counter("workflow_node_errors_total", "Chat workflow node failures", ["node"])
+ANSWER_CACHE_LOOKUPS = counter("answer_cache_lookups_total", "Answer cache lookups by result", ["result"])
+INTENT_ROUTES = counter("intent_routes_total", "Intent routing decisions by source and route", ["source", "route"])
+STRUCTURED_QUERIES = counter("structured_queries_total", "Questions answered from SQL, by query kind", ["kind"])
+DIGEST_ANSWERS = counter("digest_answers_total", "Questions answered from a materialized digest", ["period"])
+SPECULATIVE_RETRIEVALS = counter("speculative_retrievals_total", "Speculative retrievals by outcome", ["outcome"])
+gauge("checkpointer_threads", "Conversation threads held by the checkpointer", callback=lambda: _checkpointer.stats()["threads"])
+gauge("checkpointer_bytes", "Serialized checkpoint bytes held in memory", callback=lambda: _checkpointer.stats()["bytes"])
+
+
+@timed(NODE_SECONDS, NODE_ERRORS, node="structured_query")
+async def structured_query(state: ChatState) -> ChatState:
+    """
+    Answer date-window digests and count, list and top-sender questions
+    exactly from message metadata.
+
+    Runs before the answer cache: these answers depend on the clock and read
+    state, take milliseconds, and need no embedding. Questions that don't parse
+    into a digest or structured query, or whose query fails, continue to the cache.
+    """
+    state.current_step = "check_cache"
+    period = match_digest_question(state.question) if config.digest_enabled else None
+    if period:
+        try:
+            digest = await asyncio.to_thread(get_digest, state.account_id, period)
+        except Exception as e:
+            NODE_ERRORS.inc(node="structured_query")
+            state.metadata["digest_error"] = str(e)
+        else:
+            DIGEST_ANSWERS.inc(period=period)
+            state.answer = digest.text
+            state.sources = digest.sources()
+            state.current_step = "output"
+            state.metadata["intent_source"] = "digest"
+            state.metadata["digest"] = {
+                "period": period,
+                "messages": digest.message_count,
+                "threads": digest.thread_count,
+                "unread": digest.unread_count,
+            }
+            return state
+
+    if not config.structured_query_enabled:
+        return state
+
+    query = parse_question(state.question)
+    if query is None:
+        return state
+
+    try:
+        result = await asyncio.to_thread(run_structured_query, state.account_id, query)
+    except Exception as e:
+        NODE_ERRORS.inc(node="structured_query")
+        state.metadata["structured_query_error"] = str(e)
+        return state
+
+    STRUCTURED_QUERIES.inc(kind=query.kind)
+    state.answer = result.answer
+    state.sources = result.sources
+    state.current_step = "output"
+    state.metadata["intent_source"] = "structured"
+    state.metadata["structured_query"] = {
+        "kind": query.kind,
+        "target": query.target,
+        "sender": query.sender,
+        "unread": query.unread,
+        "has_attachments": query.has_attachments,
+        "period": query.period,
+        "total": result.total,
+        "rows": result.rows,
+        "sql_ms": round(result.sql_ms, 2),
+    }
+    return state
 
 
+@timed(NODE_SECONDS, NODE_ERRORS, node="check_cache")
+@usage_stage("check_cache")
+async def check_cache(state: ChatState) -> ChatState:
+    """
+    Serve semantically equivalent questions from the answer cache.
+
+    Tries an exact match on the normalized question first, then embeds the
+    question and compares it against cached questions for the account. The
+    embedding is kept on the state so retrieval doesn't pay for it twice.
+    """
+    start_time = perf_counter()
+    state.index_generation = _answer_cache.generation(state.account_id)
+    state.current_step = "clarify_intent"
+
+    # Follow-up questions depend on the conversation, not just their own text
+    if not config.answer_cache_enabled or state.conversation_history:
+        ANSWER_CACHE_LOOKUPS.inc(result="skipped")
+        return state
+
+    try:
+        hit = _answer_cache.lookup_exact(
+            state.account_id, state.question, state.top_k, state.temperature, state.max_tokens
+        )
+        if hit is None:
+            state.query_embedding = (await embed_texts([state.question.lower()]))[0]
+            hit = _answer_cache.lookup(
+                state.account_id, state.query_embedding, state.top_k, state.temperature, state.max_tokens
+            )
+    except Exception:
+        # A cache failure should only cost us the shortcut, never the answer
+        hit = None
+
+    state.metadata["cache_hit"] = hit is not None
+    ANSWER_CACHE_LOOKUPS.inc(result="hit" if hit is not None else "miss")
+    if hit is not None:
+        state.answer = hit.answer
+        state.sources = [dict(s) for s in hit.sources]
+        state.current_step = "output"
+
+    state.metadata["check_cache_ms"] = round((perf_counter() - start_time) * 1000)
+    return state
+
+
+@timed(NODE_SECONDS, NODE_ERRORS, node="clarify_intent")
+@usage_stage("clarify_intent")
 async def clarify_intent(state: ChatState) -> ChatState:
     """
-    LLM-based intent router called once at workflow entry.
+    Intent router called once at workflow entry.
     Routes simple questions to output, email queries to retrieve.
+
+    A local classifier answers first; the LLM router is only called when it is
+    not confident, or when it picks `output` for a question without a local
+    reply, and its decisions are logged as training data. In speculative mode
+    the query embedding and vector search start alongside the router call. If
+    the router picks `retrieve`, the prefetched contexts are used and the
+    workflow jumps straight to generate; otherwise they are dropped.
     """
     start_time = perf_counter()
 
-    routing_decision = await _chat_agent.clarify_and_route(
-        question=state.question,
-        contexts=state.raw_contexts,
-        max_tokens=state.max_tokens
-    )
+    classifier = get_intent_classifier()
+    local = classifier.predict(state.question) if classifier and not state.raw_contexts else None
+    reply = simple_reply(state.question) if local and local[0] == "output" else None
+    if local and (local[0] != "output" or reply):
+        state.current_step, confidence = local
+        if reply:
+            state.answer = reply
+        state.metadata["intent_source"] = "local"
+        INTENT_ROUTES.inc(source="local", route=state.current_step)
+        state.metadata["intent_confidence"] = round(confidence, 3)
+        state.metadata["clarify_intent_ms"] = round((perf_counter() - start_time) * 1000, 3)
+        return state
+
+    speculative = None
+    if config.speculative_retrieval and not state.raw_contexts:
+        speculative = asyncio.create_task(
+            _timed_search(state.account_id, state.question, state.top_k, state.query_embedding)
+        )
+
+    try:
+        routing_decision = await _chat_agent.clarify_and_route(
+            question=state.question,
+            contexts=state.raw_contexts,
+            max_tokens=state.max_tokens
+        )
+    except BaseException:
+        if speculative:
+            speculative.cancel()
+        raise
+    route_ms = (perf_counter() - start_time) * 1000
+    state.metadata["intent_source"] = "llm"
+    INTENT_ROUTES.inc(source="llm", route=routing_decision.route_to)
+    if not state.raw_contexts:
+        # A file append; keep it off the event loop
+        await asyncio.to_thread(log_router_decision, state.question, routing_decision.route_to)
 
     if routing_decision.simple_response:
         state.answer = routing_decision.simple_response
 
     state.current_step = routing_decision.route_to
 
+    if speculative and routing_decision.route_to == "retrieve":
+        try:
+            contexts, embedding, retrieve_ms = await speculative
+        except Exception:
+            # Leave it to the regular retrieve node, which records the error
+            contexts = None
+
+        if contexts is not None:
+            wall_ms = (perf_counter() - start_time) * 1000
+            state.raw_contexts = contexts
+            state.query_embedding = embedding
+            state.current_step = "generate"
+            state.metadata["retrieve_ms"] = round(retrieve_ms)
+            SPECULATIVE_RETRIEVALS.inc(outcome="used")
+            state.metadata["speculative"] = {
+                "used": True,
+                "route_ms": round(route_ms),
+                "retrieve_ms": round(retrieve_ms),
+                "wall_ms": round(wall_ms),
+                "saved_ms": max(0, round(route_ms + retrieve_ms - wall_ms)),
+            }
+    elif speculative:
+        speculative.cancel()
+        SPECULATIVE_RETRIEVALS.inc(outcome="discarded")
+        state.metadata["speculative"] = {"used": False, "route_ms": round(route_ms), "saved_ms": 0}
+
     clarify_time = (perf_counter() - start_time) * 1000
     state.metadata["clarify_intent_ms"] = round(clarify_time)
 
     return state
 
 
-def retrieve(state: ChatState) -> ChatState:
-    """Retrieve relevant email contexts using vector similarity"""
+async def search_contexts(
+    account_id: int,
+    question: str,
+    top_k: int,
+    query_embedding: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """Embed the question (unless already embedded) and fetch the top-k chunks"""
+    q_emb = query_embedding or (await embed_texts([question.lower()]))[0]
+    # Chroma's client is synchronous; the OpenAI call above no longer needs a thread
+    res = await asyncio.to_thread(query_chunks, account_id, q_emb, top_k=top_k)
+
+    contexts = []
+    for i in range(len(res.get("ids", [[]])[0])):
+        contexts.append({
+            "text": res["documents"][0][i],
+            "metadata": res["metadatas"][0][i],
+            "distance": res["distances"][0][i],
+        })
+    return contexts, q_emb
+
+
+@usage_stage("retrieve")
+async def _timed_search(
+    account_id: int,
+    question: str,
+    top_k: int,
+    query_embedding: Optional[List[float]] = None,
+) -> Tuple[List[Dict[str, Any]], List[float], float]:
     start_time = perf_counter()
+    contexts, q_emb = await search_contexts(account_id, question, top_k, query_embedding)
+    return contexts, q_emb, (perf_counter() - start_time) * 1000
 
-    query_text = state.question.lower()
 
+@timed(NODE_SECONDS, NODE_ERRORS, node="retrieve")
+@usage_stage("retrieve")
+async def retrieve(state: ChatState) -> ChatState:
+    """Retrieve relevant email contexts using vector similarity"""
     try:
-        q_emb = embed_texts([query_text])[0]
-        res = query_chunks(state.account_id, q_emb, top_k=state.top_k)
-
-        contexts = []
-        for i in range(len(res.get("ids", [[]])[0])):
-            contexts.append({
-                "text": res["documents"][0][i],
-                "metadata": res["metadatas"][0][i],
-                "distance": res["distances"][0][i],
-            })
-
+        contexts, q_emb, retrieve_time = await _timed_search(
+            state.account_id, state.question, state.top_k, state.query_embedding
+        )
         state.raw_contexts = contexts
-        retrieve_time = (perf_counter() - start_time) * 1000
+        state.query_embedding = q_emb
         state.metadata["retrieve_ms"] = round(retrieve_time)
 
     except Exception as e:
         state.error = f"Retrieval failed: {e}"
+        NODE_ERRORS.inc(node="retrieve")
         state.raw_contexts = []
 
     return state
 
 
+@timed(NODE_SECONDS, NODE_ERRORS, node="output")
 def output(state: ChatState) -> ChatState:
     """Output final responses - ensures all paths have proper answer and sources"""
     if state.answer is None:
         state.answer = "I'm here to help you with your emails. What would you like to know?"
 
+    # Record the turn so the next request on this conversation can continue it
+    ts = datetime.now(UTC).isoformat()
+    turns = state.conversation_history + [
+        {"role": "user", "content": state.question, "ts": ts},
+        {"role": "assistant", "content": state.answer, "ts": ts},
+    ]
+    state.conversation_history = turns[-2 * config.conversation_max_turns:]
+
+    tracker = get_usage_tracker()
+    if tracker is not None:
+        state.metadata["usage"] = tracker.summary()
+
     return state
 
 
+def contexts_to_sources(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Flatten retrieved contexts into citation sources (metadata plus chunk text)"""
+    sources = []
+    for ctx in contexts:
+        meta = ctx.get("metadata", {}).copy()
+        meta["text"] = ctx.get("text", "")
+        sources.append(meta)
+    return sources
+
+
+@timed(NODE_SECONDS, NODE_ERRORS, node="generate")
+@usage_stage("generate")
 async def generate(state: ChatState) -> ChatState:
-    """Generate answer using retrieved email contexts"""
+    """Generate answer using retrieved email contexts, streaming tokens when a sink is set"""
     start_time = perf_counter()
 
     try:
@@ -89,42 +331,85 @@ async def generate(state: ChatState) -> ChatState:
             contexts=state.raw_contexts,
             conversation_history=state.conversation_history,
             temperature=state.temperature,
-            max_tokens=state.max_tokens
+            max_tokens=state.max_tokens,
+            on_token=get_token_sink(),
+            metadata=state.metadata,
+            query_embedding=state.query_embedding,
         )
 
-        state.sources = []
-        for ctx in state.raw_contexts:
-            meta = ctx.get("metadata", {}).copy()
-            meta["text"] = ctx.get("text", "")
-            state.sources.append(meta)
+        state.sources = contexts_to_sources(state.raw_contexts)
 
         generation_time = (perf_counter() - start_time) * 1000
         state.metadata["generation_ms"] = round(generation_time)
 
+        if (
+            config.answer_cache_enabled
+            and not state.error
+            and not state.conversation_history
+            and state.query_embedding
+            and state.index_generation is not None
+        ):
+            _answer_cache.store(
+                state.account_id,
+                question=state.question,
+                embedding=state.query_embedding,
+                answer=state.answer,
+                sources=state.sources,
+                top_k=state.top_k,
+                generation=state.index_generation,
+                temperature=state.temperature,
+                max_tokens=state.max_tokens,
+            )
+
     except Exception as e:
         state.error = f"Generation failed: {e}"
+        NODE_ERRORS.inc(node="generate")
         state.answer = f"Sorry, I encountered an error while generating the answer: {e}"
 
     return state
 
 
-def route_after_clarify_intent(state: ChatState) -> Literal["retrieve", "output"]:
-    """Route based on LLM decision: simple -> output, email query -> retrieve"""
+def route_after_structured_query(state: ChatState) -> Literal["check_cache", "output"]:
+    """Route SQL-answered questions straight to output, everything else to the answer cache"""
     return state.current_step
 
 
+def route_after_check_cache(state: ChatState) -> Literal["clarify_intent", "output"]:
+    """Route cache hits straight to output, everything else to the intent router"""
+    return state.current_step
 
 
-def build_chat_workflow() -> StateGraph:
+def route_after_clarify_intent(state: ChatState) -> Literal["retrieve", "generate", "output"]:
+    """
+    Route based on LLM decision: simple -> output, email query -> retrieve,
+    email query with speculatively prefetched contexts -> generate
     """
-    Build the chat workflow with single LLM intent router at entry.
+    return state.current_step
+
+
+
+
+def build_chat_workflow(checkpoint: bool = True, shortcuts: bool = True) -> StateGraph:
+    """
+    Build the chat workflow with structured queries, an answer cache and a single LLM intent router at entry.
 
     Flow:
+      structured_query → [output → END | check_cache → ...]
+      check_cache → [output → END | clarify_intent → ...]
       clarify_intent → [output → END | retrieve → generate → output → END]
+      clarify_intent (speculative retrieval used) → generate → output → END
 
     Routes:
+    - Count/list/top-sender questions → output → END
+    - Cached answers → output → END
     - Simple questions → output → END
     - Email queries → retrieve → generate → output → END
+
+    With `checkpoint=False` the graph keeps no conversation state: every
+    invocation is independent and no thread_id is needed. With
+    `shortcuts=False` it starts at clarify_intent: no digest, structured query
+    or answer cache, so every question goes through retrieval and generation
+    (and nothing is stored in the answer cache).
     """
     graph = StateGraph(ChatState)
 
@@ -133,19 +418,50 @@ def build_chat_workflow() -> StateGraph:
     graph.add_node("retrieve", retrieve)
     graph.add_node("generate", generate)
 
-    graph.set_entry_point("clarify_intent")
+    if shortcuts:
+        graph.add_node("structured_query", structured_query)
+        graph.add_node("check_cache", check_cache)
+        graph.set_entry_point("structured_query")
+
+        graph.add_conditional_edges(
+            "structured_query",
+            route_after_structured_query,
+            {"check_cache": "check_cache", "output": "output"}
+        )
+
+        graph.add_conditional_edges(
+            "check_cache",
+            route_after_check_cache,
+            {"clarify_intent": "clarify_intent", "output": "output"}
+        )
+    else:
+        graph.set_entry_point("clarify_intent")
 
     graph.add_conditional_edges(
         "clarify_intent",
         route_after_clarify_intent,
-        {"retrieve": "retrieve", "output": "output"}
+        {"retrieve": "retrieve", "generate": "generate", "output": "output"}
     )
 
     graph.add_edge("retrieve", "generate")
     graph.add_edge("generate", "output")
     graph.add_edge("output", END)
 
-    return graph.compile(checkpointer=_checkpointer)
+    return graph.compile(checkpointer=_checkpointer if checkpoint else None)
+
+
+_eval_workflow = None
+
+
+def get_eval_workflow():
+    """
+    Workflow shared by evaluation runs, compiled once, without a checkpointer
+    and without the SQL/digest/cache shortcuts, so runs measure the RAG pipeline
+    """
+    global _eval_workflow
+    if _eval_workflow is None:
+        _eval_workflow = build_chat_workflow(checkpoint=False, shortcuts=False)
+    return _eval_workflow
 
 
 # Export the checkpointer for external use
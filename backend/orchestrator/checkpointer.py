@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+from config import load_config
+from database import SessionLocal, ConversationCheckpoint
+
+
+config = load_config()
+
+# Per-request working data that the next turn never reads back
+TRANSIENT_CHANNELS = ("raw_contexts", "query_embedding")
+
+
+def compact_channel_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop retrieved context text and embeddings; keep citations without their chunk text"""
+    compact = {k: v for k, v in values.items() if k not in TRANSIENT_CHANNELS}
+    if compact.get("sources"):
+        compact["sources"] = [
+            {k: v for k, v in src.items() if k != "text"} for src in compact["sources"]
+        ]
+    return compact
+
+
+@dataclass
+class _Entry:
+    checkpoint: Checkpoint
+    metadata: CheckpointMetadata
+    parent_id: Optional[str]
+    size: int
+    touched: float = field(default_factory=monotonic)
+    writes: Dict[Tuple[str, int], Tuple[str, str, Any]] = field(default_factory=dict)
+
+
+class CheckpointStore:
+    """SQLite persistence for the latest compacted checkpoint of each thread"""
+
+    def __init__(self, saver: BaseCheckpointSaver, ttl_seconds: float) -> None:
+        self.serde = saver.serde
+        self.ttl_seconds = ttl_seconds
+
+    def load(
+        self, thread_id: str, checkpoint_ns: str
+    ) -> Optional[Tuple[Checkpoint, CheckpointMetadata, Optional[str], int]]:
+        """The thread's checkpoint, metadata, parent id and serialized size (as `save` returns it)"""
+        db = SessionLocal()
+        try:
+            row = db.get(ConversationCheckpoint, (thread_id, checkpoint_ns))
+            if row is None:
+                return None
+            if row.updated_at and row.updated_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+                db.delete(row)
+                db.commit()
+                return None
+            return (
+                self.serde.loads_typed((row.checkpoint_type, row.checkpoint)),
+                self.serde.loads_typed((row.metadata_type, row.metadata_)),
+                row.parent_checkpoint_id,
+                len(row.checkpoint or b""),
+            )
+        finally:
+            db.close()
+
+    def save(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        parent_id: Optional[str],
+    ) -> int:
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        db = SessionLocal()
+        try:
+            db.merge(ConversationCheckpoint(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=parent_id,
+                checkpoint_type=checkpoint_type,
+                checkpoint=checkpoint_blob,
+                metadata_type=metadata_type,
+                metadata_=metadata_blob,
+                updated_at=datetime.utcnow(),
+            ))
+            db.commit()
+        finally:
+            db.close()
+        return len(checkpoint_blob)
+
+    def thread_ids(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            return [r[0] for r in db.query(ConversationCheckpoint.thread_id).distinct()]
+        finally:
+            db.close()
+
+    def delete(self, thread_id: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ConversationCheckpoint).filter(ConversationCheckpoint.thread_id == thread_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_expired(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        db = SessionLocal()
+        try:
+            deleted = (
+                db.query(ConversationCheckpoint)
+                .filter(ConversationCheckpoint.updated_at < cutoff)
+                .delete()
+            )
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+class BoundedCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer that keeps only the latest, compacted checkpoint of each thread.
+
+    Threads are evicted least-recently-used first once there are more than
+    `max_threads` of them, their estimated size exceeds `max_bytes`, or they
+    have been idle for `ttl_seconds`. With a `CheckpointStore`, every checkpoint
+    is written through to SQLite and the store is the source of truth on reads,
+    so conversations survive restarts and are shared across workers. Pending
+    writes (only needed to resume an interrupted run) stay in memory.
+    """
+
+    PURGE_EVERY = 500
+
+    def __init__(
+        self,
+        max_threads: int = 1000,
+        ttl_seconds: float = 86400.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        persistent: bool = False,
+    ) -> None:
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.store = CheckpointStore(self, ttl_seconds) if persistent else None
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._puts = 0
+        self._lock = threading.RLock()
+
+    # Introspection
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads": len(self._entries),
+                "bytes": self._bytes,
+                "max_threads": self.max_threads,
+                "max_bytes": self.max_bytes,
+                "persistent": self.store is not None,
+            }
+
+    # Sync API
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() - entry.touched > self.ttl_seconds:
+                self._drop(key)
+                entry = None
+
+        if self.store is not None:
+            stored = self.store.load(thread_id, checkpoint_ns)
+            if stored is None:
+                return None
+            checkpoint, metadata, parent_id, size = stored
+            with self._lock:
+                if entry is None or entry.checkpoint["id"] != checkpoint["id"]:
+                    # Another worker moved the thread on (or we restarted); our cached copy is stale
+                    entry = _Entry(checkpoint, metadata, parent_id, size=size)
+                    self._insert(key, entry)
+
+        if entry is None:
+            return None
+
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        if checkpoint_id and checkpoint_id != entry.checkpoint["id"]:
+            return None  # Only the latest checkpoint is kept
+
+        with self._lock:
+            entry.touched = monotonic()
+            self._entries.move_to_end(key)
+            return self._tuple(thread_id, checkpoint_ns, entry)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None:
+            thread_ids = [config["configurable"]["thread_id"]]
+        elif self.store is not None:
+            thread_ids = self.store.thread_ids()
+        else:
+            with self._lock:
+                thread_ids = list(dict.fromkeys(t for t, _ in self._entries))
+
+        for thread_id in thread_ids:
+            if limit is not None and limit <= 0:
+                return
+            tup = self.get_tuple({"configurable": {"thread_id": thread_id}})
+            if tup is None:
+                continue
+            before_id = before["configurable"].get("checkpoint_id") if before else None
+            if before_id and tup.checkpoint["id"] >= before_id:
+                continue
+            if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield tup
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+
+        compact = {**checkpoint, "channel_values": compact_channel_values(checkpoint["channel_values"])}
+        if self.store is not None:
+            size = self.store.save(thread_id, checkpoint_ns, compact, metadata, parent_id)
+        else:
+            size = len(self.serde.dumps_typed(compact)[1])
+
+        with self._lock:
+            self._insert((thread_id, checkpoint_ns), _Entry(compact, metadata, parent_id, size))
+            self._puts += 1
+            purge = self.store is not None and self._puts % self.PURGE_EVERY == 0
+
+        if purge:
+            self.store.purge_expired()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        key = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.checkpoint["id"] != checkpoint_id:
+                return
+            for idx, (channel, value) in enumerate(writes):
+                if channel in TRANSIENT_CHANNELS:
+                    continue
+                entry.writes[(task_id, idx)] = (task_id, channel, value)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == thread_id]:
+                self._drop(key)
+        if self.store is not None:
+            self.store.delete(thread_id)
+
+    # Async API: the in-memory path never blocks; SQLite I/O goes to a worker thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if self.store is None:
+            return self.get_tuple(config)
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if self.store is None:
+            return self.put(config, checkpoint, metadata, new_versions)
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # Internals (callers hold the lock)
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, entry: _Entry) -> CheckpointTuple:
+        checkpoint = {**entry.checkpoint, "channel_values": dict(entry.checkpoint["channel_values"])}
+        parent_config = None
+        if entry.parent_id:
+            parent_config = {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": entry.parent_id,
+                }
+            }
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": entry.checkpoint["id"],
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=entry.metadata,
+            parent_config=parent_config,
+            pending_writes=list(entry.writes.values()),
+        )
+
+    def _insert(self, key: Tuple[str, str], entry: _Entry) -> None:
+        self._drop(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    def _evict(self) -> None:
+        now = monotonic()
+        while self._entries:
+            key, oldest = next(iter(self._entries.items()))
+            over = (
+                len(self._entries) > self.max_threads
+                or self._bytes > self.max_bytes
+                or now - oldest.touched > self.ttl_seconds
+            )
+            if not over or len(self._entries) == 1:
+                break
+            self._drop(key)
+
+
+def create_checkpointer() -> BoundedCheckpointer:
+    """Build the workflow checkpointer from config (CHECKPOINT_BACKEND=memory|sqlite)"""
+    return BoundedCheckpointer(
+        max_threads=config.checkpoint_max_threads,
+        ttl_seconds=config.checkpoint_ttl_seconds,
+        max_bytes=config.checkpoint_max_bytes,
+        persistent=config.checkpoint_backend == "sqlite",
+    )
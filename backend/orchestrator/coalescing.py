@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from config import load_config
+from orchestrator.streaming import TokenStream
+from services.answer_cache import normalize_question
+from utils.metrics import counter, gauge
+
+
+config = load_config()
+
+COALESCE_REQUESTS = counter("chat_coalesce_requests_total", "Chat requests by whether they started a run or joined one", ["result"])
+
+
+class Flight:
+    """
+    One in-flight workflow execution shared by identical concurrent requests.
+
+    Everything the run publishes (answer tokens, node updates, errors) is kept
+    so a request that joins late can replay it before following the live events.
+    """
+
+    def __init__(self, key: Optional[Hashable]) -> None:
+        self.key = key
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+        self.info: Dict[str, Any] = {}
+        self.clients = 0
+        self.task: Optional[asyncio.Task] = None
+        self._events: List[Tuple[str, Any]] = []
+        self._subscribers: List[TokenStream] = []
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def push_token(self, delta: str) -> None:
+        if delta:
+            self._publish("token", delta)
+
+    def push_event(self, event: str, data: Any) -> None:
+        self._publish(event, data)
+
+    def subscribe(self, frame_ms: int = 50, frame_chars: int = 64) -> TokenStream:
+        """A token stream that replays this flight's events so far, then follows it"""
+        stream = TokenStream(frame_ms, frame_chars)
+        for kind, payload in self._events:
+            self._forward(stream, kind, payload)
+        if self.done:
+            stream.close()
+        else:
+            self._subscribers.append(stream)
+        return stream
+
+    async def wait(self) -> Dict[str, Any]:
+        """Final workflow state; re-raises the run's exception"""
+        await self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _publish(self, kind: str, payload: Any) -> None:
+        self._events.append((kind, payload))
+        for stream in self._subscribers:
+            self._forward(stream, kind, payload)
+
+    @staticmethod
+    def _forward(stream: TokenStream, kind: str, payload: Any) -> None:
+        if kind == "token":
+            stream.push_token(payload)
+        else:
+            stream.push_event(kind, payload)
+
+    def _finish(self) -> None:
+        self._done.set()
+        for stream in self._subscribers:
+            stream.close()
+        self._subscribers = []
+
+
+class RequestCoalescer:
+    """
+    Single-flight execution of identical concurrent chat requests.
+
+    The first request for a key starts the workflow; requests with the same key
+    that arrive while it runs attach to that flight instead of running their
+    own, and get the same answer (and, when streaming, the same tokens). A
+    flight is forgotten as soon as it finishes, so this only merges requests
+    that overlap in time; repeats after that are the answer cache's job. The
+    run is cancelled only when every attached request has gone away.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._flights: Dict[Hashable, Flight] = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.max_flight_size = 0
+
+    @staticmethod
+    def key(
+        account_id: int,
+        question: str,
+        top_k: int,
+        temperature: float,
+        max_tokens: int,
+        conversation_id: Optional[str] = None,
+    ) -> Tuple:
+        # Follow-ups depend on their conversation, so only identical threads share a run
+        return (account_id, normalize_question(question), top_k, temperature, max_tokens, conversation_id)
+
+    def join_running(self, key: Hashable) -> Optional[Flight]:
+        """
+        Attach to the in-flight run for `key` if there is one, never starting a
+        new run. Checking and attaching happen in one step, so the run cannot
+        finish in between. Call `leave(flight)` once done with it.
+        """
+        flight = self._flights.get(key) if self.enabled else None
+        if flight is None or flight.done:
+            return None
+        self.requests += 1
+        self._attach(flight)
+        return flight
+
+    def join(self, key: Hashable, run: Callable[[Flight], Awaitable[Dict[str, Any]]]) -> Tuple[Flight, bool]:
+        """
+        Attach to the in-flight run for `key`, or start `run(flight)` as a new one.
+        Returns (flight, started). Call `leave(flight)` once done with it.
+        """
+        self.requests += 1
+        flight = self._flights.get(key) if self.enabled else None
+        started = flight is None or flight.done
+        if started:
+            flight = Flight(key)
+            flight.task = asyncio.create_task(self._execute(flight, run))
+            self.executions += 1
+            COALESCE_REQUESTS.inc(result="executed")
+            if self.enabled:
+                self._flights[key] = flight
+            flight.clients += 1
+            self.max_flight_size = max(self.max_flight_size, flight.clients)
+        else:
+            self._attach(flight)
+        return flight, started
+
+    def _attach(self, flight: Flight) -> None:
+        self.coalesced += 1
+        COALESCE_REQUESTS.inc(result="coalesced")
+        flight.clients += 1
+        self.max_flight_size = max(self.max_flight_size, flight.clients)
+
+    def leave(self, flight: Flight) -> None:
+        flight.clients -= 1
+        if flight.clients <= 0 and not flight.done and flight.task is not None:
+            flight.task.cancel()
+
+    async def _execute(self, flight: Flight, run: Callable[[Flight], Awaitable[Dict[str, Any]]]) -> None:
+        try:
+            flight.result = await run(flight) or {}
+        except BaseException as e:
+            flight.error = e
+            if not isinstance(e, asyncio.CancelledError):
+                flight.push_event("error", f"{e}")
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight._finish()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+            "max_flight_size": self.max_flight_size,
+        }
+
+
+_coalescer = RequestCoalescer(enabled=config.coalesce_requests)
+gauge("chat_coalesce_in_flight", "Distinct chat workflow runs in flight", callback=lambda: _coalescer.stats()["in_flight"])
+
+
+def get_coalescer() -> RequestCoalescer:
+    """Get the process-wide request coalescer"""
+    return _coalescer
@@ -17,6 +17,8 @@ class ChatState(BaseModel):
     # Processing state
     intent: Optional[Literal["retrieve", "direct", "clarify"]] = None
     raw_contexts: List[Dict[str, Any]] = Field(default_factory=list)
+    query_embedding: Optional[List[float]] = None
+    index_generation: Optional[int] = None
 
     # Output
     answer: Optional[str] = None
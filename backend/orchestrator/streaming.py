@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+
+# Set by the streaming endpoint; read by the generate node. Context variables are
+# copied into the tasks LangGraph spawns for each node, so no state plumbing is needed.
+_token_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("token_sink", default=None)
+
+
+def get_token_sink() -> Optional[Callable[[str], None]]:
+    """Get the token callback for the current workflow run, if it is being streamed"""
+    return _token_sink.get()
+
+
+def set_token_sink(sink: Optional[Callable[[str], None]]) -> None:
+    """Route answer tokens generated in the current context to `sink`"""
+    _token_sink.set(sink)
+
+
+class TokenStream:
+    """
+    Queue between a running workflow and an SSE response.
+
+    Tokens are coalesced into frames that are flushed once `frame_chars`
+    characters are buffered or `frame_ms` has passed since the first buffered
+    token, whichever comes first. The first frame is flushed immediately so
+    coalescing never adds to time-to-first-token. Other events keep their order
+    relative to the tokens around them.
+    """
+
+    _TOKEN = "token"
+    _CLOSE = "close"
+
+    def __init__(self, frame_ms: int = 50, frame_chars: int = 64) -> None:
+        self.frame_s = frame_ms / 1000
+        self.frame_chars = frame_chars
+        self._queue: asyncio.Queue[Tuple[str, Any]] = asyncio.Queue()
+
+    def push_token(self, delta: str) -> None:
+        if delta:
+            self._queue.put_nowait((self._TOKEN, delta))
+
+    def push_event(self, event: str, data: Any) -> None:
+        self._queue.put_nowait((event, data))
+
+    def close(self) -> None:
+        self._queue.put_nowait((self._CLOSE, None))
+
+    async def frames(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield ("token", text) frames and pushed events until the stream is closed"""
+        loop = asyncio.get_running_loop()
+        buffer: List[str] = []
+        buffered = 0
+        deadline = 0.0
+        first_frame = True
+
+        while True:
+            if buffer:
+                try:
+                    kind, payload = await asyncio.wait_for(
+                        self._queue.get(), max(0.0, deadline - loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    yield self._TOKEN, "".join(buffer)
+                    buffer, buffered = [], 0
+                    continue
+            else:
+                kind, payload = await self._queue.get()
+
+            if kind == self._TOKEN:
+                if first_frame:
+                    first_frame = False
+                    yield self._TOKEN, payload
+                    continue
+                if not buffer:
+                    deadline = loop.time() + self.frame_s
+                buffer.append(payload)
+                buffered += len(payload)
+                if buffered >= self.frame_chars:
+                    yield self._TOKEN, "".join(buffer)
+                    buffer, buffered = [], 0
+                continue
+
+            if buffer:
+                yield self._TOKEN, "".join(buffer)
+                buffer, buffered = [], 0
+            if kind == self._CLOSE:
+                return
+            yield kind, payload
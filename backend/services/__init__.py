@@ -1,21 +1,45 @@
 from __future__ import annotations
 
 from services.nylas_client import NylasClient, new_state
+from services.openai_client import get_openai_client, chat_model
 from services.vectorstore import query_chunks, get_or_create_collection
 from services.ingest import normalize_message, index_messages, embed_texts
+from services.answer_cache import get_answer_cache, AnswerCache
+from services.structured_query import parse_question, run_structured_query
+from services.digest import get_digest, refresh_digests
+from services.admission import AdmissionRejected, get_admission_controller
+from services.usage import UsageTracker, start_usage_tracking, get_usage_tracker, record_usage, save_usage
 from services.eval.llm_judge import run_eval, EvalResult
 from services.eval.deepeval import run_deepeval, calculate_aggregate_metrics
+from services.sync import sync_account, get_sync_scheduler
 
 __all__ = [
     "NylasClient",
     "new_state",
+    "get_openai_client",
+    "chat_model",
     "query_chunks",
     "get_or_create_collection",
     "normalize_message",
     "index_messages",
     "embed_texts",
+    "get_answer_cache",
+    "AnswerCache",
+    "parse_question",
+    "run_structured_query",
+    "get_digest",
+    "refresh_digests",
+    "AdmissionRejected",
+    "get_admission_controller",
+    "UsageTracker",
+    "start_usage_tracking",
+    "get_usage_tracker",
+    "record_usage",
+    "save_usage",
     "run_eval",
     "EvalResult",
     "run_deepeval",
     "calculate_aggregate_metrics",
+    "sync_account",
+    "get_sync_scheduler",
 ]
@@ -0,0 +1,223 @@
+"""
+Admission control for the work classes sharing one worker.
+
+Interactive chat, mailbox sync and evaluation runs compete for the same event
+loop, thread pool and OpenAI rate limits. Each class gets its own concurrency
+limit, queue length and queue timeout, and all of them share a global limit in
+which the last `reserved_for_interactive` slots are only available to
+priority-0 (interactive) work. Freed slots go to queued requests in priority
+order. A request that cannot be queued, or waits too long, is rejected with an
+estimated retry delay instead of piling onto an overloaded worker.
+
+The controller is bound to the event loop it is used from and is not
+thread-safe; acquire and release from async code only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List
+
+from config import load_config
+from utils.metrics import counter, gauge, histogram
+
+
+config = load_config()
+
+ADMISSION_ACTIVE = gauge("admission_active", "Requests holding an admission slot", ["work_class"])
+ADMISSION_QUEUED = gauge("admission_queued", "Requests waiting for an admission slot", ["work_class"])
+ADMISSION_REJECTED = counter("admission_rejected_total", "Requests shed by admission control", ["work_class", "reason"])
+ADMISSION_WAIT_SECONDS = histogram("admission_wait_seconds", "Time spent queued before admission", ["work_class"])
+
+
+@dataclass(frozen=True)
+class WorkClass:
+    name: str
+    priority: int  # 0 is interactive; higher numbers yield to lower ones
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; `retry_after` is a suggested delay in seconds"""
+
+    def __init__(self, work_class: str, reason: str, retry_after: int) -> None:
+        super().__init__(f"{work_class} capacity exhausted ({reason}), retry after {retry_after}s")
+        self.work_class = work_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admission slot; release it exactly once (further calls are no-ops)"""
+
+    def __init__(self, controller: "AdmissionController", work_class: WorkClass) -> None:
+        self._controller = controller
+        self.work_class = work_class
+        self._started = perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.work_class, perf_counter() - self._started)
+
+
+@dataclass
+class _Waiter:
+    work_class: WorkClass
+    seq: int
+    since: float
+    future: asyncio.Future
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        classes: Iterable[WorkClass],
+        max_total: int,
+        reserved_for_interactive: int = 0,
+        enabled: bool = True,
+    ) -> None:
+        self.enabled = enabled
+        self.classes: Dict[str, WorkClass] = {c.name: c for c in classes}
+        self.max_total = max_total
+        self.reserved_for_interactive = reserved_for_interactive
+        self._active: Dict[str, int] = {name: 0 for name in self.classes}
+        self._queued: Dict[str, int] = {name: 0 for name in self.classes}
+        self._total = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        # Smoothed slot hold time per class, used for Retry-After estimates
+        self._hold_seconds: Dict[str, float] = {name: 1.0 for name in self.classes}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+
+    async def acquire(self, name: str) -> Ticket:
+        work_class = self.classes[name]
+        start = perf_counter()
+        if not self.enabled or (not self._queued[name] and self._can_start(work_class)):
+            return self._start(work_class, start)
+
+        if self._queued[name] >= work_class.max_queue:
+            self._reject(work_class, "queue_full")
+
+        waiter = _Waiter(work_class, next(self._seq), start, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._set_queued(name, +1)
+        try:
+            await asyncio.wait_for(waiter.future, work_class.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject(work_class, "timeout")
+        except BaseException:
+            # Cancelled by the caller after the slot was granted: hand it back
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(work_class, 0.0)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._set_queued(name, -1)
+        return Ticket(self, work_class)
+
+    @asynccontextmanager
+    async def admit(self, name: str) -> AsyncIterator[Ticket]:
+        ticket = await self.acquire(name)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def run_blocking(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run blocking `fn` on the work class's own thread pool, so batch work
+        can't exhaust the default executor that interactive requests use.
+        """
+        executor = self._executors.get(name)
+        if executor is None:
+            executor = self._executors[name] = ThreadPoolExecutor(
+                max_workers=self.classes[name].max_concurrency, thread_name_prefix=f"admission-{name}"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_total": self.max_total,
+            "active_total": self._total,
+            "classes": {
+                name: {
+                    "active": self._active[name],
+                    "queued": self._queued[name],
+                    "max_concurrency": c.max_concurrency,
+                    "max_queue": c.max_queue,
+                    "priority": c.priority,
+                }
+                for name, c in self.classes.items()
+            },
+        }
+
+    def _can_start(self, work_class: WorkClass) -> bool:
+        limit = self.max_total - (0 if work_class.priority == 0 else self.reserved_for_interactive)
+        return self._active[work_class.name] < work_class.max_concurrency and self._total < limit
+
+    def _start(self, work_class: WorkClass, queued_since: float) -> Ticket:
+        self._active[work_class.name] += 1
+        self._total += 1
+        ADMISSION_ACTIVE.set(self._active[work_class.name], work_class=work_class.name)
+        ADMISSION_WAIT_SECONDS.observe(perf_counter() - queued_since, work_class=work_class.name)
+        return Ticket(self, work_class)
+
+    def _release(self, work_class: WorkClass, held_seconds: float) -> None:
+        name = work_class.name
+        self._active[name] -= 1
+        self._total -= 1
+        ADMISSION_ACTIVE.set(self._active[name], work_class=name)
+        if held_seconds > 0:
+            self._hold_seconds[name] = 0.8 * self._hold_seconds[name] + 0.2 * held_seconds
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued requests, highest priority (then oldest) first"""
+        for waiter in sorted(self._waiters, key=lambda w: (w.work_class.priority, w.seq)):
+            if waiter.future.done() or not self._can_start(waiter.work_class):
+                continue
+            self._waiters.remove(waiter)
+            self._set_queued(waiter.work_class.name, -1)
+            self._start(waiter.work_class, waiter.since)
+            waiter.future.set_result(None)
+
+    def _set_queued(self, name: str, delta: int) -> None:
+        self._queued[name] += delta
+        ADMISSION_QUEUED.set(self._queued[name], work_class=name)
+
+    def _reject(self, work_class: WorkClass, reason: str) -> None:
+        name = work_class.name
+        waves = (self._queued[name] + 1) / max(1, work_class.max_concurrency)
+        retry_after = min(60, max(1, math.ceil(self._hold_seconds[name] * waves)))
+        ADMISSION_REJECTED.inc(work_class=name, reason=reason)
+        raise AdmissionRejected(name, reason, retry_after)
+
+
+_admission = AdmissionController(
+    classes=[
+        WorkClass("chat", 0, config.admission_chat_concurrency, config.admission_chat_queue, config.admission_chat_queue_timeout),
+        WorkClass("sync", 1, config.admission_sync_concurrency, config.admission_sync_queue, config.admission_sync_queue_timeout),
+        WorkClass("eval", 2, config.admission_eval_concurrency, config.admission_eval_queue, config.admission_eval_queue_timeout),
+    ],
+    max_total=config.admission_max_total,
+    reserved_for_interactive=config.admission_reserved_for_chat,
+    enabled=config.admission_enabled,
+)
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the process-wide admission controller"""
+    return _admission
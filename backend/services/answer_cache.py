@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import load_config
+from utils.metrics import gauge
+
+
+config = load_config()
+
+_WS_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[^\w\s@.]")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace for exact-match lookups"""
+    text = _PUNCT_RE.sub(" ", (question or "").lower())
+    return _WS_RE.sub(" ", text).strip()
+
+
+@dataclass
+class CachedAnswer:
+    """A generated answer, the sources it was grounded on and the settings it was generated with"""
+    question: str
+    answer: str
+    sources: List[Dict[str, Any]]
+    top_k: int
+    generation: int
+    temperature: float = 0.0
+    max_tokens: int = 0
+    created_at: float = field(default_factory=monotonic)
+    hits: int = 0
+
+
+class _AccountCache:
+    """Answers for one account, with their embeddings stacked for a single matmul lookup"""
+
+    def __init__(self) -> None:
+        self.entries: List[CachedAnswer] = []
+        self.by_text: Dict[str, CachedAnswer] = {}
+        self.vectors: Optional[np.ndarray] = None
+
+    def clear(self) -> None:
+        self.entries = []
+        self.by_text = {}
+        self.vectors = None
+
+
+class AnswerCache:
+    """
+    Per-account semantic answer cache.
+
+    Entries are keyed by the normalized question embedding and tagged with the
+    account's index generation. Any write to the account's vector index bumps
+    the generation, which drops every entry computed against the older index.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.92,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600.0,
+    ) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._accounts: Dict[int, _AccountCache] = defaultdict(_AccountCache)
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def size(self) -> int:
+        """Cached answers across all accounts"""
+        with self._lock:
+            return sum(len(bucket.entries) for bucket in self._accounts.values())
+
+    def generation(self, account_id: int) -> int:
+        return self._generations[account_id]
+
+    def bump_generation(self, account_id: int) -> int:
+        """Mark the account's index as changed and drop all of its cached answers"""
+        with self._lock:
+            self._generations[account_id] += 1
+            self._accounts[account_id].clear()
+            return self._generations[account_id]
+
+    def lookup_exact(
+        self, account_id: int, question: str, top_k: int, temperature: float, max_tokens: int
+    ) -> Optional[CachedAnswer]:
+        """Cheap lookup on the normalized question text, no embedding required"""
+        with self._lock:
+            bucket = self._accounts[account_id]
+            entry = bucket.by_text.get(normalize_question(question))
+            if (
+                entry is None
+                or not self._is_fresh(account_id, entry)
+                or not _same_settings(entry, top_k, temperature, max_tokens)
+            ):
+                return None
+            entry.hits += 1
+            return entry
+
+    def lookup(
+        self, account_id: int, embedding: List[float], top_k: int, temperature: float, max_tokens: int
+    ) -> Optional[CachedAnswer]:
+        """Return the most similar fresh answer above the similarity threshold"""
+        query = _unit(embedding)
+        with self._lock:
+            bucket = self._accounts[account_id]
+            if bucket.vectors is None or not bucket.entries:
+                return None
+            scores = bucket.vectors @ query
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.similarity_threshold:
+                    break
+                entry = bucket.entries[idx]
+                if _same_settings(entry, top_k, temperature, max_tokens) and self._is_fresh(account_id, entry):
+                    entry.hits += 1
+                    return entry
+        return None
+
+    def store(
+        self,
+        account_id: int,
+        question: str,
+        embedding: List[float],
+        answer: str,
+        sources: List[Dict[str, Any]],
+        top_k: int,
+        generation: int,
+        temperature: float,
+        max_tokens: int,
+    ) -> None:
+        """
+        Cache an answer computed against index `generation`.
+
+        Answers computed before a concurrent sync finished are discarded rather
+        than cached under the new generation.
+        """
+        with self._lock:
+            if generation != self._generations[account_id]:
+                return
+            bucket = self._accounts[account_id]
+            self._evict(account_id, bucket)
+
+            entry = CachedAnswer(
+                question=question,
+                answer=answer,
+                sources=sources,
+                top_k=top_k,
+                generation=generation,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            vector = _unit(embedding)[np.newaxis, :]
+            bucket.entries.append(entry)
+            bucket.by_text[normalize_question(question)] = entry
+            bucket.vectors = vector if bucket.vectors is None else np.vstack([bucket.vectors, vector])
+
+    def _is_fresh(self, account_id: int, entry: CachedAnswer) -> bool:
+        if entry.generation != self._generations[account_id]:
+            return False
+        return (monotonic() - entry.created_at) <= self.ttl_seconds
+
+    def _evict(self, account_id: int, bucket: _AccountCache) -> None:
+        """Drop expired entries, then the oldest ones until there is room for one more"""
+        keep = [
+            i for i, e in enumerate(bucket.entries) if self._is_fresh(account_id, e)
+        ]
+        overflow = len(keep) - self.max_entries + 1
+        if overflow > 0:
+            keep = keep[overflow:]
+        if len(keep) == len(bucket.entries):
+            return
+
+        entries = [bucket.entries[i] for i in keep]
+        vectors = bucket.vectors[keep] if keep and bucket.vectors is not None else None
+        bucket.clear()
+        bucket.entries = entries
+        bucket.vectors = vectors
+        bucket.by_text = {normalize_question(e.question): e for e in entries}
+
+
+def _same_settings(entry: CachedAnswer, top_k: int, temperature: float, max_tokens: int) -> bool:
+    """Answers only match requests generated with the same retrieval depth and sampling settings"""
+    return entry.top_k == top_k and entry.temperature == temperature and entry.max_tokens == max_tokens
+
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+_answer_cache = AnswerCache(
+    similarity_threshold=config.answer_cache_similarity,
+    max_entries=config.answer_cache_max_entries,
+    ttl_seconds=config.answer_cache_ttl_seconds,
+)
+gauge("answer_cache_entries", "Cached answers across all accounts", callback=_answer_cache.size)
+
+
+def get_answer_cache() -> AnswerCache:
+    """Get the process-wide answer cache"""
+    return _answer_cache
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.metrics import counter
+from utils.tokens import count_tokens
+from services.ingest import embed_texts
+
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+SEPARATOR = "\n\n"
+GAP = " … "
+
+PACKING_FALLBACKS = counter(
+    "context_packing_fallbacks_total", "Context packings that ranked by retrieval order because sentence embedding failed"
+)
+
+
+@dataclass
+class PackedContext:
+    """Prompt-ready context text plus what packing did to it"""
+    text: str
+    tokens: int
+    original_tokens: int
+    sentences_kept: int
+    sentences_total: int
+    compressed: bool
+    fallback: bool = False  # ranked by retrieval order, without sentence embeddings
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "context_tokens": self.tokens,
+            "context_tokens_original": self.original_tokens,
+            "sentences_kept": self.sentences_kept,
+            "sentences_total": self.sentences_total,
+            "compressed": self.compressed,
+            "packing_fallback": self.fallback,
+        }
+
+
+def citation_header(ctx: Dict[str, Any]) -> str:
+    meta = ctx.get("metadata", {})
+    message_id = meta.get("message_id", "unknown")
+    subject = meta.get("subject", "")
+    from_addr = meta.get("from_addr", "")
+    return f"[message_id={message_id} | from={from_addr} | subject={subject}]"
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_SPLIT_RE.split(text or "") if s and s.strip()]
+
+
+async def pack_contexts(
+    contexts: List[Dict[str, Any]],
+    question: str,
+    token_budget: int,
+    query_embedding: Optional[List[float]] = None,
+    embed_fn: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None,
+) -> PackedContext:
+    """
+    Fit retrieved contexts into `token_budget` prompt tokens.
+
+    Contexts that already fit are passed through untouched, without any extra
+    embedding call. Otherwise every sentence is embedded in one batch, scored
+    against the query embedding with a single matrix-vector product, and the
+    best-scoring sentences are kept greedily until the budget is spent. Kept
+    sentences stay in their original order under their chunk's citation
+    header; chunks with nothing left are dropped.
+
+    If the embedding call fails, sentences are kept in retrieval order instead
+    (best chunk first, each chunk from its start), so packing never fails the
+    request.
+    """
+    headers = [citation_header(ctx) for ctx in contexts]
+    full_parts = [f"{h}\n{ctx.get('text', '')}" for h, ctx in zip(headers, contexts)]
+    full_text = SEPARATOR.join(full_parts)
+    original_tokens = count_tokens(full_text)
+
+    chunk_sentences = [split_sentences(ctx.get("text", "")) for ctx in contexts]
+    total_sentences = sum(len(s) for s in chunk_sentences)
+
+    if original_tokens <= token_budget or total_sentences == 0:
+        return PackedContext(
+            text=full_text,
+            tokens=original_tokens,
+            original_tokens=original_tokens,
+            sentences_kept=total_sentences,
+            sentences_total=total_sentences,
+            compressed=False,
+        )
+
+    embed_fn = embed_fn or embed_texts
+    owners: List[int] = []
+    positions: List[int] = []
+    sentences: List[str] = []
+    for chunk_idx, chunk in enumerate(chunk_sentences):
+        for pos, sentence in enumerate(chunk):
+            owners.append(chunk_idx)
+            positions.append(pos)
+            sentences.append(sentence)
+
+    fallback = False
+    try:
+        to_embed = sentences if query_embedding else sentences + [question]
+        vectors = np.asarray(await embed_fn(to_embed), dtype=np.float32)
+        if not query_embedding:
+            query_embedding, vectors = vectors[-1], vectors[:-1]
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = (vectors @ query) / np.where(norms == 0, 1.0, norms)
+    except Exception:
+        # Contexts arrive ranked by similarity: earlier chunks and sentences score higher
+        fallback = True
+        PACKING_FALLBACKS.inc()
+        scores = -np.arange(len(sentences), dtype=np.float32)
+
+    sentence_tokens = [count_tokens(s) for s in sentences]
+    header_tokens = [count_tokens(h) for h in headers]
+    separator_tokens = count_tokens(SEPARATOR)
+
+    used = 0
+    opened = set()
+    kept: Dict[int, List[int]] = {}
+    for idx in np.argsort(-scores):
+        chunk_idx = owners[idx]
+        cost = sentence_tokens[idx]
+        if chunk_idx not in opened:
+            cost += header_tokens[chunk_idx] + separator_tokens
+        if used + cost > token_budget:
+            continue
+        used += cost
+        opened.add(chunk_idx)
+        kept.setdefault(chunk_idx, []).append(positions[idx])
+
+    parts = []
+    for chunk_idx in sorted(kept):
+        chosen = sorted(kept[chunk_idx])
+        body = chunk_sentences[chunk_idx][chosen[0]]
+        for prev, pos in zip(chosen, chosen[1:]):
+            body += (" " if pos == prev + 1 else GAP) + chunk_sentences[chunk_idx][pos]
+        parts.append(f"{headers[chunk_idx]}\n{body}")
+
+    text = SEPARATOR.join(parts)
+    return PackedContext(
+        text=text,
+        tokens=count_tokens(text),
+        original_tokens=original_tokens,
+        sentences_kept=sum(len(v) for v in kept.values()),
+        sentences_total=total_sentences,
+        compressed=True,
+        fallback=fallback,
+    )
@@ -0,0 +1,227 @@
+"""
+Materialized per-account digests for the "today" and "this week" windows.
+
+Each digest row keeps per-thread entries, sender counts and the rendered text
+for its window, plus the highest `email_messages.id` folded in so far. A
+refresh only reads rows above that mark (new inserts from sync), so keeping a
+digest current costs a few indexed queries per sync instead of a rebuild. When the
+window rolls over (a new day or week) the digest is rebuilt from its window.
+
+Date-window questions ("what updates do I have today?") are answered from the
+cached text, without retrieval or generation.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from config import load_config
+from database import SessionLocal, EmailDigest, EmailMessage
+
+
+config = load_config()
+
+PERIODS = ("today", "this_week")
+
+PERIOD_RE = re.compile(r"\b(?:today|this\s+week)\b")
+DIGEST_RE = re.compile(
+    r"\b(?:updates?|new|news|happen(?:ed|ing)?|summar(?:y|i[sz]e)|digest|recap|overview|"
+    r"catch\s+me\s+up|miss(?:ed)?|came\s+in|arrived)\b"
+)
+WORD_RE = re.compile(r"[a-z0-9']+")
+FILLER = frozenset(
+    "a all any anything are been did do does email emails far for get give got has have i in inbox is "
+    "me mail my of on please s show so tell the there to up was were what what's whats".split()
+)
+
+
+def match_digest_question(question: str) -> Optional[str]:
+    """The digest period ("today" or "this_week") that answers `question`, if any"""
+    text = " ".join((question or "").lower().replace("’", "'").split()).strip(" ?.!")
+    period_match = PERIOD_RE.search(text)
+    if not period_match or not DIGEST_RE.search(text):
+        return None
+    rest = DIGEST_RE.sub(" ", PERIOD_RE.sub(" ", text))
+    # Anything beyond filler ("from alice", "about the budget") needs the real pipeline
+    if any(word not in FILLER for word in WORD_RE.findall(rest)):
+        return None
+    return "today" if period_match.group(0) == "today" else "this_week"
+
+
+def period_start(period: str, now: Optional[datetime] = None) -> datetime:
+    """Start of the period containing `now` (message dates are naive local time)"""
+    now = now or datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight if period == "today" else midnight - timedelta(days=midnight.weekday())
+
+
+@dataclass
+class Digest:
+    period: str
+    period_start: datetime
+    message_count: int
+    thread_count: int
+    unread_count: int
+    text: str
+    items: List[Dict[str, Any]]
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """Latest message of each listed thread, in the workflow's citation format"""
+        return [
+            {
+                "message_id": item["message_id"],
+                "thread_id": item["thread_id"],
+                "subject": item["subject"],
+                "from_addr": item["senders"][0] if item["senders"] else "",
+                "date": item["latest"],
+                "chunk_index": 0,
+                "text": item["snippet"],
+            }
+            for item in self.items[:config.digest_max_items]
+        ]
+
+
+def _fold(row: EmailDigest, messages: List[Any]) -> None:
+    """Merge message rows into the digest's thread entries and sender counts"""
+    items: Dict[str, Dict[str, Any]] = {i["thread_id"]: i for i in json.loads(row.items or "[]")}
+    senders: Dict[str, int] = json.loads(row.senders or "{}")
+    for m in messages:
+        sender = m.from_addr or "unknown sender"
+        senders[sender] = senders.get(sender, 0) + 1
+        latest = m.date.isoformat() if m.date else ""
+        item = items.get(m.thread_id)
+        if item is None:
+            item = items[m.thread_id] = {
+                "thread_id": m.thread_id, "subject": m.subject or "(no subject)", "senders": [],
+                "count": 0, "latest": "", "message_id": m.message_id, "snippet": "",
+            }
+        item["count"] += 1
+        if sender not in item["senders"]:
+            item["senders"] = ([sender] + item["senders"])[:3]
+        if latest >= item["latest"]:
+            item.update(latest=latest, message_id=m.message_id, snippet=m.snippet or "", subject=m.subject or item["subject"])
+    row.message_count = (row.message_count or 0) + len(messages)
+    row.thread_count = len(items)
+    row.items = json.dumps(sorted(items.values(), key=lambda i: i["latest"], reverse=True))
+    row.senders = json.dumps(senders)
+
+
+def _render(row: EmailDigest) -> str:
+    label = "Today" if row.period == "today" else "This week"
+    if not row.message_count:
+        return f"No new emails {label.lower()}."
+    items = json.loads(row.items)
+    senders = sorted(json.loads(row.senders).items(), key=lambda kv: (-kv[1], kv[0]))[:5]
+    emails = "email" if row.message_count == 1 else "emails"
+    threads = "thread" if row.thread_count == 1 else "threads"
+    lines = [
+        f"{label} (since {row.period_start:%a %b %d}): {row.message_count} {emails} in {row.thread_count} {threads}, "
+        f"{row.unread_count} unread.",
+        "Most active senders: " + ", ".join(f"{addr} ({n})" for addr, n in senders),
+        "",
+    ]
+    time_format = "%H:%M" if row.period == "today" else "%a %H:%M"
+    for item in items[:config.digest_max_items]:
+        latest = datetime.fromisoformat(item["latest"]).strftime(time_format) if item["latest"] else "?"
+        count = f"{item['count']} message{'s' if item['count'] != 1 else ''}"
+        snippet = f": {item['snippet'][:160]}" if item["snippet"] else ""
+        lines.append(f"- {item['subject']} ({', '.join(item['senders'])}; {count}, latest {latest}){snippet}")
+    if len(items) > config.digest_max_items:
+        lines.append(f"…and {len(items) - config.digest_max_items} more threads.")
+    return "\n".join(lines)
+
+
+def _refresh(db: Session, account_id: int, period: str, now: Optional[datetime]) -> Tuple[EmailDigest, bool]:
+    """Bring one digest up to date; returns the row and whether it changed"""
+    start = period_start(period, now)
+    row = db.get(EmailDigest, (account_id, period))
+    if row is None:
+        # A sync and a reader can both find the row missing; whoever inserts second keeps the
+        # first one's row, which is then rebuilt like any stale digest
+        db.execute(
+            insert(EmailDigest).values(account_id=account_id, period=period).on_conflict_do_nothing()
+        )
+        row = db.get(EmailDigest, (account_id, period))
+
+    snippet = func.substr(EmailMessage.body_text, 1, 200).label("snippet")
+    columns = select(
+        EmailMessage.id, EmailMessage.message_id, EmailMessage.thread_id, EmailMessage.subject,
+        EmailMessage.from_addr, EmailMessage.date, snippet,
+    )
+    if row.period_start != start:
+        # New day or week: rebuild from the window (account/date index) instead of folding
+        row.period_start = start
+        row.message_count = 0
+        row.items = "[]"
+        row.senders = "{}"
+        row.text = None
+        row.last_message_id = db.execute(
+            select(func.max(EmailMessage.id)).where(EmailMessage.account_id == account_id)
+        ).scalar_one() or 0
+        # In date order, which the account/date index already has (folding doesn't depend on order)
+        new_rows = db.execute(
+            columns.where(EmailMessage.account_id == account_id, EmailMessage.date >= start)
+            .order_by(EmailMessage.date)
+        ).all()
+        _fold(row, new_rows)
+    else:
+        # Rows above the mark are new inserts; only those dated inside the window count
+        new_rows = db.execute(
+            columns.where(EmailMessage.account_id == account_id, EmailMessage.id > (row.last_message_id or 0))
+            .order_by(EmailMessage.id)
+        ).all()
+        if new_rows:
+            _fold(row, [m for m in new_rows if m.date is not None and m.date >= start])
+            row.last_message_id = new_rows[-1].id
+
+    # Read state changes on existing rows, so it is counted rather than folded
+    unread = db.execute(
+        select(func.count(EmailMessage.id)).where(
+            EmailMessage.account_id == account_id,
+            EmailMessage.unread.is_(True),
+            EmailMessage.date >= start,
+        )
+    ).scalar_one()
+    changed = bool(new_rows) or row.text is None or unread != row.unread_count
+    if changed:
+        row.unread_count = unread
+        row.text = _render(row)
+        row.updated_at = datetime.utcnow()
+    return row, changed
+
+
+def refresh_digests(db: Session, account_id: int, now: Optional[datetime] = None) -> None:
+    """Fold newly stored messages into every digest of the account (call after a sync commit)"""
+    changed = False
+    for period in PERIODS:
+        changed = _refresh(db, account_id, period, now)[1] or changed
+    if changed:
+        db.commit()
+
+
+def get_digest(account_id: int, period: str, now: Optional[datetime] = None) -> Digest:
+    """The current digest for `period`, refreshed first if anything new arrived; synchronous"""
+    db = SessionLocal()
+    try:
+        row, changed = _refresh(db, account_id, period, now)
+        if changed:
+            db.commit()
+        return Digest(
+            period=period,
+            period_start=row.period_start,
+            message_count=row.message_count or 0,
+            thread_count=row.thread_count or 0,
+            unread_count=row.unread_count or 0,
+            text=row.text,
+            items=json.loads(row.items or "[]"),
+        )
+    finally:
+        db.close()
@@ -1,11 +1,24 @@
 """Evaluation services for RAG system."""
 
 from services.eval.deepeval import run_deepeval, calculate_aggregate_metrics
-from services.eval.llm_judge import run_eval, EvalResult
+from services.eval.llm_judge import run_eval, EvalResult, calculate_judge_aggregate
+from services.eval.runner import EvalProgress, start_progress, get_progress, list_progress
+from services.eval.history import record_run, list_runs, get_run, set_baseline, baseline_for, compare_runs
 
 __all__ = [
     "run_deepeval",
     "calculate_aggregate_metrics",
     "run_eval",
     "EvalResult",
+    "calculate_judge_aggregate",
+    "EvalProgress",
+    "start_progress",
+    "get_progress",
+    "list_progress",
+    "record_run",
+    "list_runs",
+    "get_run",
+    "set_baseline",
+    "baseline_for",
+    "compare_runs",
 ]
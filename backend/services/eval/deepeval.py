@@ -1,12 +1,12 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from dataclasses import dataclass, asdict
 from time import perf_counter
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 from deepeval import evaluate
+from deepeval.evaluate import AsyncConfig, DisplayConfig, ErrorConfig
 from deepeval.metrics import (
     AnswerRelevancyMetric,
     FaithfulnessMetric,
@@ -17,6 +17,8 @@ from deepeval.metrics import (
 from deepeval.test_case import LLMTestCase
 
 from config import load_config
+from services.eval.runner import EvalProgress, map_bounded, percentile
+from services.eval.verdict_cache import Verdict, VerdictKey, input_hash, lookup_verdicts, store_verdicts
 
 
 config = load_config()
@@ -43,25 +45,33 @@ class EnhancedEvalResult:
     # Status
     passed: bool
     reason: Optional[str] = None
+    error: Optional[str] = None  # answering or judging failed; left out of the aggregate scores
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
         return asdict(self)
 
 
-def create_metrics(model: str = None) -> List:
+def metric_key(metric) -> str:
+    """Snake-case name of a DeepEval metric ("Answer Relevancy" -> "answer_relevancy")"""
+    name = metric if isinstance(metric, str) else metric.__name__
+    return name.lower().replace(" ", "_")
+
+
+def create_metrics(model: str = None, only: Optional[Sequence[str]] = None) -> List:
     """
     Create DeepEval metrics for RAG evaluation.
 
     Args:
         model: OpenAI model to use for evaluation (defaults to config.eval_model)
+        only: Restrict to these metric keys (see `metric_key`)
 
     Returns:
         List of configured DeepEval metrics
     """
     eval_model = model or config.eval_model
 
-    return [
+    metrics = [
         AnswerRelevancyMetric(
             threshold=0.7,
             model=eval_model,
@@ -88,153 +98,294 @@ def create_metrics(model: str = None) -> List:
             include_reason=True
         ),
     ]
+    if only is not None:
+        metrics = [m for m in metrics if metric_key(m) in only]
+    return metrics
 
 
-def _run_evaluate_sync(test_case, metrics):
+def _run_evaluate_sync(test_cases: List[LLMTestCase], metrics: List, verbose: bool = False):
     """
-    Run DeepEval evaluation synchronously in a separate thread.
-    This avoids event loop conflicts with uvloop.
+    Run DeepEval on a batch of test cases synchronously in a separate thread.
+    This avoids event loop conflicts with uvloop; inside the thread DeepEval
+    scores the batch concurrently on its own loop.
     """
     return evaluate(
-        test_cases=[test_case],
-        metrics=metrics
+        test_cases=test_cases,
+        metrics=metrics,
+        async_config=AsyncConfig(run_async=True, max_concurrent=max(1, config.eval_judge_concurrency)),
+        display_config=DisplayConfig(show_indicator=verbose, print_results=verbose),
+        # A failing metric marks its test case failed instead of aborting the batch
+        error_config=ErrorConfig(ignore_errors=True),
+    )
+
+
+@dataclass
+class _Answered:
+    """A sample after the RAG pipeline, waiting to be judged"""
+    index: int
+    question: str
+    answer: str
+    expected_output: Optional[str]
+    retrieval_context: List[str]
+    latency_ms: int
+    error: Optional[str] = None  # the pipeline failed; the sample is recorded failed, not judged
+
+
+def _failed_result(item: _Answered, reason: str) -> EnhancedEvalResult:
+    return EnhancedEvalResult(
+        question=item.question,
+        answer=item.answer,
+        expected_output=item.expected_output,
+        retrieval_context=item.retrieval_context,
+        answer_relevancy=0.0,
+        faithfulness=0.0,
+        contextual_relevancy=0.0,
+        contextual_recall=0.0,
+        hallucination_score=1.0,  # High hallucination on error
+        latency_ms=item.latency_ms,
+        passed=False,
+        reason=reason,
+        error=reason,
     )
 
 
+def _scored_result(item: _Answered, verdicts: Dict[str, Verdict]) -> EnhancedEvalResult:
+    # Get failure reasons if any
+    reasons = [v.reason for v in verdicts.values() if not v.passed and v.reason]
+
+    def score(name: str) -> float:
+        return verdicts[name].score if name in verdicts else 0.0
+
+    return EnhancedEvalResult(
+        question=item.question,
+        answer=item.answer,
+        expected_output=item.expected_output,
+        retrieval_context=item.retrieval_context,
+        answer_relevancy=score("answer_relevancy"),
+        faithfulness=score("faithfulness"),
+        contextual_relevancy=score("contextual_relevancy"),
+        contextual_recall=score("contextual_recall"),
+        hallucination_score=score("hallucination"),
+        latency_ms=item.latency_ms,
+        passed=all(v.passed for v in verdicts.values()),
+        reason="; ".join(reasons) if reasons else None,
+    )
+
+
+async def _judge_batch(
+    batch: List[_Answered], verbose: bool, progress: Optional[EvalProgress] = None
+) -> List[EnhancedEvalResult]:
+    """
+    Score a batch of answered samples; results keep batch order.
+
+    Verdicts already in the verdict cache are reused, and DeepEval runs only
+    the missing metrics, one evaluate() call per set of missing metrics.
+    """
+    metrics = create_metrics()
+    keys: Dict[Tuple[int, str], VerdictKey] = {
+        (item.index, metric_key(m)): (
+            f"deepeval.{metric_key(m)}",
+            config.eval_model,
+            input_hash(m.threshold, item.question, item.answer, item.retrieval_context, item.expected_output),
+        )
+        for item in batch
+        for m in metrics
+    }
+    cached = await asyncio.to_thread(lookup_verdicts, keys.values())
+    if progress:
+        progress.cached += len(cached)
+    verdicts: Dict[int, Dict[str, Verdict]] = {item.index: {} for item in batch}
+    for (index, name), key in keys.items():
+        if key in cached:
+            verdicts[index][name] = cached[key]
+
+    # Samples usually miss all metrics (new answer) or none; group by what's missing
+    groups: Dict[Tuple[str, ...], List[_Answered]] = {}
+    for item in batch:
+        missing = tuple(metric_key(m) for m in metrics if metric_key(m) not in verdicts[item.index])
+        if missing:
+            groups.setdefault(missing, []).append(item)
+
+    errors: Dict[int, str] = {}
+    fresh: Dict[VerdictKey, Verdict] = {}
+    for names, items in groups.items():
+        test_cases = [
+            LLMTestCase(
+                name=f"sample-{item.index}",
+                input=item.question,
+                actual_output=item.answer,
+                expected_output=item.expected_output,
+                retrieval_context=item.retrieval_context,
+                context=item.retrieval_context,
+            )
+            for item in items
+        ]
+        try:
+            # Metrics are stateful, so each evaluate() call gets its own
+            eval_results = await asyncio.to_thread(
+                _run_evaluate_sync, test_cases, create_metrics(only=names), verbose
+            )
+        except Exception as e:
+            for item in items:
+                errors[item.index] = f"Evaluation error: {str(e)}"
+            continue
+
+        # DeepEval may return test results out of order; match them back by name
+        by_name = {r.name: r for r in eval_results.test_results}
+        for item in items:
+            test_result = by_name.get(f"sample-{item.index}")
+            if test_result is None or not test_result.metrics_data:
+                errors[item.index] = "Evaluation error: no metric results"
+                continue
+            for m in test_result.metrics_data:
+                name = metric_key(m.name)
+                verdict = Verdict(m.score or 0.0, bool(m.success), m.reason or m.error)
+                verdicts[item.index][name] = verdict
+                # Errored metrics are retried next run rather than cached
+                if not m.error and m.score is not None and (item.index, name) in keys:
+                    fresh[keys[(item.index, name)]] = verdict
+
+    await asyncio.to_thread(store_verdicts, fresh)
+    return [
+        _failed_result(item, errors[item.index]) if item.index in errors else _scored_result(item, verdicts[item.index])
+        for item in batch
+    ]
+
+
 async def run_deepeval(
     samples: List[Dict[str, Any]],
     ask_fn,
-    verbose: bool = False
+    verbose: bool = False,
+    progress: Optional[EvalProgress] = None,
 ) -> List[EnhancedEvalResult]:
     """
     Run comprehensive RAG evaluation using DeepEval.
 
+    Samples are answered `eval_concurrency` at a time. Answered samples are
+    judged in batches of up to `deepeval_batch_size` while the rest are still
+    being answered: each batch takes whatever is ready when the previous one
+    finishes, so judging overlaps the pipeline instead of waiting for it.
+    A sample whose pipeline run fails is recorded as a failed result.
+
     Args:
         samples: List of test samples with 'question', 'expected_output' (optional)
         ask_fn: Function that takes a question and returns (answer, sources)
         verbose: Print detailed evaluation progress
+        progress: Progress record updated as samples are answered and judged
 
     Returns:
-        List of EnhancedEvalResult with all metrics
+        List of EnhancedEvalResult with all metrics, in sample order
     """
-    results: List[EnhancedEvalResult] = []
-    metrics = create_metrics()
+    results: List[Optional[EnhancedEvalResult]] = [None] * len(samples)
+    answered: asyncio.Queue = asyncio.Queue()
+    answer_slots = asyncio.Semaphore(max(1, config.eval_concurrency))
 
-    for sample in samples:
+    async def answer(index: int) -> None:
+        sample = samples[index]
         question = sample["question"]
+
         expected_output = sample.get("expected_output") or sample.get("reference")
 
         # Execute the RAG pipeline
-        t0 = perf_counter()
-        answer, sources = await ask_fn(question)
-        latency_ms = int((perf_counter() - t0) * 1000)
+        async with answer_slots:
+            t0 = perf_counter()
+            try:
+                answer, sources = await ask_fn(question)
+            except Exception as e:
+                # One broken sample is a failed result, not a failed run
+                if progress:
+                    progress.record("failed", 0.0)
+                await answered.put(_Answered(
+                    index=index,
+                    question=question,
+                    answer="",
+                    expected_output=expected_output,
+                    retrieval_context=[],
+                    latency_ms=int((perf_counter() - t0) * 1000),
+                    error=f"Answer error: {type(e).__name__}: {e}",
+                ))
+                return
+            seconds = perf_counter() - t0
+        if progress:
+            progress.record("answered", seconds)
 
         # Extract context from sources
-        retrieval_context = []
-        if sources:
-            for source in sources:
-                if isinstance(source, dict):
-                    text = source.get("text", "")
-                    if text:
-                        retrieval_context.append(text)
+        retrieval_context = [
+            source["text"] for source in sources or []
+            if isinstance(source, dict) and source.get("text")
+        ]
 
         # If no context retrieved, add placeholder
         if not retrieval_context:
             retrieval_context = ["No context retrieved"]
 
-        # Create DeepEval test case
-        test_case = LLMTestCase(
-            input=question,
-            actual_output=answer,
+        await answered.put(_Answered(
+            index=index,
+            question=question,
+            answer=answer,
             expected_output=expected_output,
             retrieval_context=retrieval_context,
-            context=retrieval_context  
-        )
-
-        # Evaluate with all metrics in a thread pool to avoid event loop conflicts
-        try:
-            # Run evaluation in a thread pool executor
-            loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                eval_results = await loop.run_in_executor(
-                    executor,
-                    _run_evaluate_sync,
-                    test_case,
-                    metrics
-                )
-
-            # Extract metric scores
-            metric_scores = {}
-            for metric_result in eval_results.test_results[0].metrics_data:
-                metric_name = metric_result.name.lower().replace(" ", "_")
-                metric_scores[metric_name] = metric_result.score
-
-            # Determine if test passed
-            passed = all(
-                metric_result.success
-                for metric_result in eval_results.test_results[0].metrics_data
-            )
-
-            # Get failure reasons if any
-            reasons = [
-                metric_result.reason
-                for metric_result in eval_results.test_results[0].metrics_data
-                if not metric_result.success and metric_result.reason
-            ]
-            reason = "; ".join(reasons) if reasons else None
-
-            result = EnhancedEvalResult(
-                question=question,
-                answer=answer,
-                expected_output=expected_output,
-                retrieval_context=retrieval_context,
-                answer_relevancy=metric_scores.get("answer_relevancy", 0.0),
-                faithfulness=metric_scores.get("faithfulness", 0.0),
-                contextual_relevancy=metric_scores.get("contextual_relevancy", 0.0),
-                contextual_recall=metric_scores.get("contextual_recall", 0.0),
-                hallucination_score=metric_scores.get("hallucination", 0.0),
-                latency_ms=latency_ms,
-                passed=passed,
-                reason=reason
-            )
-
-        except Exception as e:
-            # Fallback result if evaluation fails
-            result = EnhancedEvalResult(
-                question=question,
-                answer=answer,
-                expected_output=expected_output,
-                retrieval_context=retrieval_context,
-                answer_relevancy=0.0,
-                faithfulness=0.0,
-                contextual_relevancy=0.0,
-                contextual_recall=0.0,
-                hallucination_score=1.0,  # High hallucination on error
-                latency_ms=latency_ms,
-                passed=False,
-                reason=f"Evaluation error: {str(e)}"
-            )
-
-        results.append(result)
-
-    return results
+            latency_ms=int(seconds * 1000),
+        ))
+
+    async def judge() -> None:
+        remaining = len(samples)
+        batch_size = max(1, config.deepeval_batch_size)
+        while remaining:
+            batch = [await answered.get()]
+            while len(batch) < batch_size and not answered.empty():
+                batch.append(answered.get_nowait())
+            remaining -= len(batch)
+            for item in batch:
+                if item.error:
+                    results[item.index] = _failed_result(item, item.error)
+            batch = [item for item in batch if not item.error]
+            if not batch:
+                continue
+
+            t0 = perf_counter()
+            batch_results = await _judge_batch(batch, verbose, progress)
+            per_sample = (perf_counter() - t0) / len(batch)
+            for item, result in zip(batch, batch_results):
+                results[item.index] = result
+                if progress:
+                    progress.record("judged", per_sample)
+
+    judging = asyncio.ensure_future(judge())
+    try:
+        await map_bounded(range(len(samples)), answer, len(samples) or 1)
+        await judging
+    finally:
+        judging.cancel()
+    return [r for r in results if r is not None]
 
 
 def calculate_aggregate_metrics(results: List[EnhancedEvalResult]) -> Dict[str, Any]:
     """
     Calculate aggregate statistics across all evaluation results.
 
+    Scores, pass rate and latencies cover the samples that were answered and
+    judged; failed samples are reported as `failed_tests` only.
+
     Returns:
         Dictionary with average scores, pass rate, and performance metrics
     """
     if not results:
         return {}
 
+    aggregate: Dict[str, Any] = {
+        "total_tests": len(results),
+        "failed_tests": sum(1 for r in results if r.error),
+    }
+    results = [r for r in results if not r.error]
+    if not results:
+        return aggregate
+
     total = len(results)
     passed = sum(1 for r in results if r.passed)
 
     return {
-        "total_tests": total,
+        **aggregate,
         "passed_tests": passed,
         "pass_rate": round(passed / total, 2),
         "avg_answer_relevancy": round(
@@ -255,6 +406,8 @@ def calculate_aggregate_metrics(results: List[EnhancedEvalResult]) -> Dict[str,
         "avg_latency_ms": round(
             sum(r.latency_ms for r in results) / total
         ),
+        "p50_latency_ms": percentile([r.latency_ms for r in results], 50),
+        "p95_latency_ms": percentile([r.latency_ms for r in results], 95),
         "min_latency_ms": min(r.latency_ms for r in results),
         "max_latency_ms": max(r.latency_ms for r in results),
     }
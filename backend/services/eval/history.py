@@ -0,0 +1,303 @@
+"""
+Persisted evaluation runs and run-to-run comparison.
+
+Every finished run is stored in `eval_runs` with its per-sample results, the
+aggregate scores, the git revision and a snapshot of the (non-secret)
+settings it ran with. A comparison lines up two runs of the same evaluator:
+each aggregate metric gets its delta and a verdict, where scores regress when
+they drop by more than `eval_score_tolerance` (hallucination when it rises)
+and latencies regress when they grow by more than `eval_latency_tolerance`.
+Settings that differ and samples whose scores changed are listed alongside,
+so a regression points at its cause.
+
+The baseline is the run marked as such for the evaluator, or else the run
+before. From the command line:
+
+    python -m services.eval.history list
+    python -m services.eval.history baseline <run_id>
+    python -m services.eval.history compare [--base RUN] [--new RUN] [--fail-on-regression]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import load_config
+from database import SessionLocal, EvalRun
+
+
+config = load_config()
+
+SECRET_RE = re.compile(r"(api_key|secret|password|access_token)")
+# Per-sample fields compared between runs (latency is too noisy per sample)
+ITEM_SCORES = (
+    "faithfulness", "relevance", "answer_relevancy", "contextual_relevancy",
+    "contextual_recall", "hallucination_score", "passed",
+)
+# Aggregate keys containing any of these are better when they drop, e.g. failed_tests
+LOWER_IS_BETTER = ("latency", "hallucination", "failed", "error")
+
+
+@lru_cache(maxsize=1)
+def git_revision() -> Optional[str]:
+    """Short commit of the running code, with -dirty for uncommitted changes"""
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=Path(__file__).resolve().parent, text=True, stderr=subprocess.DEVNULL,
+        ).strip() or None
+    except Exception:
+        return None
+
+
+def config_snapshot() -> Dict[str, Any]:
+    """Settings that shape eval results, without credentials"""
+    return {k: v for k, v in sorted(config.model_dump().items()) if not SECRET_RE.search(k)}
+
+
+def _summary(run: EvalRun) -> Dict[str, Any]:
+    return {
+        "run_id": run.run_id,
+        "kind": run.kind,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+        "git_revision": run.git_revision,
+        "label": run.label,
+        "baseline": bool(run.baseline),
+        "samples": run.samples,
+        "aggregate": json.loads(run.aggregate or "{}"),
+    }
+
+
+def _full(run: EvalRun) -> Dict[str, Any]:
+    return {
+        **_summary(run),
+        "config": json.loads(run.config or "{}"),
+        "items": json.loads(run.items or "[]"),
+    }
+
+
+def save_run(
+    run_id: str,
+    kind: str,
+    account_id: Optional[int],
+    aggregate: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    label: Optional[str] = None,
+) -> None:
+    """Store a finished run; synchronous (run it in a thread)"""
+    db = SessionLocal()
+    try:
+        db.add(EvalRun(
+            run_id=run_id,
+            account_id=account_id,
+            kind=kind,
+            git_revision=git_revision(),
+            label=label,
+            samples=len(items),
+            config=json.dumps(config_snapshot(), default=str),
+            aggregate=json.dumps(aggregate),
+            items=json.dumps(items, default=str),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def list_runs(kind: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent runs first, without per-sample results"""
+    db = SessionLocal()
+    try:
+        q = db.query(EvalRun)
+        if kind:
+            q = q.filter(EvalRun.kind == kind)
+        return [_summary(r) for r in q.order_by(EvalRun.created_at.desc()).limit(limit).all()]
+    finally:
+        db.close()
+
+
+def get_run(run_id: str) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        run = db.get(EvalRun, run_id)
+        return _full(run) if run else None
+    finally:
+        db.close()
+
+
+def latest_run(kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    runs = list_runs(kind, limit=1)
+    return get_run(runs[0]["run_id"]) if runs else None
+
+
+def set_baseline(run_id: str) -> bool:
+    """Make `run_id` the baseline of its evaluator; False if there is no such run"""
+    db = SessionLocal()
+    try:
+        run = db.get(EvalRun, run_id)
+        if run is None:
+            return False
+        db.query(EvalRun).filter(EvalRun.kind == run.kind, EvalRun.baseline.is_(True)).update({"baseline": False})
+        run.baseline = True
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def baseline_for(run: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The marked baseline of the run's evaluator, or the run before it"""
+    db = SessionLocal()
+    try:
+        q = db.query(EvalRun).filter(EvalRun.kind == run["kind"], EvalRun.run_id != run["run_id"])
+        base = q.filter(EvalRun.baseline.is_(True)).first()
+        if base is None and run.get("created_at"):
+            base = (
+                q.filter(EvalRun.created_at < datetime.fromisoformat(run["created_at"]))
+                .order_by(EvalRun.created_at.desc())
+                .first()
+            )
+        return _full(base) if base else None
+    finally:
+        db.close()
+
+
+def _lower_is_better(metric: str) -> bool:
+    return any(word in metric for word in LOWER_IS_BETTER)
+
+
+def _verdict(metric: str, old: float, new: float) -> str:
+    worse = new > old if _lower_is_better(metric) else new < old
+    if "latency" in metric:
+        significant = old > 0 and abs(new - old) / old > config.eval_latency_tolerance
+    else:
+        significant = abs(new - old) > config.eval_score_tolerance
+    if not significant:
+        return "unchanged"
+    return "regressed" if worse else "improved"
+
+
+def _item_changes(base_items: List[Dict[str, Any]], new_items: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Samples (matched by question, in order) whose scores or answer changed"""
+    pending: Dict[str, List[Dict[str, Any]]] = {}
+    for item in base_items:
+        pending.setdefault(item.get("question", ""), []).append(item)
+    changes = []
+    for item in new_items:
+        matches = pending.get(item.get("question", ""))
+        if not matches:
+            continue
+        old = matches.pop(0)
+        diff = {
+            field: {"base": old[field], "new": item[field]}
+            for field in ITEM_SCORES
+            if field in item and field in old and item[field] != old[field]
+        }
+        if diff:
+            changes.append({
+                "question": item.get("question"),
+                "answer_changed": old.get("answer") != item.get("answer"),
+                "scores": diff,
+            })
+    return changes[:limit]
+
+
+def compare_runs(base: Dict[str, Any], new: Dict[str, Any], item_limit: int = 50) -> Dict[str, Any]:
+    """Aggregate deltas with verdicts, changed settings and changed samples of `new` vs `base`"""
+    metrics: Dict[str, Any] = {}
+    for key, value in new["aggregate"].items():
+        old = base["aggregate"].get(key)
+        if key in ("total_tests", "passed_tests") or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        metrics[key] = {
+            "base": old,
+            "new": value,
+            "delta": round(value - old, 4),
+            "change": round(value / old - 1, 4) if old else None,
+            "verdict": _verdict(key, old, value),
+        }
+
+    base_config, new_config = base.get("config", {}), new.get("config", {})
+    config_changes = {
+        k: {"base": base_config.get(k), "new": new_config.get(k)}
+        for k in sorted(set(base_config) | set(new_config))
+        if base_config.get(k) != new_config.get(k)
+    }
+    return {
+        "base": {k: base.get(k) for k in ("run_id", "created_at", "git_revision", "label", "samples")},
+        "new": {k: new.get(k) for k in ("run_id", "created_at", "git_revision", "label", "samples")},
+        "same_kind": base["kind"] == new["kind"],
+        "regressions": [k for k, m in metrics.items() if m["verdict"] == "regressed"],
+        "improvements": [k for k, m in metrics.items() if m["verdict"] == "improved"],
+        "metrics": metrics,
+        "config_changes": config_changes,
+        "changed_items": _item_changes(base.get("items", []), new.get("items", []), item_limit),
+    }
+
+
+def record_run(
+    run_id: str,
+    kind: str,
+    account_id: Optional[int],
+    aggregate: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    label: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Store a finished run and summarize it against its baseline (None without one); synchronous"""
+    save_run(run_id, kind, account_id, aggregate, items, label)
+    run = get_run(run_id)
+    base = baseline_for(run)
+    if base is None:
+        return None
+    diff = compare_runs(base, run)
+    return {k: diff[k] for k in ("base", "regressions", "improvements")}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stored evaluation runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = sub.add_parser("list", help="Recent runs with their aggregate scores")
+    list_cmd.add_argument("--kind", choices=["llm_judge", "deepeval"], default=None)
+    list_cmd.add_argument("--limit", type=int, default=20)
+
+    baseline_cmd = sub.add_parser("baseline", help="Mark a run as its evaluator's baseline")
+    baseline_cmd.add_argument("run_id")
+
+    compare_cmd = sub.add_parser("compare", help="Diff a run against a baseline")
+    compare_cmd.add_argument("--new", default=None, help="Run to check (default: the latest)")
+    compare_cmd.add_argument("--base", default=None, help="Baseline run (default: marked baseline, else previous run)")
+    compare_cmd.add_argument("--kind", choices=["llm_judge", "deepeval"], default=None, help="Evaluator of the latest run")
+    compare_cmd.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any metric regressed")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        print(json.dumps(list_runs(args.kind, args.limit), indent=2))
+        return
+    if args.command == "baseline":
+        if not set_baseline(args.run_id):
+            raise SystemExit(f"Unknown run {args.run_id}")
+        print(f"{args.run_id} is now the baseline")
+        return
+
+    new = get_run(args.new) if args.new else latest_run(args.kind)
+    if new is None:
+        raise SystemExit("No run to compare")
+    base = get_run(args.base) if args.base else baseline_for(new)
+    if base is None:
+        raise SystemExit("No baseline run to compare against")
+    result = compare_runs(base, new)
+    print(json.dumps(result, indent=2))
+    if args.fail_on_regression and result["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
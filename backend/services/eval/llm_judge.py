@@ -1,16 +1,18 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from time import perf_counter
 
-from openai import OpenAI
-
 from config import load_config
+from services.eval.runner import EvalProgress, map_bounded, percentile
+from services.eval.verdict_cache import Verdict, input_hash, lookup_verdicts, store_verdicts
+from services.openai_client import get_openai_client
+from services.usage import record_openai_usage
 
 
 config = load_config()
-_client = OpenAI(api_key=config.openai_api_key)
 
 
 @dataclass
@@ -21,55 +23,130 @@ class EvalResult:
     faithfulness: int
     relevance: int
     latency_ms: int
+    error: Optional[str] = None  # the sample could not be answered or judged; scored 0
 
 
-def judge_faithfulness(question: str, reference_context: str, answer: str) -> int:
-    rubric = (
-        "Score 0-1: Is the answer fully supported by the reference context? "
-        "Return only a number 0 or 1."
-    )
-    prompt = f"Reference:\n{reference_context}\n\nAnswer:\n{answer}\n\nQuestion:\n{question}\n\n{rubric}"
-    resp = _client.chat.completions.create(
+async def _judge_binary(metric: str, prompt: str, progress: Optional[EvalProgress] = None) -> int:
+    """0/1 verdict for `prompt`, from the verdict cache when this exact prompt was judged before"""
+    # The prompt holds the question, answer, reference and rubric, so it is the cache key
+    key = (f"llm_judge.{metric}", config.eval_model, input_hash(prompt))
+    cached = (await asyncio.to_thread(lookup_verdicts, [key])).get(key)
+    if cached is not None:
+        if progress:
+            progress.cached += 1
+        return int(cached.score)
+
+    resp = await get_openai_client().chat.completions.create(
         model=config.eval_model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.0,
         max_tokens=2,
     )
+    record_openai_usage(config.eval_model, resp.usage, stage="judge")
     txt = resp.choices[0].message.content.strip()
-    return 1 if txt.startswith("1") else 0
+    score = 1 if txt.startswith("1") else 0
+    await asyncio.to_thread(store_verdicts, {key: Verdict(float(score), bool(score))})
+    return score
 
 
-def judge_relevance(question: str, answer: str) -> int:
+async def judge_faithfulness(
+    question: str, reference_context: str, answer: str, progress: Optional[EvalProgress] = None
+) -> int:
+    rubric = (
+        "Score 0-1: Is the answer fully supported by the reference context? "
+        "Return only a number 0 or 1."
+    )
+    prompt = f"Reference:\n{reference_context}\n\nAnswer:\n{answer}\n\nQuestion:\n{question}\n\n{rubric}"
+    return await _judge_binary("faithfulness", prompt, progress)
+
+
+async def judge_relevance(question: str, answer: str, progress: Optional[EvalProgress] = None) -> int:
     rubric = "Score 0-1: Is the answer relevant to the question? Return only 0 or 1."
     prompt = f"Question:\n{question}\n\nAnswer:\n{answer}\n\n{rubric}"
-    resp = _client.chat.completions.create(
-        model=config.eval_model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.0,
-        max_tokens=2,
-    )
-    txt = resp.choices[0].message.content.strip()
-    return 1 if txt.startswith("1") else 0
-
-
-async def run_eval(samples: List[Dict[str, Any]], ask_fn) -> List[EvalResult]:
-    results: List[EvalResult] = []
-    for s in samples:
-        t0 = perf_counter()
-        answer, _sources = await ask_fn(
-            s["question"]
-        )  # answer function returns (answer, sources)
-        dt = int((perf_counter() - t0) * 1000)
-        faith = judge_faithfulness(s["question"], s.get("reference", ""), answer)
-        rel = judge_relevance(s["question"], answer)
-        results.append(
-            EvalResult(
+    return await _judge_binary("relevance", prompt, progress)
+
+
+async def run_eval(
+    samples: List[Dict[str, Any]],
+    ask_fn,
+    progress: Optional[EvalProgress] = None,
+) -> List[EvalResult]:
+    """
+    Answer and judge every sample, `eval_concurrency` answers and
+    `eval_judge_concurrency` judged samples at a time; results keep sample order.
+
+    `ask_fn(question)` returns (answer, sources). A sample whose answer or
+    judgement fails is recorded with its error and scored 0; the run goes on.
+    """
+    answer_slots = asyncio.Semaphore(max(1, config.eval_concurrency))
+    judge_slots = asyncio.Semaphore(max(1, config.eval_judge_concurrency))
+
+    async def evaluate_one(s: Dict[str, Any]) -> EvalResult:
+        answer, dt = "", 0.0
+        try:
+            async with answer_slots:
+                t0 = perf_counter()
+                try:
+                    answer, _sources = await ask_fn(s["question"])
+                finally:
+                    dt = perf_counter() - t0
+            if progress:
+                progress.record("answered", dt)
+            async with judge_slots:
+                t1 = perf_counter()
+                faith, rel = await asyncio.gather(
+                    judge_faithfulness(s["question"], s.get("reference", ""), answer, progress),
+                    judge_relevance(s["question"], answer, progress),
+                )
+            if progress:
+                progress.record("judged", perf_counter() - t1)
+        except Exception as e:
+            if progress:
+                progress.record("failed", 0.0)
+            return EvalResult(
                 question=s["question"],
                 reference=s.get("reference", ""),
                 answer=answer,
-                faithfulness=faith,
-                relevance=rel,
-                latency_ms=dt,
+                faithfulness=0,
+                relevance=0,
+                latency_ms=int(dt * 1000),
+                error=f"{type(e).__name__}: {e}",
             )
+        return EvalResult(
+            question=s["question"],
+            reference=s.get("reference", ""),
+            answer=answer,
+            faithfulness=faith,
+            relevance=rel,
+            latency_ms=int(dt * 1000),
         )
-    return results
+
+    # Both stages are bounded by their semaphores, so every sample can start at once
+    return await map_bounded(samples, evaluate_one, len(samples) or 1)
+
+
+def calculate_judge_aggregate(results: List[EvalResult]) -> Dict[str, Any]:
+    """
+    Faithfulness/relevance rates and latency percentiles across LLM-judge
+    results. Failed samples are only counted: scoring them 0 and timing their
+    errors would show an outage as worse answers that came back faster.
+    """
+    if not results:
+        return {}
+
+    scored = [r for r in results if not r.error]
+    aggregate: Dict[str, Any] = {"total_tests": len(results), "failed_tests": len(results) - len(scored)}
+    if not scored:
+        return aggregate
+
+    total = len(scored)
+    latencies = [r.latency_ms for r in scored]
+    return {
+        **aggregate,
+        "faithfulness_rate": round(sum(r.faithfulness for r in scored) / total, 3),
+        "relevance_rate": round(sum(r.relevance for r in scored) / total, 3),
+        "avg_latency_ms": round(sum(latencies) / total),
+        "p50_latency_ms": percentile(latencies, 50),
+        "p95_latency_ms": percentile(latencies, 95),
+        "max_latency_ms": max(latencies),
+    }
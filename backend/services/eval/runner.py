@@ -0,0 +1,136 @@
+"""
+Shared machinery for evaluation runs: bounded concurrency and progress.
+
+Both evaluators answer every sample with the chat pipeline and then judge the
+answer. Samples are independent, so answers and judgements run concurrently,
+each stage under its own limit (`eval_concurrency`, `eval_judge_concurrency`)
+so a large eval set neither serializes nor floods the OpenAI rate limit.
+
+Every run registers an `EvalProgress` that the evaluators update as samples
+are answered and judged; `GET /eval/progress` reports the recent runs while a
+long evaluation request is still in flight.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from time import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from config import load_config
+from utils.metrics import counter, histogram
+
+
+config = load_config()
+
+EVAL_SAMPLES = counter("eval_samples_total", "Evaluation samples processed, by evaluator and stage", ["kind", "stage"])
+EVAL_STAGE_SECONDS = histogram("eval_stage_seconds", "Time per evaluation sample and stage", ["kind", "stage"])
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_MAX_RUNS = 20
+
+
+@dataclass
+class EvalProgress:
+    run_id: str
+    kind: str
+    total: int
+    answered: int = 0
+    judged: int = 0
+    failed: int = 0
+    cached: int = 0  # verdicts served from the judge verdict cache
+    status: str = "running"
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time)
+    finished_at: Optional[float] = None
+
+    def record(self, stage: str, seconds: float, n: int = 1) -> None:
+        """Count `n` samples through `stage` ("answered", "judged" or "failed")"""
+        setattr(self, stage, getattr(self, stage) + n)
+        EVAL_SAMPLES.inc(n, kind=self.kind, stage=stage)
+        if stage != "failed":
+            EVAL_STAGE_SECONDS.observe(seconds, kind=self.kind, stage=stage)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.finished_at = time()
+        self.status = "failed" if error is not None else "done"
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time()) - self.started_at
+        done = self.judged + self.failed
+        eta = None
+        if self.status == "running" and done:
+            eta = round(elapsed / done * (self.total - done), 1)
+        return {
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "answered": self.answered,
+            "judged": self.judged,
+            "failed": self.failed,
+            "cached_verdicts": self.cached,
+            "elapsed_s": round(elapsed, 1),
+            "eta_s": eta,
+            "error": self.error,
+        }
+
+
+_runs: "OrderedDict[str, EvalProgress]" = OrderedDict()
+
+
+def start_progress(kind: str, total: int) -> EvalProgress:
+    """Register a new run; only the most recent runs are kept"""
+    progress = EvalProgress(run_id=uuid.uuid4().hex[:12], kind=kind, total=total)
+    _runs[progress.run_id] = progress
+    while len(_runs) > _MAX_RUNS:
+        _runs.popitem(last=False)
+    return progress
+
+
+def get_progress(run_id: str) -> Optional[EvalProgress]:
+    return _runs.get(run_id)
+
+
+def list_progress() -> List[Dict[str, Any]]:
+    """Recent runs, newest first"""
+    return [p.to_dict() for p in reversed(_runs.values())]
+
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None without values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def map_bounded(items: Sequence[T], fn: Callable[[T], Awaitable[R]], limit: int) -> List[R]:
+    """
+    Apply `fn` to every item with at most `limit` calls in flight; results keep
+    the input order. If one call fails the others are cancelled and the error
+    is raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def one(item: T) -> R:
+        async with semaphore:
+            return await fn(item)
+
+    tasks = [asyncio.ensure_future(one(item)) for item in items]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,103 @@
+"""
+Persistent cache of judge verdicts.
+
+A judge's verdict depends only on the metric, the judge model and what is
+being judged: question, answer, retrieved context and reference. Those are
+hashed into the key, so re-running an eval set re-judges only the samples
+whose answer or context actually changed; everything else is read back from
+`judge_verdicts`. Verdicts that errored are never stored.
+
+Lookups and stores are synchronous SQLAlchemy calls; run them in a thread.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from config import load_config
+from database import SessionLocal, JudgeVerdict
+from utils.metrics import counter
+
+
+config = load_config()
+
+JUDGE_CACHE = counter("judge_cache_total", "Judge verdict cache lookups, by metric and outcome", ["metric", "outcome"])
+
+# (metric, judge_model, input_hash)
+VerdictKey = Tuple[str, str, str]
+
+
+@dataclass(frozen=True)
+class Verdict:
+    score: float
+    passed: Optional[bool] = None
+    reason: Optional[str] = None
+
+
+def input_hash(*parts: object) -> str:
+    """Stable hash of the judged inputs (strings, lists of strings, numbers or None)"""
+    blob = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def lookup_verdicts(keys: Iterable[VerdictKey]) -> Dict[VerdictKey, Verdict]:
+    """Cached verdicts for whichever of `keys` have one"""
+    keys = list(dict.fromkeys(keys))
+    if not keys or not config.judge_cache_enabled:
+        return {}
+    found: Dict[VerdictKey, Verdict] = {}
+    # Grouped by metric and model so each lookup searches the primary key;
+    # SQLite scans the table for a row-value IN over all three columns
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    for metric, model, digest in keys:
+        groups.setdefault((metric, model), []).append(digest)
+    db = SessionLocal()
+    try:
+        for (metric, model), digests in groups.items():
+            # Chunked to stay well under SQLite's bound-parameter limit
+            for i in range(0, len(digests), 500):
+                rows = db.query(JudgeVerdict).filter(
+                    JudgeVerdict.metric == metric,
+                    JudgeVerdict.judge_model == model,
+                    JudgeVerdict.input_hash.in_(digests[i:i + 500]),
+                ).all()
+                for r in rows:
+                    found[(r.metric, r.judge_model, r.input_hash)] = Verdict(r.score, r.passed, r.reason)
+    finally:
+        db.close()
+    for key in keys:
+        JUDGE_CACHE.inc(metric=key[0], outcome="hit" if key in found else "miss")
+    return found
+
+
+def store_verdicts(verdicts: Dict[VerdictKey, Verdict]) -> None:
+    """Persist fresh verdicts, replacing any stored under the same key"""
+    if not verdicts or not config.judge_cache_enabled:
+        return
+    db = SessionLocal()
+    try:
+        for attempt in range(2):
+            for (metric, model, digest), v in verdicts.items():
+                db.merge(JudgeVerdict(
+                    metric=metric,
+                    judge_model=model,
+                    input_hash=digest,
+                    score=v.score,
+                    passed=v.passed,
+                    reason=v.reason,
+                ))
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # A concurrent judge of the same input inserted first; merge again as updates
+                db.rollback()
+                if attempt:
+                    raise
+    finally:
+        db.close()
@@ -1,18 +1,24 @@
 from __future__ import annotations
 
+import asyncio
 from typing import List, Dict, Any, Tuple
 from datetime import datetime
 import hashlib
 
-from openai import OpenAI
-
 from config import load_config
+from services.openai_client import get_openai_client
+from services.usage import record_openai_usage
+from utils.metrics import counter, histogram, timed
 from utils.text import html_to_text, strip_quotes_and_signature, normalize_text
 from services.vectorstore import upsert_chunks
+from services.answer_cache import get_answer_cache
 
 
 config = load_config()
-_client = OpenAI(api_key=config.openai_api_key)
+
+EMBED_SECONDS = histogram("embed_texts_seconds", "embed_texts latency (all batches)")
+EMBED_ERRORS = counter("embed_texts_errors_total", "Failed embed_texts calls")
+EMBED_TEXTS = counter("embed_texts_inputs_total", "Texts sent for embedding")
 
 
 def _hash_id(*parts: str) -> str:
@@ -34,10 +40,12 @@ def normalize_message(nylas_msg: Dict[str, Any]) -> Dict[str, Any]:
     else:
         parsed_date = datetime.now()
 
+    from_addr = (nylas_msg.get("from") or [{}])[0].get("email", "")
     return {
         "message_id": str(nylas_msg.get("id")),
         "thread_id": str(nylas_msg.get("thread_id")),
-        "from_addr": (nylas_msg.get("from") or [{}])[0].get("email", ""),
+        "from_addr": from_addr,
+        "from_domain": from_addr.rpartition("@")[2].lower() if "@" in from_addr else None,
         "to_addrs": ", ".join(
             [x.get("email", "") for x in (nylas_msg.get("to") or [])]
         ),
@@ -49,6 +57,8 @@ def normalize_message(nylas_msg: Dict[str, Any]) -> Dict[str, Any]:
         "body_text": body_text,
         "body_html": body_html,
         "has_attachments": bool(nylas_msg.get("has_attachments")),
+        "unread": bool(nylas_msg.get("unread")),
+        "folders": ",".join(str(f).lower() for f in nylas_msg.get("folders") or []),
         "snippet": nylas_msg.get("snippet") or "",
     }
 
@@ -73,16 +83,27 @@ def chunk_text(text: str, max_tokens: int = 800, overlap: int = 200) -> List[str
     return chunks
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+@timed(EMBED_SECONDS, EMBED_ERRORS)
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed `texts`, sending batches of `embedding_batch_size` concurrently"""
     if not texts:
         return []
-    resp = _client.embeddings.create(model=config.embedding_model, input=texts)
-    return [d.embedding for d in resp.data]
-
-
-def index_messages(
+    EMBED_TEXTS.inc(len(texts))
+    client = get_openai_client()
+    size = max(1, config.embedding_batch_size)
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+    responses = await asyncio.gather(*(
+        client.embeddings.create(model=config.embedding_model, input=batch) for batch in batches
+    ))
+    for resp in responses:
+        record_openai_usage(config.embedding_model, resp.usage)
+    return [d.embedding for resp in responses for d in resp.data]
+
+
+def chunk_messages(
     account_id: int, normalized_messages: List[Dict[str, Any]]
-) -> Tuple[int, int]:
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """Chunk ids, texts and Chroma metadata for normalized messages, as indexed"""
     chunk_ids: List[str] = []
     texts: List[str] = []
     metas: List[Dict[str, Any]] = []
@@ -103,8 +124,17 @@ def index_messages(
                     "chunk_index": idx,
                 }
             )
+    return chunk_ids, texts, metas
+
 
-    embeddings = embed_texts(texts) if texts else []
+async def index_messages(
+    account_id: int, normalized_messages: List[Dict[str, Any]]
+) -> Tuple[int, int]:
+    chunk_ids, texts, metas = chunk_messages(account_id, normalized_messages)
+    embeddings = await embed_texts(texts) if texts else []
     if texts:
-        upsert_chunks(account_id, chunk_ids, texts, metas, embeddings)
+        # Chroma is synchronous; keep its disk I/O off the event loop
+        await asyncio.to_thread(upsert_chunks, account_id, chunk_ids, texts, metas, embeddings)
+        # Cached answers were grounded on the previous index contents
+        get_answer_cache().bump_generation(account_id)
     return (len(normalized_messages), len(texts))
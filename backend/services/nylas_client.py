@@ -1,16 +1,20 @@
 from __future__ import annotations
 
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 import requests
 from tenacity import retry, wait_exponential, stop_after_attempt
 
 from config import load_config
+from utils.metrics import counter, histogram, timed
 
 
 config = load_config()
 
+NYLAS_SECONDS = histogram("nylas_request_seconds", "Nylas API call latency per attempt", ["operation"])
+NYLAS_ERRORS = counter("nylas_request_errors_total", "Failed Nylas API call attempts", ["operation"])
+
 
 class NylasClient:
     def __init__(self):
@@ -34,6 +38,7 @@ class NylasClient:
     @retry(
         wait=wait_exponential(multiplier=1, min=1, max=10), stop=stop_after_attempt(3)
     )
+    @timed(NYLAS_SECONDS, NYLAS_ERRORS, operation="exchange_code")
     def exchange_code(self, code: str) -> Dict[str, Any]:
         # Exchange authorization code for grant and access token
         token_url = f"{self.api_uri}/v3/connect/token"
@@ -48,21 +53,31 @@ class NylasClient:
         resp.raise_for_status()
         return resp.json()
 
-    def get_grant_email(self, grant_id: str) -> str:
-        """Fetch the email address associated with a grant"""
+    @timed(NYLAS_SECONDS, NYLAS_ERRORS, operation="get_grant")
+    def get_grant(self, grant_id: str, timeout: float = 30) -> Dict[str, Any]:
+        """Fetch a grant: its email address, provider ("google", "microsoft", "imap", ...) and status"""
         headers = {
             "Authorization": f"Bearer {self.client_secret}",
             "Content-Type": "application/json",
         }
         url = f"{self.api_uri}/v3/grants/{grant_id}"
-        resp = requests.get(url, headers=headers, timeout=30)
+        resp = requests.get(url, headers=headers, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
-        return data.get("data", {}).get("email") or data.get("email")
+        return data.get("data") or data
+
+    def get_grant_email(self, grant_id: str) -> str:
+        """Fetch the email address associated with a grant"""
+        return self.get_grant(grant_id).get("email")
+
+    def get_grant_provider(self, grant_id: str) -> Optional[str]:
+        """The mail provider behind a grant, which sync limits its concurrency by"""
+        return self.get_grant(grant_id, timeout=10).get("provider")
 
     @retry(
         wait=wait_exponential(multiplier=1, min=1, max=10), stop=stop_after_attempt(3)
     )
+    @timed(NYLAS_SECONDS, NYLAS_ERRORS, operation="fetch_last_messages")
     def fetch_last_messages(
         self, grant_id: str, limit: int = 200
     ) -> List[Dict[str, Any]]:
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import httpx
+from openai import AsyncOpenAI
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from config import load_config
+
+
+config = load_config()
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Process-wide async OpenAI client.
+
+    Embeddings, judges and every pydantic-ai agent share one keep-alive
+    connection pool, so concurrent chats reuse warm connections instead of
+    each opening (or blocking on) their own.
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.openai_max_connections,
+            max_keepalive_connections=config.openai_max_keepalive_connections,
+        ),
+        timeout=httpx.Timeout(config.openai_timeout_seconds, connect=config.openai_connect_timeout_seconds),
+    )
+    return AsyncOpenAI(
+        api_key=config.openai_api_key,
+        base_url=config.openai_base_url or None,
+        max_retries=config.openai_max_retries,
+        http_client=http_client,
+    )
+
+
+def chat_model(model_name: str) -> OpenAIChatModel:
+    """pydantic-ai model for `model_name` on the shared client"""
+    return OpenAIChatModel(model_name, provider=OpenAIProvider(openai_client=get_openai_client()))
@@ -0,0 +1,309 @@
+"""
+Exact answers for count, list and top-sender questions.
+
+"How many emails did I get from stripe.com this week", "list unread threads
+from Alice" or "who emailed me most today" have exact answers in the message
+metadata. Such questions are parsed into a `StructuredQuery`, compiled to a
+parameterized query over `email_messages` (served by the account/date
+indexes) and answered from the rows, without embeddings or an LLM.
+
+Parsing is deliberately strict: a question is only taken when every word is a
+recognized filter or filler word. Anything with real content ("... about the
+budget") falls through to retrieval, so this path never guesses.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, distinct, func, or_, select
+
+from config import load_config
+from database import SessionLocal, EmailMessage
+
+
+config = load_config()
+
+NOUN_RE = re.compile(r"\b(?:e-?mails?|messages?|mails?|threads?|conversations?|inbox)\b")
+THREAD_RE = re.compile(r"\b(?:threads?|conversations?)\b")
+TOP_RE = re.compile(
+    r"\b(?:who\s+(?:has\s+)?(?:e-?mailed|mailed|messaged|sent|wrote|writes|sends|e-?mails)\s+"
+    r"(?:me\s+)?(?:the\s+)?most(?:\s+(?:e-?mails?|messages?))?|top\s+senders?)\b"
+)
+COUNT_RE = re.compile(r"^(?:how\s+many|count)\b")
+LIST_RE = re.compile(r"^(?:list|show|give|find|get|which|what|any|unread|e-?mails?|messages?|threads?)\b")
+LIMIT_RE = re.compile(r"\b(?:last|latest|recent|newest)\s+(\d{1,2})\b")
+SENDER_RE = re.compile(r"\bfrom\s+([\w.+'-]+@[\w.-]+\w|[\w-]+(?:\.[\w-]+)+|[a-z][\w'-]*)")
+# "new" mail is unread mail, as in every client's "N new messages"
+UNREAD_RE = re.compile(r"\b(?:unread|new)\b")
+ATTACHMENT_RE = re.compile(r"\b(?:(?:with|that\s+have|having|has|have)\s+(?:an?\s+)?)?attachments?\b")
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Words that carry no constraint in these question shapes ("from" only once the sender was taken)
+FILLER = frozenset(
+    "a all am any are can count did do does e email emails from get got had has have how i in inbox is "
+    "list mail mails many me message messages my number of please received recent show so far "
+    "the there thread threads conversations conversation total tell were what which give find".split()
+)
+NOT_SENDERS = frozenset("a an any anyone everyone me my the them this that".split())
+
+
+def _midnight(now: datetime) -> datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month_start(day: datetime) -> datetime:
+    return _midnight(day).replace(day=1)
+
+
+# (pattern, resolver(now, match) -> (since, until)); message dates are naive local time
+PERIODS: List[Tuple[re.Pattern, Callable[[datetime, re.Match], Tuple[datetime, Optional[datetime]]]]] = [
+    (re.compile(r"\btoday\b"), lambda now, m: (_midnight(now), None)),
+    (re.compile(r"\byesterday\b"), lambda now, m: (_midnight(now) - timedelta(days=1), _midnight(now))),
+    (re.compile(r"\bthis\s+week\b"), lambda now, m: (_midnight(now) - timedelta(days=now.weekday()), None)),
+    (re.compile(r"\blast\s+week\b"), lambda now, m: (
+        _midnight(now) - timedelta(days=now.weekday() + 7), _midnight(now) - timedelta(days=now.weekday()),
+    )),
+    (re.compile(r"\bthis\s+month\b"), lambda now, m: (_month_start(now), None)),
+    (re.compile(r"\blast\s+month\b"), lambda now, m: (
+        _month_start(_month_start(now) - timedelta(days=1)), _month_start(now),
+    )),
+    (re.compile(r"\bthis\s+year\b"), lambda now, m: (_midnight(now).replace(month=1, day=1), None)),
+    (re.compile(r"\b(?:in\s+)?(?:the\s+)?(?:last|past)\s+(\d{1,3})\s+days?\b"), lambda now, m: (
+        now - timedelta(days=int(m.group(1))), None,
+    )),
+]
+
+
+@dataclass(frozen=True)
+class StructuredQuery:
+    kind: str  # "count", "list" or "top_senders"
+    target: str = "messages"  # or "threads"
+    sender: Optional[str] = None
+    unread: bool = False
+    has_attachments: bool = False
+    period: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    limit: int = 10
+
+
+@dataclass
+class StructuredResult:
+    answer: str
+    total: int
+    rows: int
+    sql_ms: float
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def parse_question(question: str, now: Optional[datetime] = None) -> Optional[StructuredQuery]:
+    """The structured form of `question`, or None when it needs retrieval"""
+    text = " ".join((question or "").lower().replace("’", "'").split()).strip(" ?.!")
+    if not text:
+        return None
+    now = now or datetime.now()
+
+    def take(pattern: re.Pattern) -> Optional[re.Match]:
+        nonlocal text
+        match = pattern.search(text)
+        if match:
+            text = (text[:match.start()] + " " + text[match.end():]).strip()
+        return match
+
+    if TOP_RE.search(text):
+        kind = "top_senders"
+        take(TOP_RE)
+    elif COUNT_RE.search(text):
+        kind = "count"
+    elif LIST_RE.search(text):
+        kind = "list"
+    else:
+        return None
+    if kind != "top_senders" and not NOUN_RE.search(text):
+        return None
+
+    target = "threads" if THREAD_RE.search(text) else "messages"
+    since = until = period = None
+    for pattern, resolve in PERIODS:
+        match = take(pattern)
+        if match:
+            since, until = resolve(now, match)
+            period = match.group(0).strip()
+            break
+
+    limit = config.structured_query_list_limit
+    limit_match = take(LIMIT_RE)
+    if limit_match:
+        limit = max(1, min(50, int(limit_match.group(1))))
+
+    sender = None
+    sender_match = SENDER_RE.search(text)
+    if sender_match:
+        # "from me" / "from anyone" is not a sender filter we can apply; dropping it would widen the answer
+        if sender_match.group(1) in NOT_SENDERS:
+            return None
+        take(SENDER_RE)
+        sender = sender_match.group(1).strip(".")
+
+    unread = False
+    while take(UNREAD_RE):
+        unread = True
+    has_attachments = take(ATTACHMENT_RE) is not None
+
+    if any(word not in FILLER for word in WORD_RE.findall(text)):
+        return None
+    return StructuredQuery(
+        kind=kind,
+        target=target,
+        sender=sender,
+        unread=unread,
+        has_attachments=has_attachments,
+        period=period,
+        since=since,
+        until=until,
+        limit=limit,
+    )
+
+
+def _starts_with(column: Any, prefix: str) -> Any:
+    """`column` starts with `prefix`, as a range the sender indexes can search (LIKE never uses them)"""
+    return and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def _conditions(account_id: int, query: StructuredQuery) -> List[Any]:
+    conditions = [EmailMessage.account_id == account_id]
+    if query.since is not None:
+        conditions.append(EmailMessage.date >= query.since)
+    if query.until is not None:
+        conditions.append(EmailMessage.date < query.until)
+    if query.unread:
+        conditions.append(EmailMessage.unread.is_(True))
+    if query.has_attachments:
+        conditions.append(EmailMessage.has_attachments.is_(True))
+    if query.sender:
+        sender = query.sender
+        if "@" in sender:
+            conditions.append(func.lower(EmailMessage.from_addr) == sender)
+        elif "." in sender:
+            conditions.append(EmailMessage.from_domain == sender)
+        else:
+            # A name: the address's local part or the domain's first label
+            conditions.append(or_(
+                _starts_with(func.lower(EmailMessage.from_addr), sender),
+                _starts_with(EmailMessage.from_domain, f"{sender}."),
+            ))
+    return conditions
+
+
+def _describe(query: StructuredQuery, count: Optional[int] = None) -> str:
+    noun = "thread" if query.target == "threads" else "email"
+    if count != 1:
+        noun += "s"
+    parts = ["unread" if query.unread else "", noun]
+    if query.has_attachments:
+        parts.append("with attachments")
+    if query.sender:
+        parts.append(f"from {query.sender}")
+    if query.period:
+        parts.append(query.period)
+    return " ".join(p for p in parts if p)
+
+
+def _source(row: Any) -> Dict[str, Any]:
+    return {
+        "message_id": row.message_id,
+        "thread_id": row.thread_id,
+        "subject": row.subject or "",
+        "from_addr": row.from_addr or "",
+        "date": row.date.isoformat() if row.date else None,
+        "chunk_index": 0,
+        "text": row.snippet or "",
+    }
+
+
+def _format_list(query: StructuredQuery, rows: List[Any], total: int) -> str:
+    if not total:
+        return f"There are no {_describe(query)}."
+    if total > len(rows):
+        header = f"Your {len(rows)} most recent {_describe(query, len(rows))} (of {total:,})"
+    else:
+        header = f"{total:,} {_describe(query, total)}"
+    lines = []
+    for row in rows:
+        when = row.date.strftime("%b %d, %Y %H:%M") if row.date else "unknown date"
+        line = f"- {when} · {row.from_addr or 'unknown sender'} · {row.subject or '(no subject)'}"
+        if query.target == "threads":
+            line += f" ({row.count} message{'s' if row.count != 1 else ''})"
+        lines.append(line)
+    return header + ":\n" + "\n".join(lines)
+
+
+def run_structured_query(account_id: int, query: StructuredQuery) -> StructuredResult:
+    """Execute `query` for the account and phrase the answer; synchronous (run it in a thread)"""
+    conditions = _conditions(account_id, query)
+    snippet = func.substr(EmailMessage.body_text, 1, 300).label("snippet")
+    start = perf_counter()
+    db = SessionLocal()
+    try:
+        if query.kind == "top_senders":
+            n = func.count().label("n")
+            rows = db.execute(
+                select(EmailMessage.from_addr, n)
+                .where(*conditions)
+                .group_by(EmailMessage.from_addr)
+                .order_by(n.desc(), EmailMessage.from_addr)
+                .limit(query.limit)
+            ).all()
+            total = db.execute(select(func.count()).select_from(EmailMessage).where(*conditions)).scalar_one()
+            sql_ms = (perf_counter() - start) * 1000
+            if not rows:
+                return StructuredResult(f"There are no {_describe(query)}.", 0, 0, sql_ms)
+            lines = [
+                f"{i}. {r.from_addr or 'unknown sender'}: {r.n} email{'s' if r.n != 1 else ''}"
+                for i, r in enumerate(rows, 1)
+            ]
+            answer = f"Top senders of {_describe(query)}:\n" + "\n".join(lines)
+            return StructuredResult(answer, total, len(rows), sql_ms)
+
+        counted = distinct(EmailMessage.thread_id) if query.target == "threads" else EmailMessage.id
+        total = db.execute(select(func.count(counted)).where(*conditions)).scalar_one()
+
+        if query.target == "threads":
+            # SQLite returns the other bare columns from the row holding max(date),
+            # i.e. each thread's latest message
+            latest = func.max(EmailMessage.date).label("date")
+            rows = db.execute(
+                select(
+                    EmailMessage.thread_id, latest, EmailMessage.message_id, EmailMessage.subject,
+                    EmailMessage.from_addr, snippet, func.count().label("count"),
+                )
+                .where(*conditions)
+                .group_by(EmailMessage.thread_id)
+                .order_by(latest.desc())
+                .limit(query.limit)
+            ).all()
+        else:
+            rows = db.execute(
+                select(
+                    EmailMessage.message_id, EmailMessage.thread_id, EmailMessage.subject,
+                    EmailMessage.from_addr, EmailMessage.date, snippet,
+                )
+                .where(*conditions)
+                .order_by(EmailMessage.date.desc())
+                .limit(query.limit if query.kind == "list" else min(query.limit, 5))
+            ).all()
+        sql_ms = (perf_counter() - start) * 1000
+    finally:
+        db.close()
+
+    if query.kind == "count":
+        verb = "is" if total == 1 else "are"
+        answer = f"There {verb} {total:,} {_describe(query, total)}."
+    else:
+        answer = _format_list(query, rows, total)
+    return StructuredResult(answer, total, len(rows), sql_ms, [_source(r) for r in rows])
@@ -0,0 +1,570 @@
+"""
+Mailbox sync for one account, and the scheduler that keeps every account synced.
+
+`sync_account` fetches the latest messages of an account, stores the new
+ones, folds them into the digests, indexes them and records the outcome in
+`sync_state`. Every outcome also plans the account's next sync:
+
+- the account's rate of new mail is smoothed into `messages_per_hour` (the
+  first sync estimates it from the mail of the last day), and the next sync
+  is due when that rate should have produced `sync_target_new_messages`,
+  clamped to `sync_min_interval_seconds`..`sync_max_interval_seconds`. Busy
+  mailboxes are synced often and quiet ones back off (each sync without new
+  mail lowers the rate, so the interval grows gradually);
+- a sync whose whole fetch was new may have missed mail, so the next one is
+  due after the minimum interval;
+- failures back off exponentially from the minimum interval;
+- times are jittered by 10% so accounts added together drift apart.
+
+`SyncScheduler` runs the due accounts concurrently: at most
+`sync_max_concurrency` at once and at most `sync_provider_concurrency` per
+provider (`sync_provider_limits` overrides single providers), so one slow or
+rate-limited provider never holds every slot. Free slots go to the account
+that has been due the longest whose provider has room, which is round-robin
+across accounts with the adaptive intervals as weights. Each sync is still
+admitted as `sync` work, so chat keeps its reserved capacity; a shed sync is
+retried after the suggested delay without counting as a failure.
+
+`GET /sync/scheduler` reports fleet throughput over the last few minutes
+(syncs per minute, fetched and new messages and chunks per second), sync
+duration and schedule lag percentiles, and accounts in flight and waiting per
+provider. From the command line, one pass over every account:
+
+    python -m services.sync run --once
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from time import monotonic, perf_counter
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import load_config
+from database import SessionLocal, Account, EmailMessage, EmailThread, SyncState
+from services.admission import AdmissionRejected, get_admission_controller
+from services.digest import refresh_digests
+from services.eval.runner import percentile
+from services.ingest import index_messages, normalize_message
+from services.nylas_client import NylasClient
+from services.retention import apply_retention
+from utils.metrics import counter, gauge, histogram
+
+
+config = load_config()
+
+FETCH_LIMIT = 200
+RATE_SMOOTHING = 0.3  # weight of the newest observation in messages_per_hour
+JITTER = 0.1
+WINDOW_SECONDS = 300  # throughput window of the fleet report
+
+SYNC_RUNS = counter("sync_runs_total", "Account syncs, by provider and outcome", ["provider", "outcome"])
+SYNC_MESSAGES = counter("sync_messages_total", "Messages fetched and newly stored by sync", ["kind"])
+SYNC_SECONDS = histogram("sync_seconds", "Time per account sync", ["provider"])
+SYNC_LAG_SECONDS = histogram("sync_schedule_lag_seconds", "Delay between an account's due time and its sync", ["provider"])
+SYNC_INFLIGHT = gauge("sync_inflight", "Scheduled account syncs in flight", ["provider"])
+
+nylas = NylasClient()
+_admission = get_admission_controller()
+
+
+@dataclass
+class SyncResult:
+    account_id: int
+    fetched: int = 0
+    inserted: int = 0
+    chunks: int = 0
+    recent: int = 0  # fetched messages dated within the last day
+    truncated: bool = False  # the whole fetch was new: more mail may have arrived than one fetch returns
+    seconds: float = 0.0
+    error: Optional[str] = None
+    next_sync_at: Optional[datetime] = None
+    interval_seconds: Optional[int] = None
+
+
+def _by_key(db: Session, model: Any, column: Any, account_id: int, keys: List[str]) -> Dict[str, Any]:
+    """Rows of the account whose `column` is in `keys` (one indexed lookup per 500 keys)"""
+    keys = list(dict.fromkeys(keys))
+    found: Dict[str, Any] = {}
+    for i in range(0, len(keys), 500):
+        rows = db.scalars(select(model).where(model.account_id == account_id, column.in_(keys[i:i + 500])))
+        found.update((getattr(r, column.key), r) for r in rows)
+    return found
+
+
+def _store_messages(db: Session, account_id: int, norm_msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert new messages and update their threads; returns the ones inserted"""
+    messages = _by_key(db, EmailMessage, EmailMessage.message_id, account_id, [m["message_id"] for m in norm_msgs])
+    # Also holds threads created earlier in this batch, which a query would not see before the flush
+    threads = _by_key(db, EmailThread, EmailThread.thread_id, account_id, [m["thread_id"] for m in norm_msgs])
+    inserted: List[Dict[str, Any]] = []
+    for m in norm_msgs:
+        existing = messages.get(m["message_id"])
+        if existing:
+            # Read state and folders (moved to trash, archived) change after delivery
+            existing.unread = m["unread"]
+            existing.folders = m["folders"]
+            continue
+        row = EmailMessage(
+            account_id=account_id,
+            thread_id=m["thread_id"],
+            message_id=m["message_id"],
+            from_addr=m["from_addr"],
+            from_domain=m["from_domain"],
+            to_addrs=m["to_addrs"],
+            cc_addrs=m["cc_addrs"],
+            date=m["date"],
+            subject=m["subject"],
+            body_text=m["body_text"],
+            body_html=m["body_html"],
+            has_attachments=m["has_attachments"],
+            unread=m["unread"],
+            folders=m["folders"],
+        )
+        db.add(row)
+        messages[m["message_id"]] = row
+        thr = threads.get(m["thread_id"])
+        if not thr:
+            thr = threads[m["thread_id"]] = EmailThread(
+                account_id=account_id,
+                thread_id=m["thread_id"],
+                subject=m["subject"],
+                latest_from=m["from_addr"],
+                latest_snippet=m["snippet"],
+                updated_at=m["date"],
+            )
+            db.add(thr)
+        else:
+            thr.subject = thr.subject or m["subject"]
+            thr.latest_from = m["from_addr"]
+            thr.latest_snippet = m["snippet"]
+            thr.updated_at = max(thr.updated_at or m["date"], m["date"])
+        inserted.append(m)
+
+    db.commit()
+    return inserted
+
+
+def _store_and_refresh(account_id: int, norm_msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Store a batch and fold it into the digests on the calling (worker) thread's own session"""
+    db = SessionLocal()
+    try:
+        inserted = _store_messages(db, account_id, norm_msgs)
+        if config.digest_enabled:
+            # Fold the new rows into the materialized today / this-week digests
+            refresh_digests(db, account_id)
+        return inserted
+    finally:
+        db.close()
+
+
+def _fetch_and_normalize(account_id: int, grant_id: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """Number of messages fetched, and the normalized ones retention keeps"""
+    messages = nylas.fetch_last_messages(grant_id, limit=FETCH_LIMIT)
+    # Mail the retention policy already expired would only be deleted again by compaction
+    return len(messages), apply_retention(account_id, [normalize_message(m) for m in messages])
+
+
+def _interval(messages_per_hour: float) -> int:
+    """Seconds until the rate should have produced `sync_target_new_messages`"""
+    if messages_per_hour <= 0:
+        return config.sync_max_interval_seconds
+    seconds = config.sync_target_new_messages / messages_per_hour * 3600
+    return int(min(config.sync_max_interval_seconds, max(config.sync_min_interval_seconds, seconds)))
+
+
+def _backoff(failures: int) -> int:
+    return int(min(config.sync_max_interval_seconds, config.sync_min_interval_seconds * 2 ** min(failures - 1, 16)))
+
+
+def _record(account_id: int, result: SyncResult) -> Tuple[datetime, Optional[int]]:
+    """Store the outcome of a sync and plan the next one; returns its due time and interval"""
+    db = SessionLocal()
+    try:
+        state = db.get(SyncState, account_id)
+        if state is None:
+            state = SyncState(account_id=account_id, total_messages=0, failures=0)
+            db.add(state)
+        now = datetime.utcnow()
+        # Stored before any later step failed
+        state.total_messages = (state.total_messages or 0) + result.inserted
+        if result.error is not None:
+            state.failures = (state.failures or 0) + 1
+            state.last_error = result.error[:500]
+            interval = _backoff(state.failures)
+        else:
+            if state.messages_per_hour is None or state.last_synced_at is None:
+                # First sync: everything is new, so estimate the rate from the last day's mail
+                rate = result.recent / 24
+            else:
+                hours = max((now - state.last_synced_at).total_seconds() / 3600, 1 / 60)
+                rate = (1 - RATE_SMOOTHING) * state.messages_per_hour + RATE_SMOOTHING * result.inserted / hours
+            interval = _interval(rate)
+            if result.truncated and state.last_synced_at is not None:
+                interval = config.sync_min_interval_seconds
+            state.messages_per_hour = round(rate, 3)
+            state.interval_seconds = interval
+            state.last_synced_at = now
+            state.failures = 0
+            state.last_error = None
+        state.next_sync_at = now + timedelta(seconds=interval * random.uniform(1 - JITTER, 1 + JITTER))
+        db.commit()
+        return state.next_sync_at, state.interval_seconds
+    finally:
+        db.close()
+
+
+async def sync_account(account_id: int, grant_id: str, provider: Optional[str] = None) -> SyncResult:
+    """
+    Fetch, store, digest and index the latest mail of one account, then plan
+    its next sync. Failures are recorded and returned in `error`;
+    AdmissionRejected is raised when the sync class has no capacity.
+    """
+    label = provider or "unknown"
+    result = SyncResult(account_id=account_id)
+    try:
+        ticket = await _admission.acquire("sync")
+    except AdmissionRejected:
+        SYNC_RUNS.inc(provider=label, outcome="shed")
+        raise
+
+    # Batch work: bounded by its own admission pool and run on its own threads,
+    # so a sync never takes the event loop or thread pool away from chat
+    started = perf_counter()
+    try:
+        try:
+            fetched, norm_msgs = await _admission.run_blocking("sync", _fetch_and_normalize, account_id, grant_id)
+            since = datetime.now() - timedelta(days=1)  # message dates are local time
+            result.fetched = len(norm_msgs)
+            result.recent = sum(1 for m in norm_msgs if m["date"] >= since)
+            new_msgs = await _admission.run_blocking("sync", _store_and_refresh, account_id, norm_msgs)
+            result.inserted = len(new_msgs)
+            result.truncated = fetched >= FETCH_LIMIT and result.inserted >= len(norm_msgs)
+            # Stored messages were indexed when they arrived; re-embedding them would only
+            # cost OpenAI calls and flush the answer cache
+            if new_msgs:
+                _, result.chunks = await index_messages(account_id, new_msgs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+        result.seconds = perf_counter() - started
+        result.next_sync_at, result.interval_seconds = await _admission.run_blocking("sync", _record, account_id, result)
+    finally:
+        ticket.release()
+
+    SYNC_RUNS.inc(provider=label, outcome="failed" if result.error else "ok")
+    SYNC_SECONDS.observe(result.seconds, provider=label)
+    SYNC_MESSAGES.inc(result.fetched, kind="fetched")
+    SYNC_MESSAGES.inc(result.inserted, kind="inserted")
+    return result
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    """"google:4,imap:1" -> {"google": 4, "imap": 1}"""
+    out: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        key, _, limit = part.partition(":")
+        if key.strip() and limit.strip():
+            out[key.strip().lower()] = int(limit)
+    return out
+
+
+@dataclass
+class _Scheduled:
+    account_id: int
+    grant_id: str
+    provider: str
+    next_at: datetime
+    interval_seconds: Optional[int] = None
+    running: bool = False
+    stored_at: Optional[datetime] = None  # next_sync_at as last read or written
+
+
+@dataclass
+class _Finished:
+    at: float
+    provider: str
+    outcome: str
+    fetched: int = 0
+    inserted: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    lag: float = 0.0
+    truncated: bool = False
+
+
+def _load_accounts() -> List[Any]:
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(
+                Account.id, Account.nylas_grant_id, Account.provider,
+                SyncState.next_sync_at, SyncState.interval_seconds,
+            ).outerjoin(SyncState, SyncState.account_id == Account.id)
+        ).all()
+    finally:
+        db.close()
+
+
+class SyncScheduler:
+    """Keeps every connected account synced; see the module docstring"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        provider_concurrency: int,
+        provider_limits: Optional[Dict[str, int]] = None,
+        refresh_seconds: float = 60.0,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.provider_concurrency = max(1, provider_concurrency)
+        self.provider_limits = provider_limits or {}
+        self.refresh_seconds = refresh_seconds
+        self._accounts: Dict[int, _Scheduled] = {}
+        self._running: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending: Set[int] = set()  # accounts a --once pass still has to sync
+        self._finished: Deque[_Finished] = deque()
+        self._totals: Dict[str, int] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._refresh_at = 0.0
+        self._started_at: Optional[float] = None
+
+    def provider_limit(self, provider: str) -> int:
+        return self.provider_limits.get(provider, self.provider_concurrency)
+
+    @property
+    def in_flight(self) -> int:
+        # Counted in _sync itself: a finished task leaves _tasks only after the loop has woken
+        return sum(self._running.values())
+
+    async def run(self, once: bool = False) -> None:
+        """Schedule until cancelled; with `once`, until every account was synced one time"""
+        self._wake = asyncio.Event()
+        self._started_at = monotonic()
+        try:
+            await self._refresh()
+            if once:
+                now = datetime.utcnow()
+                for entry in self._accounts.values():
+                    entry.next_at = now
+                self._pending = set(self._accounts)
+            while True:
+                self._wake.clear()
+                if monotonic() >= self._refresh_at:
+                    await self._refresh()
+                self._dispatch()
+                if once and not self._pending and not self.in_flight:
+                    return
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._sleep_seconds())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._wake = None
+
+    async def _refresh(self) -> None:
+        """Pick up new and removed accounts, and due times moved by manual syncs"""
+        rows = await asyncio.to_thread(_load_accounts)
+        now = datetime.utcnow()
+        seen = set()
+        for account_id, grant_id, provider, next_sync_at, interval_seconds in rows:
+            seen.add(account_id)
+            entry = self._accounts.get(account_id)
+            if entry is None:
+                self._accounts[account_id] = _Scheduled(
+                    account_id, grant_id, (provider or "unknown").lower(), next_sync_at or now,
+                    interval_seconds, stored_at=next_sync_at,
+                )
+                continue
+            entry.grant_id = grant_id
+            if not entry.running and account_id not in self._pending and next_sync_at != entry.stored_at:
+                # Moved outside the scheduler, e.g. by a manual sync
+                entry.next_at = next_sync_at or now
+                entry.stored_at = next_sync_at
+                entry.interval_seconds = interval_seconds
+        for account_id in set(self._accounts) - seen:
+            if not self._accounts[account_id].running:
+                del self._accounts[account_id]
+        self._pending &= seen
+        self._refresh_at = monotonic() + self.refresh_seconds
+
+    def _dispatch(self) -> None:
+        """Start due accounts, longest-due first, while the global and provider limits allow"""
+        now = datetime.utcnow()
+        due = sorted(
+            (e for e in self._accounts.values() if not e.running and e.next_at <= now),
+            key=lambda e: (e.next_at, e.account_id),
+        )
+        for entry in due:
+            if self.in_flight >= self.max_concurrency:
+                break
+            if self._running.get(entry.provider, 0) >= self.provider_limit(entry.provider):
+                continue
+            entry.running = True
+            self._running[entry.provider] = self._running.get(entry.provider, 0) + 1
+            SYNC_INFLIGHT.set(self._running[entry.provider], provider=entry.provider)
+            task = asyncio.create_task(self._sync(entry, (now - entry.next_at).total_seconds()))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _sleep_seconds(self) -> float:
+        """Until the next idle account is due or the next refresh; completions wake earlier"""
+        now = datetime.utcnow()
+        wait = max(0.0, self._refresh_at - monotonic())
+        for entry in self._accounts.values():
+            if not entry.running and entry.next_at > now:
+                wait = min(wait, (entry.next_at - now).total_seconds())
+        return max(0.05, wait)
+
+    async def _sync(self, entry: _Scheduled, lag: float) -> None:
+        SYNC_LAG_SECONDS.observe(lag, provider=entry.provider)
+        done = _Finished(at=0.0, provider=entry.provider, outcome="ok", lag=lag)
+        try:
+            result = await sync_account(entry.account_id, entry.grant_id, entry.provider)
+        except AdmissionRejected as e:
+            done.outcome = "shed"
+            entry.next_at = datetime.utcnow() + timedelta(seconds=e.retry_after)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Recording the outcome failed (e.g. the database); retry like a failed sync
+            done.outcome = "failed"
+            entry.next_at = datetime.utcnow() + timedelta(seconds=_backoff(1))
+        else:
+            done.outcome = "failed" if result.error else "ok"
+            done.fetched, done.inserted, done.chunks = result.fetched, result.inserted, result.chunks
+            done.seconds, done.truncated = result.seconds, result.truncated
+            entry.next_at = entry.stored_at = result.next_sync_at
+            entry.interval_seconds = result.interval_seconds or entry.interval_seconds
+        finally:
+            entry.running = False
+            self._running[entry.provider] -= 1
+            SYNC_INFLIGHT.set(self._running[entry.provider], provider=entry.provider)
+            if done.outcome != "shed":
+                self._pending.discard(entry.account_id)
+            done.at = monotonic()
+            self._finished.append(done)
+            self._totals[done.outcome] = self._totals.get(done.outcome, 0) + 1
+            if self._wake is not None:
+                self._wake.set()
+
+    def stats(self, accounts: bool = False) -> Dict[str, Any]:
+        now, clock = datetime.utcnow(), monotonic()
+        while self._finished and self._finished[0].at < clock - WINDOW_SECONDS:
+            self._finished.popleft()
+        window = min(WINDOW_SECONDS, clock - self._started_at) if self._started_at else 0.0
+        recent = list(self._finished)
+        synced = [f for f in recent if f.outcome != "shed"]
+
+        def per_second(total: float) -> Optional[float]:
+            return round(total / window, 3) if window > 0 else None
+
+        providers: Dict[str, Dict[str, Any]] = {}
+        waiting: List[float] = []
+        for entry in self._accounts.values():
+            p = providers.setdefault(entry.provider, {"accounts": 0, "running": 0, "due": 0, "limit": self.provider_limit(entry.provider)})
+            p["accounts"] += 1
+            if entry.running:
+                p["running"] += 1
+            elif entry.next_at <= now:
+                p["due"] += 1
+                waiting.append((now - entry.next_at).total_seconds())
+        for f in recent:
+            p = providers.get(f.provider)
+            if p is not None:
+                p[f.outcome] = p.get(f.outcome, 0) + 1
+        intervals = [e.interval_seconds for e in self._accounts.values() if e.interval_seconds]
+        lags = [f.lag for f in recent]
+        seconds = [f.seconds for f in synced]
+
+        out: Dict[str, Any] = {
+            "running": self._wake is not None,
+            "max_concurrency": self.max_concurrency,
+            "accounts": len(self._accounts),
+            "in_flight": self.in_flight,
+            "due": len(waiting),
+            "oldest_due_s": round(max(waiting), 1) if waiting else 0.0,
+            "window_s": round(window, 1),
+            "throughput": {
+                "syncs": len(synced),
+                "syncs_per_min": round(per_second(len(synced)) * 60, 2) if window > 0 else None,
+                "fetched_per_s": per_second(sum(f.fetched for f in synced)),
+                "new_messages_per_s": per_second(sum(f.inserted for f in synced)),
+                "chunks_per_s": per_second(sum(f.chunks for f in synced)),
+                "failed": sum(1 for f in recent if f.outcome == "failed"),
+                "shed": len(recent) - len(synced),
+                "truncated": sum(1 for f in synced if f.truncated),
+            },
+            "sync_seconds": {"p50": percentile(seconds, 50), "p95": percentile(seconds, 95)},
+            "lag_seconds": {"p50": percentile(lags, 50), "p95": percentile(lags, 95), "max": max(lags) if lags else None},
+            "interval_seconds": {
+                "min": min(intervals) if intervals else None,
+                "p50": percentile(intervals, 50),
+                "max": max(intervals) if intervals else None,
+            },
+            "providers": providers,
+            "totals": dict(self._totals),
+        }
+        for key in ("sync_seconds", "lag_seconds"):
+            out[key] = {k: round(v, 3) if v is not None else None for k, v in out[key].items()}
+        if accounts:
+            out["schedule"] = [
+                {
+                    "account_id": e.account_id,
+                    "provider": e.provider,
+                    "running": e.running,
+                    "next_sync_in_s": round((e.next_at - now).total_seconds(), 1),
+                    "interval_seconds": e.interval_seconds,
+                }
+                for e in sorted(self._accounts.values(), key=lambda e: e.next_at)
+            ]
+        return out
+
+
+_scheduler = SyncScheduler(
+    max_concurrency=config.sync_max_concurrency,
+    provider_concurrency=config.sync_provider_concurrency,
+    provider_limits=_parse_limits(config.sync_provider_limits),
+    refresh_seconds=config.sync_refresh_seconds,
+)
+
+
+def get_sync_scheduler() -> SyncScheduler:
+    """Get the process-wide sync scheduler"""
+    return _scheduler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Multi-account mailbox sync")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_cmd = sub.add_parser("run", help="Run the scheduler and print the fleet report")
+    run_cmd.add_argument("--once", action="store_true", help="Sync every account once, then stop")
+    run_cmd.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    run_cmd.add_argument("--accounts", action="store_true", help="Include the per-account schedule")
+    args = parser.parse_args(argv)
+
+    async def run() -> None:
+        try:
+            await asyncio.wait_for(_scheduler.run(once=args.once), args.duration)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    print(json.dumps(_scheduler.stats(accounts=args.accounts), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import SessionLocal, UsageEvent
+from utils.metrics import counter
+
+
+USAGE_SAVE_ERRORS = counter(
+    "usage_save_errors_total", "Requests whose usage records could not be stored", ["request_kind"]
+)
+
+
+# USD per 1M tokens: (input, cached input, output). Matched by longest model-name prefix.
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0, cached_tokens: int = 0) -> Optional[float]:
+    """Estimated USD cost of one call, or None for a model without a known price"""
+    name = (model or "").split(":")[-1]
+    prefix = max((p for p in PRICES if name.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return None
+    input_price, cached_price, output_price = PRICES[prefix]
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class UsageRecord:
+    stage: str
+    model: str
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: Optional[float] = 0.0
+
+
+class UsageTracker:
+    """Token usage of one request, aggregated per (stage, model)"""
+
+    def __init__(self) -> None:
+        self._records: Dict[Tuple[str, str], UsageRecord] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0) -> None:
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        with self._lock:
+            record = self._records.setdefault((stage, model), UsageRecord(stage, model))
+            record.calls += 1
+            record.prompt_tokens += prompt_tokens
+            record.completion_tokens += completion_tokens
+            record.cached_tokens += cached_tokens
+            record.cost_usd = None if cost is None or record.cost_usd is None else record.cost_usd + cost
+
+    def records(self) -> List[UsageRecord]:
+        with self._lock:
+            return list(self._records.values())
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-ready totals plus a per-stage breakdown"""
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+        for r in self.records():
+            stage = by_stage.setdefault(r.stage, {"models": [], "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0})
+            stage["models"].append(r.model)
+            for target in (stage, totals):
+                target["calls"] += r.calls
+                target["prompt_tokens"] += r.prompt_tokens
+                target["completion_tokens"] += r.completion_tokens
+                target["cached_tokens"] += r.cached_tokens
+                target["cost_usd"] += r.cost_usd or 0.0
+
+        for target in [totals, *by_stage.values()]:
+            target["cost_usd"] = round(target["cost_usd"], 6)
+        return {**totals, "by_stage": by_stage}
+
+
+# Set per request by the caller; node tasks inherit a copy of the context, which
+# still points at the same tracker, so every stage adds to one request's totals.
+_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("usage_tracker", default=None)
+_stage: ContextVar[str] = ContextVar("usage_stage", default="other")
+
+
+def start_usage_tracking() -> UsageTracker:
+    """Track model usage of everything run from the current context onwards"""
+    tracker = UsageTracker()
+    _tracker.set(tracker)
+    return tracker
+
+
+def get_usage_tracker() -> Optional[UsageTracker]:
+    return _tracker.get()
+
+
+def usage_stage(name: str):
+    """Decorator attributing model calls made inside an async function to stage `name`"""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _stage.set(name)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _stage.reset(token)
+        return wrapper
+    return decorator
+
+
+def record_usage(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0, stage: Optional[str] = None) -> None:
+    """Add one model call to the current request's tracker; a no-op outside tracked requests"""
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.add(stage or _stage.get(), model, prompt_tokens or 0, completion_tokens or 0, cached_tokens or 0)
+
+
+def record_openai_usage(model: str, usage: Any, stage: Optional[str] = None) -> None:
+    """Record the `usage` block of an OpenAI chat completion or embeddings response"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record_usage(
+        model,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0),
+        completion_tokens=getattr(usage, "completion_tokens", 0),
+        cached_tokens=getattr(details, "cached_tokens", 0) if details else 0,
+        stage=stage,
+    )
+
+
+def record_agent_usage(model: str, usage: Any, stage: Optional[str] = None) -> None:
+    """Record a pydantic-ai `RunUsage`"""
+    if usage is None:
+        return
+    record_usage(
+        model,
+        prompt_tokens=usage.input_tokens,
+        completion_tokens=usage.output_tokens,
+        cached_tokens=usage.cache_read_tokens,
+        stage=stage,
+    )
+
+
+def save_usage(
+    tracker: UsageTracker,
+    account_id: Optional[int],
+    request_kind: str,
+    conversation_id: Optional[str] = None,
+) -> int:
+    """Persist one request's usage as `usage_events` rows; returns the row count"""
+    records = tracker.records()
+    if not records:
+        return 0
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.add_all([
+            UsageEvent(
+                account_id=account_id,
+                created_at=now,
+                request_kind=request_kind,
+                conversation_id=conversation_id,
+                stage=r.stage,
+                model=r.model,
+                calls=r.calls,
+                prompt_tokens=r.prompt_tokens,
+                completion_tokens=r.completion_tokens,
+                cached_tokens=r.cached_tokens,
+                cost_usd=r.cost_usd,
+            )
+            for r in records
+        ])
+        db.commit()
+    finally:
+        db.close()
+    return len(records)
@@ -7,28 +7,52 @@ os.environ["CHROMA_TELEMETRY"] = "False"
 os.environ["CHROMA_TELEMETRY_IMPL"] = "None"
 os.environ["POSTHOG_DISABLED"] = "1"
 
-from typing import List, Dict, Any
+import threading
+from typing import Any, Callable, Dict, List, TypeVar
 from pathlib import Path
 
 import chromadb
 from chromadb.config import Settings
 
 from config import load_config
+from utils.metrics import counter, histogram, timed
 
 
 config = load_config()
+
+T = TypeVar("T")
+
+VECTORSTORE_SECONDS = histogram("vectorstore_seconds", "Chroma operation latency", ["operation"])
+VECTORSTORE_ERRORS = counter("vectorstore_errors_total", "Failed Chroma operations", ["operation"])
 Path(config.chroma_dir).mkdir(parents=True, exist_ok=True)
 
+# Held by writers for the whole of a collection rebuild, so no upsert lands in the old copy
+_write_locks: Dict[int, threading.Lock] = {}
+_write_locks_lock = threading.Lock()
+# Held briefly while a rebuilt collection replaces the old one under the same name
+_swap_lock = threading.Lock()
+# Chroma sets up a path's shared client on first use, which races between threads
+_client_lock = threading.Lock()
+
 
 def get_client() -> chromadb.Client:
-    return chromadb.PersistentClient(
-        path=config.chroma_dir,
-        settings=Settings(
-            anonymized_telemetry=False,
-            allow_reset=True,
-            is_persistent=True,
+    with _client_lock:
+        return chromadb.PersistentClient(
+            path=config.chroma_dir,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True,
+                is_persistent=True,
+            )
         )
-    )
+
+
+def _write_lock(account_id: int) -> threading.Lock:
+    with _write_locks_lock:
+        lock = _write_locks.get(account_id)
+        if lock is None:
+            lock = _write_locks[account_id] = threading.Lock()
+        return lock
 
 
 def collection_name_for_account(account_id: int) -> str:
@@ -38,13 +62,31 @@ def collection_name_for_account(account_id: int) -> str:
 def get_or_create_collection(account_id: int):
     client = get_client()
     name = collection_name_for_account(account_id)
+    with _swap_lock:
+        try:
+            col = client.get_collection(name)
+        except Exception:
+            col = client.create_collection(name)
+    return col
+
+
+def _read(account_id: int, fn: Callable[[Any], T]) -> T:
+    """
+    Run a read on the account's collection. Readers don't take the write lock,
+    so a rebuild can delete the collection under a handle in use; the read is
+    then retried once on the collection that replaced it.
+    """
+    col = get_or_create_collection(account_id)
     try:
-        col = client.get_collection(name)
+        return fn(col)
     except Exception:
-        col = client.create_collection(name)
-    return col
+        current = get_or_create_collection(account_id)
+        if current.id == col.id:
+            raise
+        return fn(current)
 
 
+@timed(VECTORSTORE_SECONDS, VECTORSTORE_ERRORS, operation="upsert_chunks")
 def upsert_chunks(
     account_id: int,
     chunk_ids: List[str],
@@ -52,19 +94,68 @@ def upsert_chunks(
     metadatas: List[Dict[str, Any]],
     embeddings: List[List[float]] | None = None,
 ):
-    col = get_or_create_collection(account_id)
-    col.upsert(
-        ids=chunk_ids, documents=texts, metadatas=metadatas, embeddings=embeddings
-    )
+    with _write_lock(account_id):
+        col = get_or_create_collection(account_id)
+        col.upsert(
+            ids=chunk_ids, documents=texts, metadatas=metadatas, embeddings=embeddings
+        )
 
 
+@timed(VECTORSTORE_SECONDS, VECTORSTORE_ERRORS, operation="query_chunks")
 def query_chunks(
     account_id: int, query_embedding: List[float], top_k: int = 6
 ) -> Dict[str, Any]:
-    col = get_or_create_collection(account_id)
-    res = col.query(
+    return _read(account_id, lambda col: col.query(
         query_embeddings=[query_embedding],
         n_results=top_k,
         include=["documents", "metadatas", "distances"],
-    )
-    return res
+    ))
+
+
+def count_chunks(account_id: int) -> int:
+    return _read(account_id, lambda col: col.count())
+
+
+@timed(VECTORSTORE_SECONDS, VECTORSTORE_ERRORS, operation="delete_messages")
+def delete_message_chunks(account_id: int, message_ids: List[str], dry_run: bool = False) -> int:
+    """Delete every chunk of the given messages; returns the number of chunks"""
+    deleted = 0
+    with _write_lock(account_id):
+        col = get_or_create_collection(account_id)
+        for i in range(0, len(message_ids), 500):
+            ids = col.get(where={"message_id": {"$in": message_ids[i:i + 500]}}, include=[])["ids"]
+            if ids and not dry_run:
+                col.delete(ids=ids)
+            deleted += len(ids)
+    return deleted
+
+
+@timed(VECTORSTORE_SECONDS, VECTORSTORE_ERRORS, operation="rebuild_collection")
+def rebuild_collection(account_id: int, batch_size: int = 1000) -> int:
+    """
+    Copy the account's chunks into a fresh collection that replaces the old one.
+    Chroma only marks deleted vectors in the HNSW index, so after large deletes
+    the index (and search time) shrinks only through a rebuild. Returns the
+    number of chunks copied.
+    """
+    client = get_client()
+    name = collection_name_for_account(account_id)
+    staging = f"{name}_rebuild"
+    with _write_lock(account_id):
+        old = get_or_create_collection(account_id)
+        try:
+            client.delete_collection(staging)
+        except Exception:
+            pass
+        new = client.create_collection(staging, metadata=old.metadata)
+        copied = 0
+        while True:
+            page = old.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=copied)
+            if not page["ids"]:
+                break
+            new.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+            copied += len(page["ids"])
+        with _swap_lock:
+            client.delete_collection(name)
+            new.modify(name=name)
+    return copied
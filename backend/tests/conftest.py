@@ -0,0 +1,72 @@
+"""Scratch database and Chroma directory for the tests, plus account and message fixtures."""
+
+from __future__ import annotations
+
+import itertools
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+# Before any app module loads its config
+_tmp = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SQLITE_PATH", os.path.join(_tmp, "app.db"))
+os.environ.setdefault("CHROMA_DIR", os.path.join(_tmp, "chroma"))
+os.environ.setdefault("INTENT_LOG_PATH", os.path.join(_tmp, "intent_router_log.jsonl"))
+
+from database import Account, EmailMessage, SessionLocal, engine, upgrade_schema  # noqa: E402
+
+upgrade_schema(engine)
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def account() -> int:
+    """A fresh connected account, so tests never see each other's mail"""
+    db = SessionLocal()
+    try:
+        grant = uuid.uuid4().hex
+        acct = Account(email=f"{grant[:8]}@example.com", nylas_grant_id=grant, access_token=grant, provider="google")
+        db.add(acct)
+        db.commit()
+        return acct.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def add_messages() -> Callable[..., List[str]]:
+    """Store messages for an account: add_messages(account_id, {"from_addr": ..., "date": ...}, ...)"""
+
+    def add(account_id: int, *messages: Dict[str, Any]) -> List[str]:
+        db = SessionLocal()
+        try:
+            ids = []
+            for m in messages:
+                n = next(_ids)
+                from_addr = m.get("from_addr", "alice@example.com")
+                row = EmailMessage(
+                    account_id=account_id,
+                    message_id=m.get("message_id", f"m{n}"),
+                    thread_id=m.get("thread_id", f"t{n}"),
+                    from_addr=from_addr,
+                    from_domain=from_addr.rpartition("@")[2].lower(),
+                    date=m.get("date", datetime.now()),
+                    subject=m.get("subject", f"subject {n}"),
+                    body_text=m.get("body_text", f"body {n}"),
+                    unread=m.get("unread", False),
+                    has_attachments=m.get("has_attachments", False),
+                )
+                db.add(row)
+                ids.append(row.message_id)
+            db.commit()
+            return ids
+        finally:
+            db.close()
+
+    return add
@@ -0,0 +1,85 @@
+"""Admission control: slots reserved for interactive work, queue limits, and the 429 response."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.routers import chat
+from services.admission import AdmissionController, AdmissionRejected, WorkClass
+
+
+def _controller(**kwargs) -> AdmissionController:
+    return AdmissionController(
+        classes=[WorkClass("chat", 0, 2, 1, 0.05), WorkClass("sync", 1, 2, 1, 0.05)],
+        max_total=2,
+        **kwargs,
+    )
+
+
+def test_reserved_slot_is_only_for_interactive_work():
+    async def scenario():
+        admission = _controller(reserved_for_interactive=1)
+        sync = await admission.acquire("sync")
+        # The last slot is held back for chat, so a second sync queues and times out
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("sync")
+        assert rejected.value.reason == "timeout"
+        chat_ticket = await admission.acquire("chat")
+        assert admission.stats()["active_total"] == 2
+        sync.release()
+        chat_ticket.release()
+        chat_ticket.release()  # releasing twice is a no-op
+        assert admission.stats()["active_total"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_freed_slot_goes_to_the_queued_interactive_request():
+    async def scenario():
+        admission = _controller()
+        held = [await admission.acquire("sync"), await admission.acquire("chat")]
+        queued_sync = asyncio.ensure_future(admission.acquire("sync"))
+        queued_chat = asyncio.ensure_future(admission.acquire("chat"))
+        await asyncio.sleep(0)
+        held[0].release()
+        # Chat queued after sync but is higher priority
+        ticket = await queued_chat
+        assert ticket.work_class.name == "chat"
+        assert not queued_sync.done()
+        with pytest.raises(AdmissionRejected):
+            await queued_sync
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        admission = _controller()
+        await admission.acquire("chat")
+        await admission.acquire("chat")
+        waiting = asyncio.ensure_future(admission.acquire("chat"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("chat")
+        assert rejected.value.reason == "queue_full"
+        assert rejected.value.retry_after >= 1
+        with pytest.raises(AdmissionRejected):
+            await waiting
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_shed_chat_gets_429(monkeypatch, account, path):
+    async def overloaded(name):
+        raise AdmissionRejected(name, "queue_full", 7)
+
+    monkeypatch.setattr(chat._admission, "acquire", overloaded)
+    response = TestClient(app).post(path, json={"question": "anything new?", "account_id": account})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert response.json()["reason"] == "queue_full"
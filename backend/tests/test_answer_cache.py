@@ -0,0 +1,52 @@
+"""Answer cache hits, misses on different generation settings, and generation invalidation."""
+
+from __future__ import annotations
+
+import pytest
+
+from services.answer_cache import AnswerCache
+
+SETTINGS = dict(top_k=8, temperature=0.0, max_tokens=512)
+
+
+def _cache_with_answer(**settings) -> AnswerCache:
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.store(
+        1, "What did Alice send?", [1.0, 0.0, 0.0], "A contract.", [], generation=cache.generation(1),
+        **{**SETTINGS, **settings},
+    )
+    return cache
+
+
+def test_hits_on_same_settings():
+    cache = _cache_with_answer()
+    assert cache.lookup_exact(1, "what did alice send", **SETTINGS).answer == "A contract."
+    # A near-duplicate embedding matches too
+    assert cache.lookup(1, [0.99, 0.05, 0.0], **SETTINGS).answer == "A contract."
+    assert cache.lookup(1, [0.0, 1.0, 0.0], **SETTINGS) is None
+    assert cache.lookup_exact(2, "what did alice send", **SETTINGS) is None
+
+
+@pytest.mark.parametrize("changed", [dict(top_k=4), dict(temperature=0.7), dict(max_tokens=1024)])
+def test_misses_on_different_settings(changed):
+    cache = _cache_with_answer()
+    settings = {**SETTINGS, **changed}
+    assert cache.lookup_exact(1, "What did Alice send?", **settings) is None
+    assert cache.lookup(1, [1.0, 0.0, 0.0], **settings) is None
+
+
+def test_bump_generation_drops_answers():
+    cache = _cache_with_answer()
+    assert cache.bump_generation(1) == 1
+    assert cache.size() == 0
+    assert cache.lookup_exact(1, "What did Alice send?", **SETTINGS) is None
+    assert cache.lookup(1, [1.0, 0.0, 0.0], **SETTINGS) is None
+
+
+def test_store_from_a_stale_generation_is_discarded():
+    cache = AnswerCache()
+    started = cache.generation(1)
+    cache.bump_generation(1)  # a sync finished while the answer was being generated
+    cache.store(1, "What did Alice send?", [1.0, 0.0, 0.0], "A contract.", [], generation=started, **SETTINGS)
+    assert cache.size() == 0
+    assert cache.lookup_exact(1, "What did Alice send?", **SETTINGS) is None
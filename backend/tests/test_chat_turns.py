@@ -0,0 +1,68 @@
+"""Chat turns: per-turn state on continued conversations and usage recording."""
+
+from __future__ import annotations
+
+import asyncio
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from agents.models.chat import ChatRequest
+from api.routers import chat
+from orchestrator import ChatState, Flight
+from services.usage import USAGE_SAVE_ERRORS
+
+
+def _respond(state: ChatState) -> ChatState:
+    # Fails the first turn; later turns leave the answer to a later node, like the output route
+    if state.question == "first":
+        state.answer = "first answer"
+        state.error = "Retrieval failed"
+    state.conversation_history = state.conversation_history + [{"role": "user", "content": state.question}]
+    return state
+
+
+def _workflow():
+    graph = StateGraph(ChatState)
+    graph.add_node("respond", _respond)
+    graph.add_edge(START, "respond")
+    graph.add_edge("respond", END)
+    return graph.compile(checkpointer=MemorySaver())
+
+
+def test_continued_conversation_resets_answer_and_error(monkeypatch):
+    monkeypatch.setattr(chat, "_workflow", _workflow())
+
+    async def turn(question, conversation_id=None):
+        request = ChatRequest(question=question, conversation_id=conversation_id)
+        state, thread_config, conversation_id = await chat._start_turn(request, account_id=1)
+        return await chat._workflow.ainvoke(state, config=thread_config), conversation_id
+
+    async def conversation():
+        first, conversation_id = await turn("first")
+        second, _ = await turn("second", conversation_id)
+        return first, second
+
+    first, second = asyncio.run(conversation())
+    assert first["answer"] == "first answer" and first["error"] == "Retrieval failed"
+    assert second["answer"] is None
+    assert second["error"] is None
+    assert [m["content"] for m in second["conversation_history"]] == ["first", "second"]
+
+
+def test_failed_usage_save_is_counted(monkeypatch):
+    monkeypatch.setattr(chat, "_workflow", _workflow())
+
+    def broken_save(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(chat, "save_usage", broken_save)
+    before = USAGE_SAVE_ERRORS.value(request_kind="stream")
+
+    async def run():
+        return await chat._run_turn(Flight(None), ChatRequest(question="second"), account_id=1, kind="stream")
+
+    # The turn still answers; the lost usage is counted instead of silently dropped
+    result = asyncio.run(run())
+    assert result["conversation_history"][-1]["content"] == "second"
+    assert USAGE_SAVE_ERRORS.value(request_kind="stream") == before + 1
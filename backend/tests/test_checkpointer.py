@@ -0,0 +1,43 @@
+"""Checkpoints reloaded from SQLite count toward the byte bound like freshly written ones."""
+
+from __future__ import annotations
+
+import uuid
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from orchestrator.checkpointer import BoundedCheckpointer
+
+
+def _put(saver: BoundedCheckpointer, thread_id: str, text: str) -> None:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"question": text}
+    saver.put({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}, checkpoint, {}, {})
+
+
+def test_reloaded_checkpoints_are_sized():
+    thread_id = uuid.uuid4().hex
+    writer = BoundedCheckpointer(persistent=True)
+    _put(writer, thread_id, "x" * 2000)
+    written = writer.stats()["bytes"]
+    assert written > 2000
+
+    # A restarted worker only knows the thread from the store
+    reader = BoundedCheckpointer(persistent=True)
+    assert reader.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+    assert reader.stats()["bytes"] == written
+
+
+def test_reloaded_checkpoints_are_evicted_by_size():
+    threads = [uuid.uuid4().hex for _ in range(3)]
+    writer = BoundedCheckpointer(persistent=True)
+    for thread_id in threads:
+        _put(writer, thread_id, "x" * 2000)
+    size = writer.stats()["bytes"] // len(threads)
+
+    reader = BoundedCheckpointer(persistent=True, max_bytes=size * 2)
+    for thread_id in threads:
+        reader.get_tuple({"configurable": {"thread_id": thread_id}})
+    stats = reader.stats()
+    assert stats["threads"] == 2
+    assert stats["bytes"] <= reader.max_bytes
@@ -0,0 +1,67 @@
+"""Digest matching, folding new inserts above the mark, and rebuilding on a period rollover."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.digest import get_digest, match_digest_question
+
+NOW = datetime(2026, 10, 14, 15, 0)
+
+
+@pytest.mark.parametrize("question, period", [
+    ("What updates do I have today?", "today"),
+    ("anything new this week", "this_week"),
+    ("catch me up on today", "today"),
+    ("summarize my inbox this week", "this_week"),
+    # Anything beyond filler needs the real pipeline
+    ("what updates from alice today", None),
+    ("what happened about the budget this week", None),
+    ("what updates do I have", None),
+    ("emails today", None),
+])
+def test_match_digest_question(question, period):
+    assert match_digest_question(question) == period
+
+
+def test_folds_only_inserts_above_the_mark(account, add_messages):
+    add_messages(account, {"date": NOW - timedelta(hours=2)}, {"date": NOW - timedelta(days=2)})
+    first = get_digest(account, "today", now=NOW)
+    assert first.message_count == 1
+
+    # A new in-window insert is folded in; one dated before the window is passed over
+    add_messages(account, {"date": NOW - timedelta(hours=1), "thread_id": "fresh"}, {"date": NOW - timedelta(days=3)})
+    second = get_digest(account, "today", now=NOW)
+    assert second.message_count == 2
+    assert second.items[0]["thread_id"] == "fresh"
+
+    # Nothing above the mark: the stored row is served as is
+    assert get_digest(account, "today", now=NOW).text == second.text
+
+
+def test_rollover_rebuilds_from_the_window(account, add_messages):
+    add_messages(account, {"date": NOW - timedelta(hours=2)}, {"date": NOW - timedelta(hours=1)})
+    assert get_digest(account, "today", now=NOW).message_count == 2
+
+    # Next day: yesterday's mail drops out even though no row was inserted above the mark
+    tomorrow = NOW + timedelta(days=1)
+    rolled = get_digest(account, "today", now=tomorrow)
+    assert rolled.period_start == datetime(2026, 10, 15)
+    assert rolled.message_count == 0
+    assert rolled.text == "No new emails today."
+
+    # Same week, so the weekly digest keeps both
+    assert get_digest(account, "this_week", now=tomorrow).message_count == 2
+
+
+def test_rollover_counts_mail_below_the_mark(account, add_messages):
+    tomorrow = NOW + timedelta(days=1)
+    # Already folded (and below the mark) by the time the day rolls over, so only a rebuild finds it
+    add_messages(account, {"date": NOW - timedelta(hours=1)}, {"date": tomorrow - timedelta(hours=1), "unread": True})
+    assert get_digest(account, "today", now=NOW).message_count == 2
+
+    rolled = get_digest(account, "today", now=tomorrow)
+    assert rolled.message_count == 1
+    assert rolled.unread_count == 1
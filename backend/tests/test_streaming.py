@@ -0,0 +1,80 @@
+"""Token frame batching and single-flight joining of identical chat turns."""
+
+from __future__ import annotations
+
+import asyncio
+
+from orchestrator.coalescing import RequestCoalescer
+from orchestrator.streaming import TokenStream
+
+
+async def _collect(stream: TokenStream):
+    return [frame async for frame in stream.frames()]
+
+
+def test_frames_batch_tokens_around_events():
+    async def scenario():
+        stream = TokenStream(frame_ms=10_000, frame_chars=6)
+        for delta in ["Hi", "", " th", "ere", ", how", " are", " you"]:
+            stream.push_token(delta)
+        stream.push_event("sources", ["m1"])
+        stream.push_token("?")
+        stream.close()
+        return await _collect(stream)
+
+    assert asyncio.run(scenario()) == [
+        ("token", "Hi"),  # the first token is never held back
+        ("token", " there"),  # flushed on reaching frame_chars
+        ("token", ", how are"),
+        ("token", " you"),  # flushed before the event, keeping order
+        ("sources", ["m1"]),
+        ("token", "?"),
+    ]
+
+
+def test_partial_frame_flushes_after_frame_ms():
+    async def scenario():
+        stream = TokenStream(frame_ms=20, frame_chars=1000)
+        stream.push_token("a")
+        stream.push_token("b")
+        frames = stream.frames()
+        first = await frames.__anext__()
+        second = await asyncio.wait_for(frames.__anext__(), 1.0)
+        stream.close()
+        rest = [frame async for frame in frames]
+        return [first, second] + rest
+
+    assert asyncio.run(scenario()) == [("token", "a"), ("token", "b")]
+
+
+def test_identical_turns_share_one_run():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        release = asyncio.Event()
+        key = coalescer.key(1, "What's new?", 6, 0.0, 500)
+
+        async def run(flight):
+            flight.push_token("hello")
+            await release.wait()
+            return {"answer": "hello"}
+
+        assert coalescer.join_running(key) is None
+        first, started = coalescer.join(key, run)
+        await asyncio.sleep(0)
+        second = coalescer.join_running(coalescer.key(1, "  WHAT'S new ", 6, 0.0, 500))
+        assert started and second is first
+        # A late joiner replays what was already streamed
+        replay = second.subscribe(frame_ms=10, frame_chars=64)
+        release.set()
+        results = await asyncio.gather(first.wait(), second.wait())
+        frames = await _collect(replay)
+        coalescer.leave(first)
+        coalescer.leave(second)
+        # Finished flights are forgotten; a repeat starts a new run
+        assert coalescer.join_running(key) is None
+        return results, frames, coalescer.stats()
+
+    results, frames, stats = asyncio.run(scenario())
+    assert results == [{"answer": "hello"}, {"answer": "hello"}]
+    assert frames == [("token", "hello")]
+    assert stats["executions"] == 1 and stats["coalesced"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,67 @@
+"""Structured query parsing (what is taken, what falls through to retrieval) and execution."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.structured_query import StructuredQuery, parse_question, run_structured_query
+
+NOW = datetime(2026, 10, 14, 15, 0)  # a Wednesday
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How many emails did I get from stripe.com this week?", dict(
+        kind="count", sender="stripe.com", period="this week", since=datetime(2026, 10, 12),
+    )),
+    ("list unread threads from Alice", dict(kind="list", target="threads", sender="alice", unread=True)),
+    ("who emailed me most today", dict(kind="top_senders", period="today", since=datetime(2026, 10, 14))),
+    ("emails with attachments from bob@example.com yesterday", dict(
+        kind="list", sender="bob@example.com", has_attachments=True,
+        since=datetime(2026, 10, 13), until=datetime(2026, 10, 14),
+    )),
+    ("show the last 5 emails", dict(kind="list", limit=5)),
+    ("how many unread emails in the last 3 days", dict(kind="count", unread=True, since=NOW - timedelta(days=3))),
+    ("count messages last month", dict(kind="count", since=datetime(2026, 9, 1), until=datetime(2026, 10, 1))),
+    # "New" mail is unread mail, not just the latest
+    ("any new emails", dict(kind="list", unread=True)),
+])
+def test_parses(question, expected):
+    query = parse_question(question, NOW)
+    assert query is not None
+    for field, value in expected.items():
+        assert getattr(query, field) == value, field
+
+
+@pytest.mark.parametrize("question", [
+    "what did alice say about the budget",
+    "emails about the budget",
+    "summarize my inbox",
+    "hello",
+    "",
+    # A from-clause that names no sender must not be dropped (it would widen the answer)
+    "list threads from me",
+    "how many emails from anyone",
+])
+def test_falls_through_to_retrieval(question):
+    assert parse_question(question, NOW) is None
+
+
+def test_top_senders_total_counts_every_sender(account, add_messages):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(minutes=1)
+    senders = ["a@x.com"] * 3 + ["b@x.com"] * 2 + ["c@x.com"]
+    add_messages(account, *({"from_addr": s, "date": today} for s in senders))
+
+    result = run_structured_query(account, StructuredQuery(kind="top_senders", limit=2))
+    assert result.rows == 2
+    assert result.total == len(senders)
+    assert "a@x.com: 3 emails" in result.answer
+
+
+def test_new_means_unread(account, add_messages):
+    add_messages(account, {"unread": True}, {"unread": False}, {"unread": False})
+
+    result = run_structured_query(account, parse_question("any new emails"))
+    assert result.total == 1
+    assert result.answer.startswith("1 unread email")
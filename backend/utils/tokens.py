@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str = "gpt-4") -> tiktoken.Encoding:
+    """Tokenizer for `model`, loaded once per process"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    if not text:
+        return 0
+    return len(get_encoding(model).encode_ordinary(text))
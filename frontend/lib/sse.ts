@@ -9,6 +9,7 @@ export interface SSEEvent {
     sources?: ChatSource[];
     token?: string;
     error?: string;
+    metadata?: Record<string, unknown>;
   };
 }
 